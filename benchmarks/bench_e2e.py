@@ -0,0 +1,315 @@
+"""
+Сквозной бенчмарк: настоящий Dispatcher со всеми роутерами из bot.py против
+локальных заглушек Telegram Bot API и OpenWeather (benchmarks/fakes.py).
+
+Пользователи проходят сценарии параллельно, каждый — по шагам, как живой человек:
+    registration — /start, имя, пол, возраст, статус, геолокация, подтверждение;
+    help         — /help и переходы по разделам справки;
+    weather      — /weather, «шторм» нажатий кнопок прогноза, город текстом, /now, /tomorrow, /hourly.
+
+Итог: апдейтов в секунду, p50/p95/p99 времени обработки апдейта, таблица
+обработчиков и количество вызовов внешних API. Сеть не нужна — подходит для CI.
+
+Запуск из корня репозитория:
+    python -m benchmarks.bench_e2e --users 300 --concurrency 64 \\
+        --ow-latency 0.05 --ow-error-rate 0.02 --tg-latency 0.01 --max-p95-ms 500
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+from collections import Counter
+from pathlib import Path
+from typing import Any, Callable, Dict, List
+
+from .fake_telegram import make_message_update, make_callback_update, make_location_update, percentile
+from .fakes import FAKE_TOKEN, FakeBotAPI, FakeOpenWeather, use_fake_config
+
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+
+# Справочник городов в формате GeoNames: регистрация рядом с ними не ходит в геокодер API
+GAZETTEER = [
+    (524901, "Moscow", "Moscow", "Москва", 55.75222, 37.61556, "RU", "48", 10381222, "Europe/Moscow"),
+    (498817, "Saint Petersburg", "Saint Petersburg", "Санкт-Петербург", 59.93863, 30.31413, "RU", "66", 5351935, "Europe/Moscow"),
+    (551487, "Kazan", "Kazan", "Казань", 55.78874, 49.12214, "RU", "73", 1104738, "Europe/Moscow"),
+    (1496747, "Novosibirsk", "Novosibirsk", "Новосибирск", 55.0415, 82.9346, "RU", "53", 1419007, "Asia/Novosibirsk"),
+    (1486209, "Yekaterinburg", "Yekaterinburg", "Екатеринбург", 56.8519, 60.6122, "RU", "71", 1349772, "Asia/Yekaterinburg"),
+]
+
+HELP_STEPS = ["help:weather", "help:back", "help:ai", "help:back", "help:planner", "help:back"]
+WEATHER_BUTTONS = ["weather:now", "weather:tomorrow", "weather:3_days", "weather:week"]
+
+Step = Callable[[int, int], Dict[str, Any]]  # (update_id, user_id) -> апдейт
+
+
+def write_gazetteer(path: str) -> None:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        for geoname_id, name, ascii_name, ru_name, lat, lon, country, admin1, population, tz in GAZETTEER:
+            columns = [str(geoname_id), name, ascii_name, f"{ru_name},{name}", str(lat), str(lon), "P", "PPLC",
+                       country, "", admin1, "", "", "", str(population), "", "", tz, "2024-01-01"]
+            f.write("\t".join(columns) + "\n")
+    # Русские названия — в alternateNamesV2 рядом со справочником
+    with open(os.path.join(os.path.dirname(path), "alternateNamesV2.txt"), "w", encoding="utf-8") as f:
+        for geoname_id, _, _, ru_name, *_ in GAZETTEER:
+            columns = [str(geoname_id), str(geoname_id), "ru", ru_name, "1", "", "", "", "", ""]
+            f.write("\t".join(columns) + "\n")
+
+
+def registration_steps(rnd: random.Random, remote_share: float) -> List[Step]:
+    if rnd.random() < remote_share:
+        # Точка вдали от справочника — город определит геокодер OpenWeather
+        lat, lon = rnd.uniform(-40, 40), rnd.uniform(-170, -120)
+    else:
+        _, _, _, _, lat, lon, *_ = rnd.choice(GAZETTEER)
+        lat, lon = lat + rnd.uniform(-0.05, 0.05), lon + rnd.uniform(-0.05, 0.05)
+    # Случайные ответы выбираем сразу: шаги выполняются вперемешку, а прогон должен быть повторяемым
+    gender = rnd.choice(["gender:m", "gender:f"])
+    age = str(rnd.randint(14, 70))
+    status = rnd.choice(["status:schoolboy", "status:student", "status:worker", "status:other"])
+    return [
+        lambda u, user: make_message_update(u, user, "/start"),
+        lambda u, user: make_message_update(u, user, f"Пользователь {user}"),
+        lambda u, user: make_callback_update(u, user, gender),
+        lambda u, user: make_message_update(u, user, age),
+        lambda u, user: make_callback_update(u, user, status),
+        lambda u, user: make_location_update(u, user, lat, lon),
+        lambda u, user: make_callback_update(u, user, "confirm:yes"),
+    ]
+
+
+def help_steps() -> List[Step]:
+    steps: List[Step] = [lambda u, user: make_message_update(u, user, "/help")]
+    steps += [lambda u, user, data=data: make_callback_update(u, user, data) for data in HELP_STEPS]
+    return steps
+
+
+def weather_steps(rnd: random.Random, storm: int) -> List[Step]:
+    city = rnd.choice(GAZETTEER)[3]
+    steps: List[Step] = [lambda u, user: make_message_update(u, user, "/weather")]
+    # Пользователь нетерпеливо жмёт кнопки прогноза несколько кругов подряд
+    buttons = [rnd.choice(WEATHER_BUTTONS) for _ in range(storm)]
+    steps += [lambda u, user, data=data: make_callback_update(u, user, data) for data in buttons]
+    steps.append(lambda u, user: make_message_update(u, user, f"/city {city}"))
+    steps += [lambda u, user, text=text: make_message_update(u, user, text) for text in ("/now", "/tomorrow", "/hourly")]
+    return steps
+
+
+def step_name(update: Dict[str, Any]) -> str:
+    """
+    Короткое описание апдейта для отчёта об ошибках: текст, данные кнопки или «location».
+    """
+    if "callback_query" in update:
+        return f"callback {update['callback_query']['data']}"
+    message = update["message"]
+    return f"message {message.get('text', 'location')}"
+
+
+def build_scenarios(args: argparse.Namespace) -> List[tuple]:
+    """
+    :return: [(сценарий, id пользователя, шаги)] — повторяемо при одном и том же --seed.
+    """
+    rnd = random.Random(args.seed)
+    scenarios = []
+    for i in range(args.users):
+        user_id = 100_000 + i
+        roll = rnd.random()
+        if roll < args.registration_share:
+            scenarios.append(("registration", user_id, registration_steps(rnd, args.remote_share)))
+        elif roll < args.registration_share + args.help_share:
+            scenarios.append(("help", user_id, help_steps()))
+        else:
+            scenarios.append(("weather", user_id, weather_steps(rnd, args.storm)))
+    return scenarios
+
+
+def prepare_environment(args: argparse.Namespace, workdir: str) -> None:
+    """
+    Рабочая папка и переменные окружения — до первого импорта модулей бота:
+    они читают настройки и пути (data/, logs/) при импорте.
+    """
+    os.chdir(workdir)
+    if str(REPO_ROOT) not in sys.path:
+        sys.path.insert(0, str(REPO_ROOT))
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+    os.environ["METRICS_PORT"] = "0"
+    os.environ["BOT_WORKERS"] = "1"
+    os.environ["OPENWEATHER_CALLS_PER_MINUTE"] = str(args.ow_calls_per_minute)
+    os.environ["OPENWEATHER_BURST"] = str(max(10.0, args.ow_calls_per_minute / 60))
+    write_gazetteer(os.path.join(workdir, "data", "cities15000.txt"))
+    use_fake_config()
+
+
+async def run(args: argparse.Namespace) -> dict:
+    from aiogram import Bot
+    from aiogram.client.session.aiohttp import AiohttpSession
+    from aiogram.client.telegram import TelegramAPIServer
+
+    import bot as bot_module
+    import services.get_geo
+    from middlewares.flood_control import edit_dedup, flood_control
+    from modules.weather.main import weather_service, weather_messages
+    from utils.metrics import metrics
+
+    telegram = FakeBotAPI(latency=args.tg_latency, error_rate=args.tg_error_rate, seed=args.seed)
+    openweather = FakeOpenWeather(latency=args.ow_latency, error_rate=args.ow_error_rate, seed=args.seed,
+                                  retry_after=args.ow_retry_after)
+    await telegram.start()
+    await openweather.start()
+    weather_service.base_url = f"{openweather.url}/data/2.5"
+    services.get_geo.URL = f"{openweather.url}/geo/1.0/reverse"
+
+    bot = Bot(token=FAKE_TOKEN, session=AiohttpSession(api=TelegramAPIServer.from_base(telegram.url)))
+    dp = bot_module.create_dispatcher()
+    await dp.emit_startup(bot=bot, dispatcher=dp, background_jobs=False)
+    if not args.verbose:
+        # Ошибки обработки считаем сами, трассировка на каждый апдейт только мешает
+        logging.getLogger("aiogram.event").setLevel(logging.CRITICAL)
+
+    scenarios = build_scenarios(args)
+    # /city, /now и т. п. работают только для зарегистрированных: участники сценария погоды
+    # уже прошли регистрацию, но город не указали
+    from services.user_registry import user_registry
+    for name, user_id, _ in scenarios:
+        if name == "weather":
+            user_registry.upsert(user_id, {
+                "id": user_id,
+                "name": f"Пользователь {user_id}",
+                "age": 30,
+                "gender": "",
+                "city": None,
+                "location": {"lat": None, "lon": None},
+                "status": "",
+                "preferences": {"notifications": False, "language": "ru", "timezone": ""},
+            })
+    update_ids = itertools.count(1)
+    # Не больше concurrency апдейтов в обработке одновременно — как пул воркеров вебхука
+    semaphore = asyncio.Semaphore(args.concurrency)
+    latencies: List[float] = []
+    failures: Counter = Counter()
+    failure_examples: Dict[str, str] = {}
+    by_scenario: Counter = Counter()
+
+    async def play(name: str, user_id: int, steps: List[Step]) -> None:
+        for step in steps:
+            update = step(next(update_ids), user_id)
+            async with semaphore:
+                started = time.perf_counter()
+                try:
+                    await dp.feed_raw_update(bot, update)
+                except Exception as e:
+                    failures[type(e).__name__] += 1
+                    failure_examples.setdefault(type(e).__name__, f"{step_name(update)}: {str(e).splitlines()[0][:200]}")
+                latencies.append(time.perf_counter() - started)
+            by_scenario[name] += 1
+
+    started = time.perf_counter()
+    try:
+        await asyncio.gather(*(play(*scenario) for scenario in scenarios))
+        elapsed = time.perf_counter() - started
+    finally:
+        await dp.emit_shutdown(bot=bot, dispatcher=dp)
+        await bot.session.close()
+        await telegram.stop()
+        await openweather.stop()
+
+    return {
+        "updates": len(latencies),
+        "elapsed": elapsed,
+        "rate": len(latencies) / elapsed if elapsed else 0.0,
+        "p50_ms": percentile(latencies, 0.50) * 1000,
+        "p95_ms": percentile(latencies, 0.95) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+        "failures": dict(failures),
+        "failure_examples": failure_examples,
+        "scenarios": dict(by_scenario),
+        "handlers": metrics.snapshot("bot_handler_duration_seconds"),
+        "telegram_calls": dict(telegram.calls),
+        "telegram_errors": dict(telegram.errors),
+        "openweather_calls": dict(openweather.calls),
+        "openweather_errors": dict(openweather.errors),
+        "weather_cache": weather_service.cache_stats(),
+        "rendered": weather_messages.stats(),
+        "flood": {**flood_control.stats(), "edits_skipped": edit_dedup.stats()["skipped"]},
+    }
+
+
+def print_report(result: dict) -> None:
+    print(f"Апдейтов: {result['updates']} за {result['elapsed']:.2f} с ({result['rate']:.0f}/с)")
+    print(f"Время апдейта: p50 {result['p50_ms']:.1f} мс, p95 {result['p95_ms']:.1f} мс, p99 {result['p99_ms']:.1f} мс")
+    print(f"Сценарии (апдейтов): {result['scenarios']}")
+    print(f"Ошибки обработки: {result['failures'] or 'нет'}")
+    for name, example in result["failure_examples"].items():
+        print(f"  {name}: {example}")
+    print("\nОбработчики:")
+    for row in result["handlers"]:
+        print(f"  {row['handler']:<58} {row['outcome']:<6} {row['count']:>6} шт.  "
+              f"ср. {row['avg'] * 1000:7.1f} мс  p95 ≤ {row['p95'] * 1000:.0f} мс")
+    print(f"\nTelegram Bot API: {result['telegram_calls']}, ошибок {result['telegram_errors'] or 'нет'}")
+    print(f"OpenWeather: {result['openweather_calls']}, ошибок {result['openweather_errors'] or 'нет'}")
+    cache, rendered = result["weather_cache"], result["rendered"]
+    print(f"Кэш погоды: {cache['size']} записей, попаданий {cache['hit_ratio']:.0%}; "
+          f"готовые тексты: собрано {rendered['rendered']}, переиспользовано {rendered['reused']}")
+    flood = result["flood"]
+    print(f"Флуд-контроль: отброшено {flood['dropped']}, склеено нажатий {flood['coalesced']}, "
+          f"правок без изменений не отправлено {flood['edits_skipped']}")
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=300, help="Сколько пользователей одновременно")
+    parser.add_argument("--concurrency", type=int, default=64, help="Апдейтов в обработке одновременно")
+    parser.add_argument("--registration-share", type=float, default=0.3, help="Доля пользователей, проходящих регистрацию")
+    parser.add_argument("--help-share", type=float, default=0.2, help="Доля пользователей, листающих справку")
+    parser.add_argument("--remote-share", type=float, default=0.3,
+                        help="Доля регистраций вдали от справочника городов (идут в геокодер API)")
+    parser.add_argument("--storm", type=int, default=8, help="Нажатий кнопок прогноза на пользователя")
+    parser.add_argument("--tg-latency", type=float, default=0.0, help="Задержка Telegram Bot API, с")
+    parser.add_argument("--tg-error-rate", type=float, default=0.0, help="Доля ошибок Telegram Bot API")
+    parser.add_argument("--ow-latency", type=float, default=0.02, help="Задержка OpenWeather, с")
+    parser.add_argument("--ow-error-rate", type=float, default=0.0, help="Доля ошибок OpenWeather (429/502)")
+    parser.add_argument("--ow-retry-after", type=float, default=1.0, help="Retry-After в ответах 429, с")
+    parser.add_argument("--ow-calls-per-minute", type=float, default=1_000_000,
+                        help="Лимит запросов к OpenWeather (по умолчанию фактически без лимита)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--verbose", action="store_true", help="Печатать трассировку каждой ошибки обработки")
+    parser.add_argument("--json", help="Сохранить результат в JSON-файл")
+    parser.add_argument("--max-p95-ms", type=float, help="Порог p95 времени апдейта: выше — код выхода 1")
+    parser.add_argument("--min-rate", type=float, help="Минимум апдейтов в секунду: ниже — код выхода 1")
+    args = parser.parse_args()
+    json_path = os.path.abspath(args.json) if args.json else None
+
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory(prefix="bench_e2e_") as workdir:
+        try:
+            prepare_environment(args, workdir)
+            result = asyncio.run(run(args))
+        finally:
+            os.chdir(cwd)
+
+    print_report(result)
+    if json_path:
+        with open(json_path, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2, default=str)
+
+    failed = []
+    if args.max_p95_ms is not None and result["p95_ms"] > args.max_p95_ms:
+        failed.append(f"p95 {result['p95_ms']:.1f} мс > {args.max_p95_ms} мс")
+    if args.min_rate is not None and result["rate"] < args.min_rate:
+        failed.append(f"{result['rate']:.0f} апдейтов/с < {args.min_rate}")
+    if failed:
+        print("\n❌ Порог не пройден: " + "; ".join(failed))
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
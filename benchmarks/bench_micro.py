@@ -0,0 +1,540 @@
+"""
+Микробенчмарки горячих мест: форматтеры прогноза, JSON-файл пользователей,
+клиенты погоды и геокодера на локальной заглушке OpenWeather (в том числе
+пакетный запрос погоды для многих ячеек), выбор
+обработчика нажатия кнопки (цепочка фильтров против индекса префиксов).
+
+Для каждого случая — время одной операции (медиана и минимум по повторам)
+и память по tracemalloc: пик за одну операцию и сколько осталось занято после неё.
+
+Базовые значения сохраняются в JSON, режим сравнения падает (код выхода 1),
+если случай стал медленнее базы больше чем на --threshold. Сравнивается
+лучший из повторов, а не медиана, и не только абсолютное время, но и время в
+единицах калибровочного цикла (фиксированная работа на чистом Python,
+замеряется вперемешку с повторами того же случая): скорость общей машины
+плавает минутами, а с базой с другой машины абсолютное время вообще
+несравнимо. На той же машине регрессия — когда за порог вышли обе оценки,
+на другой — только калиброванная. Случаи, вышедшие за порог, перемеряются
+после остальных ещё до --retries раз.
+Случай, который всё равно вышел за порог, перемеряется ещё до --retries раз.
+
+Запуск из корня репозитория:
+    python -m benchmarks.bench_micro                      # прогон и таблица
+    python -m benchmarks.bench_micro --save               # сохранить базу
+    python -m benchmarks.bench_micro --compare            # сравнить с базой
+    python -m benchmarks.bench_micro --filter formatter   # только часть случаев
+    python -m benchmarks.bench_micro --large              # плюс файл на 1 000 000 пользователей
+"""
+
+import argparse
+import asyncio
+import gc
+import inspect
+import itertools
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Union
+
+from .fake_telegram import make_callback_update
+from .fakes import FAKE_TOKEN, FakeOpenWeather, make_forecast_payload, make_weather_payload, use_fake_config
+
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+BASELINE_PATH = Path(__file__).resolve().parent / "baselines" / "micro.json"
+
+# Размеры файла пользователей; 1 000 000 — только с --large (сотни мегабайт на диске)
+USER_COUNTS = (10_000, 100_000)
+LARGE_USER_COUNTS = (1_000_000,)
+
+# Пакетный запрос погоды: города в разных ячейках сетки {id: (широта, долгота)}
+BATCH_CITIES = {1_000_000 + i: (round(40.05 + (i // 10) * 0.3, 2), round(30.05 + (i % 10) * 0.3, 2)) for i in range(100)}
+
+# Роутеры с кнопками: сколько их и по скольку обработчиков в каждом
+CALLBACK_ROUTERS = (1, 10, 50)
+CALLBACK_HANDLERS = 10
+
+# Минимальная длительность одного повтора: короткие операции крутим в цикле
+MIN_REPEAT_TIME = 0.2
+
+# Калибровочный цикл: сколько строк обработать (порядка 20 мс)
+CALIBRATION_ROWS = 8_000
+
+Operation = Callable[[], Union[Any, Awaitable[Any]]]
+
+
+@dataclass
+class Case:
+    """
+    Случай бенчмарка. build готовит данные (может быть async) и возвращает операцию без аргументов.
+    number — сколько раз выполнить операцию за повтор (None — подобрать автоматически).
+    """
+    name: str
+    build: Callable[[], Union[Operation, Awaitable[Operation]]]
+    number: Optional[int] = None
+    repeat: Optional[int] = None
+    large: bool = False
+
+
+# ================= Данные ================= #
+
+def make_user(user_id: int) -> Dict[str, Any]:
+    """
+    Запись пользователя в том виде, в каком её сохраняет регистрация (handlers/start.py).
+    """
+    return {
+        "id": user_id,
+        "name": f"Пользователь {user_id}",
+        "age": 18 + user_id % 50,
+        "gender": "Мужской" if user_id % 2 else "Женский",
+        "city": "Москва",
+        "location": {"lat": 55.75 + (user_id % 100) / 1000, "lon": 37.61 + (user_id % 100) / 1000},
+        "status": "Студент",
+        "preferences": {"notifications": True, "language": "ru", "timezone": "Europe/Moscow"},
+    }
+
+
+def make_users(count: int) -> Dict[str, Dict[str, Any]]:
+    return {str(user_id): make_user(user_id) for user_id in range(1, count + 1)}
+
+
+# ================= Случаи ================= #
+
+def formatter_cases() -> List[Case]:
+    from modules.weather import formatter
+    from modules.weather.forecast_model import ForecastSeries
+    from modules.weather.models import CurrentWeather, Forecast
+    from utils.text_formatter import format_weather
+
+    weather = make_weather_payload()
+    forecast = make_forecast_payload(40)
+    # Форматтеры принимают сырой ответ, модель и уже разобранный ряд (так их вызывает rendered.py)
+    forecast_inputs = {
+        "dict": forecast,
+        "model": Forecast.from_payload(forecast),
+        "series": ForecastSeries.from_response(forecast),
+    }
+
+    cases = [
+        Case("formatter.format_current_weather[dict]", lambda: lambda: formatter.format_current_weather(weather)),
+        Case("formatter.format_current_weather[model]",
+             lambda: lambda model=CurrentWeather.from_payload(weather): formatter.format_current_weather(model)),
+        Case("text_formatter.format_weather", lambda: lambda: format_weather(weather)),
+    ]
+    for func in (formatter.format_forecast, formatter.format_weekly_forecast,
+                 formatter.format_tomorrow_weather, formatter.format_daily_digest):
+        for kind, data in forecast_inputs.items():
+            cases.append(Case(f"formatter.{func.__name__}[{kind}]",
+                              lambda func=func, data=data: lambda: func(data)))
+    return cases
+
+
+def user_file_cases(workdir: str, counts) -> List[Case]:
+    from services.user_store import load_users, save_users
+
+    cases = []
+    for count in counts:
+        path = os.path.join(workdir, f"users_{count}.json")
+        large = count in LARGE_USER_COUNTS
+
+        def build_save(count=count, path=path):
+            users = make_users(count)
+            return lambda: save_users(users, path)
+
+        def build_load(count=count, path=path):
+            if not os.path.exists(path):
+                save_users(make_users(count), path)
+            return lambda: load_users(path)
+
+        # Одна операция на больших файлах — секунды, хватает одного прогона на повтор
+        cases.append(Case(f"user_store.save_users[{count}]", build_save, number=1, repeat=3, large=large))
+        cases.append(Case(f"user_store.load_users[{count}]", build_load, number=1, repeat=3, large=large))
+    return cases
+
+
+class Upstream:
+    """
+    Заглушка OpenWeather, поднимается один раз на все сетевые случаи.
+    """
+
+    def __init__(self):
+        self.server: Optional[FakeOpenWeather] = None
+
+    async def url(self) -> str:
+        if self.server is None:
+            from services.http_client import http_client
+
+            self.server = FakeOpenWeather(cities=BATCH_CITIES)
+            await self.server.start()
+            await http_client.start()
+        return self.server.url
+
+    async def close(self) -> None:
+        if self.server is not None:
+            from services.http_client import http_client
+
+            await http_client.close()
+            await self.server.stop()
+
+
+def client_cases(upstream: Upstream) -> List[Case]:
+    from modules.weather.get_weather import WeatherService
+    from services.geo_index import Place, ReverseGeocoder
+    from utils.cache import TTLCache
+    from utils.rate_limiter import PriorityRateLimiter
+
+    async def service(cache_size: int, geocoder: Optional[ReverseGeocoder] = None) -> WeatherService:
+        # Свой лимит без ограничений: меряем клиента, а не тариф OpenWeather
+        return WeatherService("bench", base_url=f"{await upstream.url()}/data/2.5",
+                              cache=TTLCache(max_size=cache_size),
+                              limiter=PriorityRateLimiter(rate=1e9, capacity=1e9),
+                              geocoder=geocoder or ReverseGeocoder())
+
+    async def build_miss(method: str):
+        # Кэш на одну запись и две точки по очереди: каждый вызов — настоящий HTTP-запрос
+        weather = await service(cache_size=1)
+        points = itertools.cycle([(55.75, 37.62), (59.94, 30.31)])
+        return lambda: getattr(weather, method)(*next(points))
+
+    async def build_hit(method: str):
+        weather = await service(cache_size=100)
+        await getattr(weather, method)(55.75, 37.62)
+        return lambda: getattr(weather, method)(55.75, 37.62)
+
+    async def build_batch(group: bool):
+        # Без справочника городов — каждая ячейка отдельным запросом, с ним — пачками через /group
+        geocoder = ReverseGeocoder()
+        if group:
+            for city_id, (lat, lon) in BATCH_CITIES.items():
+                geocoder.add(Place(city_id, str(city_id), str(city_id), str(city_id), None, "RU", lat, lon, 0, None))
+        weather = await service(cache_size=1000, geocoder=geocoder)
+        points = list(BATCH_CITIES.values())
+
+        async def drain():
+            return [item async for item in weather.fetch_many("weather", points, refresh=True)]
+        return drain
+
+    async def build_geo():
+        import services.get_geo
+
+        services.get_geo.URL = f"{await upstream.url()}/geo/1.0/reverse"
+        return lambda: services.get_geo.get_location_from_coords_async(55.75, 37.62)
+
+    return [
+        Case("weather.get_current_weather[miss]", lambda: build_miss("get_current_weather")),
+        Case("weather.get_current_weather[hit]", lambda: build_hit("get_current_weather")),
+        Case("weather.get_forecast[miss]", lambda: build_miss("get_forecast")),
+        Case("weather.get_forecast_series[hit]", lambda: build_hit("get_forecast_series")),
+        Case(f"weather.fetch_many[{len(BATCH_CITIES)},fan-out]", lambda: build_batch(group=False)),
+        Case(f"weather.fetch_many[{len(BATCH_CITIES)},group]", lambda: build_batch(group=True)),
+        Case("geo.get_location_from_coords_async", build_geo),
+    ]
+
+
+def callback_cases() -> List[Case]:
+    from aiogram import Bot, Dispatcher, F, Router
+    from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+    from aiogram.filters.callback_data import CallbackData
+    from aiogram.types import Update
+
+    from services.callback_router import CallbackRouter, setup_callback_index
+
+    class Offline(BaseRequestMiddleware):
+        # Ответ на отклонённое нажатие не уходит в сеть: меряем только выбор обработчика
+        async def __call__(self, make_request, bot, method):
+            return True
+
+    async def handler(callback, callback_data=None):
+        return None
+
+    def data_class(prefix: str):
+        # Как HelpTopic/WeatherView: префикс роутера и одно поле
+        return type(f"Data_{prefix}", (CallbackData,), {"__annotations__": {"action": str}}, prefix=prefix)
+
+    def chain(routers: int) -> Dispatcher:
+        # Как было: у каждого обработчика свой фильтр по строке, роутеры перебираются по очереди
+        dp = Dispatcher()
+        for r in range(routers):
+            router = Router()
+            for h in range(CALLBACK_HANDLERS):
+                router.callback_query.register(handler, F.data.startswith(f"r{r}_a{h}"))
+            dp.include_router(router)
+        return dp
+
+    def indexed(routers: int) -> Dispatcher:
+        dp = Dispatcher()
+        setup_callback_index(dp)
+        for r in range(routers):
+            router = CallbackRouter()
+            data = data_class(f"r{r}")
+            for h in range(CALLBACK_HANDLERS):
+                router.callback_query.register(handler, data.filter(F.action == f"a{h}"))
+            dp.include_router(router)
+        return dp
+
+    def build(make_dispatcher: Callable[[int], Dispatcher], routers: int, data: str):
+        bot = Bot(FAKE_TOKEN)
+        bot.session.middleware(Offline())
+        dp = make_dispatcher(routers)
+        update = Update.model_validate(make_callback_update(1, 10_000, data), context={"bot": bot})
+        return lambda: dp.feed_update(bot, update)
+
+    cases = []
+    for routers in CALLBACK_ROUTERS:
+        last = routers - 1
+        # Худший случай для цепочки: последний обработчик последнего роутера
+        cases.append(Case(f"callbacks.filter_chain[routers={routers},last]",
+                          lambda routers=routers, last=last:
+                          build(chain, routers, f"r{last}_a{CALLBACK_HANDLERS - 1}")))
+        cases.append(Case(f"callbacks.indexed[routers={routers},last]",
+                          lambda routers=routers, last=last:
+                          build(indexed, routers, f"r{last}:a{CALLBACK_HANDLERS - 1}")))
+    # Мусорные данные: цепочка проверяет все фильтры всех роутеров, индекс отклоняет сразу
+    routers = CALLBACK_ROUTERS[-1]
+    cases.append(Case(f"callbacks.filter_chain[routers={routers},malformed]",
+                      lambda: build(chain, routers, "r0_" + "x" * 100)))
+    cases.append(Case(f"callbacks.indexed[routers={routers},malformed]",
+                      lambda: build(indexed, routers, "r0:" + "x" * 100)))
+    return cases
+
+
+# ================= Замеры ================= #
+
+async def _call(operation: Operation) -> Any:
+    result = operation()
+    if inspect.isawaitable(result):
+        result = await result
+    return result
+
+
+async def _timed(operation: Operation, number: int) -> float:
+    started = time.perf_counter()
+    for _ in range(number):
+        await _call(operation)
+    return time.perf_counter() - started
+
+
+def _calibration_work() -> None:
+    # Работа бота в миниатюре: много мелких словарей, сортировка, форматирование строк.
+    # Объём данных больше кэша процессора — цикл замедляется от соседей по машине так же, как случаи
+    rows = [{"id": i, "name": f"user{i}", "lat": i * 0.001} for i in range(CALIBRATION_ROWS)]
+    rows.sort(key=lambda row: (row["id"] % 97, row["name"]))
+    "".join(f"{row['name']}:{row['lat']:.2f};" for row in rows)
+
+
+def calibrate() -> float:
+    """
+    Время калибровочного цикла — «единица скорости» машины прямо сейчас.
+    """
+    started = time.perf_counter()
+    _calibration_work()
+    return time.perf_counter() - started
+
+
+async def measure(case: Case, repeat: int) -> Dict[str, float]:
+    operation = case.build()
+    if inspect.isawaitable(operation):
+        operation = await operation
+
+    # Прогрев и подбор числа вызовов, как в timeit.autorange
+    number = case.number
+    if number is None:
+        number = 1
+        while await _timed(operation, number) < MIN_REPEAT_TIME:
+            number *= 2
+    await _call(operation)
+
+    # Скорость общей машины плавает: калибровка идёт до и после каждого повтора.
+    # Сборщик мусора на время замеров выключен, как в timeit: иначе время случая зависит
+    # от того, сколько объектов оставили в куче предыдущие случаи
+    gc.collect()
+    gc.disable()
+    try:
+        timings, calibrations = [], [calibrate()]
+        for _ in range(case.repeat or repeat):
+            timings.append(await _timed(operation, number) / number)
+            calibrations.append(calibrate())
+    finally:
+        gc.enable()
+
+    # Память меряем отдельно: под tracemalloc операции заметно медленнее
+    tracemalloc.start()
+    before, _ = tracemalloc.get_traced_memory()
+    tracemalloc.reset_peak()
+    result = await _call(operation)
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+
+    return {
+        "median": statistics.median(timings),
+        "min": min(timings),
+        # Лучшее время в калибровочных циклах: его и сравниваем с базой. У калибровки
+        # берём медиану — её редкие быстрые замеры шумят сильнее, чем медленные
+        "score": min(timings) / statistics.median(calibrations),
+        "host": platform.node(),
+        "number": number,
+        "peak_bytes": peak - before,
+        "retained_bytes": current - before,
+    }
+
+
+def _duration(seconds: float) -> str:
+    if seconds >= 1:
+        return f"{seconds:.2f} с"
+    if seconds >= 1e-3:
+        return f"{seconds * 1e3:.2f} мс"
+    return f"{seconds * 1e6:.1f} мкс"
+
+
+def _size(size: float) -> str:
+    if abs(size) >= 1024 * 1024:
+        return f"{size / 1024 / 1024:.1f} МиБ"
+    return f"{size / 1024:.1f} КиБ"
+
+
+# ================= Базы и сравнение ================= #
+
+def _regression(name: str, result: dict, base: dict, threshold: float, memory_threshold: float) -> List[str]:
+    regressions = []
+    raw = result["min"] / base["min"] if base["min"] else 1.0
+    if "score" not in base:
+        # База снята до калибровки — только абсолютное время
+        ratio, note = raw, ""
+    else:
+        calibrated = result["score"] / base["score"]
+        same_host = base.get("host") == result["host"]
+        ratio = min(raw, calibrated) if same_host else calibrated
+        note = f", с поправкой на калибровку {calibrated:.2f}x"
+    if ratio > 1 + threshold:
+        regressions.append(f"{name}: {_duration(base['min'])} → {_duration(result['min'])} ({raw:.2f}x{note})")
+    # Маленькие пики шумят от запуска к запуску — сравниваем от 64 КиБ
+    base_peak, peak = base.get("peak_bytes", 0), result["peak_bytes"]
+    if peak > 64 * 1024 and peak > base_peak * (1 + memory_threshold):
+        regressions.append(f"{name}: пик памяти {_size(base_peak)} → {_size(peak)}")
+    return regressions
+
+
+def compare(results: Dict[str, dict], baseline: Dict[str, dict], threshold: float, memory_threshold: float) -> List[str]:
+    """
+    :return: Список регрессий — случаи, ставшие медленнее или прожорливее базы сверх порога.
+    """
+    regressions = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if base is not None:
+            regressions += _regression(name, result, base, threshold, memory_threshold)
+    return regressions
+
+
+async def run(args: argparse.Namespace, workdir: str, baseline: Dict[str, dict]) -> Dict[str, dict]:
+    upstream = Upstream()
+    counts = USER_COUNTS + (LARGE_USER_COUNTS if args.large else ())
+    cases = formatter_cases() + user_file_cases(workdir, counts) + client_cases(upstream) + callback_cases()
+    selected = [case for case in cases
+                if (not args.filter or args.filter in case.name) and (args.large or not case.large)]
+    results = {}
+
+    def report(name: str, result: dict) -> None:
+        print(f"{name:<52} {_duration(result['median']):>11}  (мин. {_duration(result['min']):>11})  "
+              f"пик {_size(result['peak_bytes']):>10}  осталось {_size(result['retained_bytes']):>10}",
+              flush=True)
+
+    def suspects() -> List[Case]:
+        return [case for case in selected if case.name in baseline
+                and _regression(case.name, results[case.name], baseline[case.name], args.threshold, args.memory_threshold)]
+
+    try:
+        for case in selected:
+            results[case.name] = await measure(case, args.repeat)
+            report(case.name, results[case.name])
+
+        # Машина замедляется не на миг, а на десятки секунд: вышедшие за порог случаи
+        # перемеряем после всех остальных и берём лучшее из всех прогонов
+        for attempt in range(args.retries if args.compare else 0):
+            retry_cases = suspects()
+            if not retry_cases:
+                break
+            print(f"\nПеремер {attempt + 1}/{args.retries}: {len(retry_cases)} шт.", flush=True)
+            for case in retry_cases:
+                retry, result = await measure(case, args.repeat), results[case.name]
+                result["min"] = min(result["min"], retry["min"])
+                result["score"] = min(result["score"], retry["score"])
+                result["peak_bytes"] = min(result["peak_bytes"], retry["peak_bytes"])
+                report(case.name, result)
+    finally:
+        await upstream.close()
+    return results
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--filter", help="Только случаи, в имени которых есть эта подстрока")
+    parser.add_argument("--repeat", type=int, default=5, help="Повторов на случай (сравнивается лучший)")
+    parser.add_argument("--retries", type=int, default=3,
+                        help="Сколько раз перемерить случай, вышедший за порог, прежде чем считать его регрессией")
+    parser.add_argument("--large", action="store_true", help="Добавить файл на 1 000 000 пользователей")
+    parser.add_argument("--baseline", default=str(BASELINE_PATH), help="Файл с базовыми значениями")
+    parser.add_argument("--save", action="store_true", help="Сохранить результат как базу (дописывает случаи)")
+    parser.add_argument("--compare", action="store_true", help="Сравнить с базой и упасть при регрессии")
+    parser.add_argument("--threshold", type=float, default=0.25,
+                        help="Допустимое замедление относительно базы (0.25 — на 25%%)")
+    parser.add_argument("--memory-threshold", type=float, default=0.25,
+                        help="Допустимый рост пика памяти относительно базы")
+    args = parser.parse_args()
+    baseline_path = Path(args.baseline).resolve()
+    saved = json.loads(baseline_path.read_text(encoding="utf-8")) if baseline_path.exists() else {}
+
+    # Модули бота читают настройки при импорте: лимит OpenWeather снимаем, лишние логи глушим
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+    os.environ["OPENWEATHER_CALLS_PER_MINUTE"] = "1000000000"
+    os.environ["OPENWEATHER_BURST"] = "1000000000"
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory(prefix="bench_micro_") as workdir:
+        try:
+            os.chdir(workdir)
+            if str(REPO_ROOT) not in sys.path:
+                sys.path.insert(0, str(REPO_ROOT))
+            use_fake_config()
+            from utils import fast_json
+
+            print(f"Python {platform.python_version()}, JSON-парсер: {fast_json.BACKEND}\n")
+            results = asyncio.run(run(args, workdir, saved.get("results", {})))
+        finally:
+            os.chdir(cwd)
+
+    status = 0
+    if args.compare:
+        if not saved:
+            print(f"\nБаза {baseline_path} не найдена — сначала запустите с --save")
+            return 1
+        regressions = compare(results, saved.get("results", {}), args.threshold, args.memory_threshold)
+        if regressions:
+            print("\n❌ Регрессии относительно базы:\n  " + "\n  ".join(regressions))
+            status = 1
+        else:
+            print(f"\n✅ Регрессий нет (порог {args.threshold:.0%})")
+
+    if args.save:
+        baseline_path.parent.mkdir(parents=True, exist_ok=True)
+        saved = {
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            # Прогон с --filter обновляет только свои случаи
+            "results": {**saved.get("results", {}), **results},
+        }
+        baseline_path.write_text(json.dumps(saved, ensure_ascii=False, indent=2, sort_keys=True) + "\n",
+                                 encoding="utf-8")
+        print(f"\nБаза сохранена: {baseline_path}")
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
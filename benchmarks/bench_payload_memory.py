@@ -0,0 +1,53 @@
+"""
+Память и скорость разбора ответов OpenWeather: словари из JSON против моделей.
+
+Запуск: python -m benchmarks.bench_payload_memory [--count 1000]
+"""
+
+import argparse
+import json
+import time
+import tracemalloc
+
+from modules.weather.models import CurrentWeather, Forecast
+from utils import fast_json
+
+from .fakes import make_forecast_payload, make_weather_payload
+
+
+def measure(label: str, body: bytes, count: int, build) -> None:
+    """
+    Разбирает body count раз, держит результаты в памяти (как кэш) и печатает итог.
+    """
+    tracemalloc.start()
+    started = time.perf_counter()
+    kept = [build(body) for _ in range(count)]
+    elapsed = time.perf_counter() - started
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{label:<32} {elapsed / count * 1e6:>9.1f} мкс/ответ  "
+          f"{current / count / 1024:>8.1f} КиБ/ответ в кэше  пик {peak / 1024 / 1024:>7.1f} МиБ")
+    del kept
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--count", type=int, default=1000, help="Сколько ответов держать в памяти")
+    args = parser.parse_args()
+
+    print(f"JSON-парсер: {fast_json.BACKEND}, ответов: {args.count}\n")
+    for name, payload, model in (
+        ("forecast", make_forecast_payload(), Forecast),
+        ("weather", make_weather_payload(), CurrentWeather),
+    ):
+        body = json.dumps(payload, ensure_ascii=False).encode()
+        print(f"/{name}, {len(body)} байт:")
+        measure("  json.loads -> dict", body, args.count, json.loads)
+        measure(f"  {fast_json.BACKEND}.loads -> dict", body, args.count, fast_json.loads)
+        measure(f"  {fast_json.BACKEND}.loads -> {model.__name__}", body, args.count,
+                lambda b: model.from_payload(fast_json.loads(b)))
+        print()
+
+
+if __name__ == "__main__":
+    main()
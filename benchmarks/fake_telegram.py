@@ -0,0 +1,158 @@
+"""
+Локальный «Telegram» для проверки вебхука: отправляет пачки апдейтов на эндпоинт.
+
+Запуск (бот запущен с BOT_MODE=webhook):
+    python -m benchmarks.fake_telegram --url http://127.0.0.1:8080/webhook --secret <WEBHOOK_SECRET> \\
+        --updates 1000 --users 100 --concurrency 50
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import random
+import time
+from collections import Counter
+from typing import List, Dict, Any, Iterator
+
+import aiohttp
+
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+# Что пишут пользователи: команды и нажатия кнопок меню погоды
+TEXTS = ["/now", "/tomorrow", "/hourly", "/weather", "/help", "Москва", "Санкт-Петербург"]
+CALLBACKS = ["weather:now", "weather:tomorrow", "weather:3_days", "weather:week"]
+
+
+def _user(user_id: int) -> Dict[str, Any]:
+    return {"id": user_id, "is_bot": False, "first_name": f"user{user_id}", "language_code": "ru"}
+
+
+def make_message_update(update_id: int, user_id: int, text: str) -> Dict[str, Any]:
+    entities = [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}] if text.startswith("/") else None
+    message = {
+        "message_id": update_id,
+        "date": int(time.time()),
+        "chat": {"id": user_id, "type": "private", "first_name": f"user{user_id}"},
+        "from": _user(user_id),
+        "text": text,
+    }
+    if entities:
+        message["entities"] = entities
+    return {"update_id": update_id, "message": message}
+
+
+def make_location_update(update_id: int, user_id: int, lat: float, lon: float) -> Dict[str, Any]:
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": {"id": user_id, "type": "private", "first_name": f"user{user_id}"},
+            "from": _user(user_id),
+            "location": {"latitude": lat, "longitude": lon},
+        },
+    }
+
+
+def make_callback_update(update_id: int, user_id: int, data: str) -> Dict[str, Any]:
+    return {
+        "update_id": update_id,
+        "callback_query": {
+            "id": str(update_id),
+            "from": _user(user_id),
+            "chat_instance": str(user_id),
+            "data": data,
+            "message": {
+                "message_id": 1,
+                "date": int(time.time()),
+                "chat": {"id": user_id, "type": "private"},
+                "from": {"id": 1, "is_bot": True, "first_name": "bot"},
+                "text": "Выберите, какой прогноз погоды вы хотите получить:",
+            },
+        },
+    }
+
+
+def generate_updates(count: int, users: int, callback_share: float = 0.3, seed: int = 0) -> Iterator[Dict[str, Any]]:
+    """
+    Поток апдейтов от users пользователей: сообщения и нажатия кнопок вперемешку.
+    """
+    rnd = random.Random(seed)
+    for update_id in range(1, count + 1):
+        user_id = 10_000 + rnd.randrange(users)
+        if rnd.random() < callback_share:
+            yield make_callback_update(update_id, user_id, rnd.choice(CALLBACKS))
+        else:
+            yield make_message_update(update_id, user_id, rnd.choice(TEXTS))
+
+
+def percentile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+async def fire(url: str, secret: str, updates: List[Dict[str, Any]], concurrency: int) -> dict:
+    """
+    Отправляет апдейты на вебхук не более чем concurrency запросами одновременно.
+    :return: Коды ответов, время подтверждения (ack) и итоговая скорость.
+    """
+    headers = {SECRET_HEADER: secret} if secret else {}
+    statuses: Counter = Counter()
+    latencies: List[float] = []
+    bodies = iter([json.dumps(update, ensure_ascii=False).encode() for update in updates])
+
+    async with aiohttp.ClientSession(headers={"Content-Type": "application/json", **headers}) as session:
+        async def sender():
+            for body in bodies:
+                started = time.perf_counter()
+                try:
+                    async with session.post(url, data=body) as response:
+                        await response.read()
+                        statuses[response.status] += 1
+                except aiohttp.ClientError as e:
+                    statuses[type(e).__name__] += 1
+                latencies.append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(sender() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    return {
+        "statuses": dict(statuses),
+        "elapsed": elapsed,
+        "rate": len(updates) / elapsed if elapsed else 0.0,
+        "ack_p50_ms": percentile(latencies, 0.50) * 1000,
+        "ack_p95_ms": percentile(latencies, 0.95) * 1000,
+        "ack_p99_ms": percentile(latencies, 0.99) * 1000,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://127.0.0.1:8080/webhook")
+    parser.add_argument("--secret", default="")
+    parser.add_argument("--updates", type=int, default=1000, help="Сколько апдейтов отправить")
+    parser.add_argument("--users", type=int, default=100, help="Сколько разных пользователей")
+    parser.add_argument("--concurrency", type=int, default=50, help="Одновременных запросов")
+    parser.add_argument("--batches", type=int, default=1, help="Сколько раз повторить пачку")
+    args = parser.parse_args()
+
+    update_ids = itertools.count(1)
+    for batch in range(1, args.batches + 1):
+        updates = list(generate_updates(args.updates, args.users, seed=batch))
+        # Номера апдейтов сквозные между пачками, как у настоящего Telegram
+        for update in updates:
+            update["update_id"] = next(update_ids)
+        result = asyncio.run(fire(args.url, args.secret, updates, args.concurrency))
+        print(f"Пачка {batch}: {args.updates} апдейтов за {result['elapsed']:.2f} с "
+              f"({result['rate']:.0f}/с), ответы {result['statuses']}, "
+              f"ack p50 {result['ack_p50_ms']:.1f} мс, p95 {result['ack_p95_ms']:.1f} мс, "
+              f"p99 {result['ack_p99_ms']:.1f} мс")
+
+
+if __name__ == "__main__":
+    main()
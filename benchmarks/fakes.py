@@ -0,0 +1,229 @@
+"""
+Локальные заглушки внешних API для бенчмарков: Telegram Bot API и OpenWeather.
+
+Обе отвечают как настоящие сервисы, но без сети: задержка и доля ошибок
+задаются параметрами, количество вызовов считается по методам.
+"""
+
+import asyncio
+import random
+import sys
+import time
+import types
+from collections import Counter
+from typing import Any, Dict, Optional, Tuple
+
+from aiohttp import web
+
+
+FAKE_TOKEN = "123456:ABCDEFabcdef1234567890abcdefABCDEF12"
+
+
+def use_fake_config() -> None:
+    """
+    Подставляет модуль config с фиктивными ключами, если настоящего config.py нет (CI).
+    Ключи всё равно не уходят дальше заглушек.
+    """
+    try:
+        import config  # noqa: F401
+    except ImportError:
+        config = types.ModuleType("config")
+        config.TOKEN = FAKE_TOKEN
+        config.OPENWEATHER_API_KEY = "bench"
+        sys.modules["config"] = config
+
+
+def make_forecast_payload(entries: int = 40) -> dict:
+    """
+    Ответ /forecast того же размера и структуры, что у OpenWeather.
+    """
+    start = 1_700_000_000
+    return {
+        "cod": "200", "message": 0, "cnt": entries,
+        "list": [
+            {
+                "dt": start + i * 10800,
+                "main": {"temp": 10.0 + i % 7, "feels_like": 8.5 + i % 5, "temp_min": 9.1, "temp_max": 12.3,
+                         "pressure": 1012, "sea_level": 1012, "grnd_level": 995, "humidity": 60 + i % 30, "temp_kf": 0},
+                "weather": [{"id": 800 + i % 4, "main": "Clouds", "description": "облачно с прояснениями", "icon": "04d"}],
+                "clouds": {"all": 40}, "wind": {"speed": 3.2 + i % 3, "deg": 200, "gust": 6.1},
+                "visibility": 10000, "pop": 0.1, "sys": {"pod": "d"},
+                "dt_txt": "2023-11-14 22:00:00",
+            }
+            for i in range(entries)
+        ],
+        "city": {"id": 524901, "name": "Москва", "coord": {"lat": 55.75, "lon": 37.62}, "country": "RU",
+                 "population": 12000000, "timezone": 10800, "sunrise": 1699936000, "sunset": 1699966000},
+    }
+
+
+def make_weather_payload() -> dict:
+    """
+    Ответ /weather.
+    """
+    return {
+        "coord": {"lon": 37.62, "lat": 55.75},
+        "weather": [{"id": 803, "main": "Clouds", "description": "облачно с прояснениями", "icon": "04d"}],
+        "base": "stations",
+        "main": {"temp": 11.3, "feels_like": 10.1, "temp_min": 10.2, "temp_max": 12.0,
+                 "pressure": 1012, "humidity": 71, "sea_level": 1012, "grnd_level": 995},
+        "visibility": 10000, "wind": {"speed": 4.1, "deg": 210, "gust": 7.2}, "clouds": {"all": 75},
+        "dt": 1_700_000_000, "sys": {"country": "RU", "sunrise": 1699936000, "sunset": 1699966000},
+        "timezone": 10800, "id": 524901, "name": "Москва", "cod": 200,
+    }
+
+
+def make_group_payload(cities: Dict[int, Tuple[float, float]]) -> dict:
+    """
+    Ответ /group: текущая погода для городов {id: (широта, долгота)}.
+    Смещение часового пояса у group лежит в sys, а не на верхнем уровне.
+    """
+    items = []
+    for city_id, (lat, lon) in cities.items():
+        item = make_weather_payload()
+        for key in ("base", "cod", "timezone"):
+            item.pop(key)
+        item.update(id=city_id, name=f"Город {city_id}", coord={"lon": lon, "lat": lat},
+                    sys={**item["sys"], "timezone": 10800})
+        items.append(item)
+    return {"cnt": len(items), "list": items}
+
+
+def make_geo_payload(lat: float = 55.75, lon: float = 37.62) -> list:
+    """
+    Ответ геокодера /geo/1.0/reverse.
+    """
+    return [{
+        "name": "Moscow", "local_names": {"ru": "Москва", "en": "Moscow"},
+        "lat": lat, "lon": lon, "country": "RU", "state": "Moscow",
+    }]
+
+
+class FakeServer:
+    """
+    Основа заглушки: aiohttp-сервер на свободном локальном порту.
+
+    :param latency: Средняя задержка ответа в секундах (равномерно от 0.5x до 1.5x).
+    :param error_rate: Доля запросов, на которые отвечаем ошибкой сервера.
+    :param seed: Зерно генератора случайных чисел — прогоны повторяемы.
+    """
+
+    def __init__(self, latency: float = 0.0, error_rate: float = 0.0, seed: int = 0):
+        self.latency = latency
+        self.error_rate = error_rate
+        self._random = random.Random(seed)
+        # {метод: количество вызовов} и {метод: количество ответов с ошибкой}
+        self.calls: Counter = Counter()
+        self.errors: Counter = Counter()
+        self.url: Optional[str] = None
+        self._runner: Optional[web.AppRunner] = None
+
+    def routes(self, app: web.Application) -> None:
+        raise NotImplementedError
+
+    async def start(self, host: str = "127.0.0.1") -> str:
+        app = web.Application()
+        self.routes(app)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.url = f"http://{host}:{port}"
+        return self.url
+
+    async def stop(self) -> None:
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    async def _simulate(self, method: str) -> bool:
+        """
+        Считает вызов, ждёт задержку. :return: True, если на этот вызов нужно ответить ошибкой.
+        """
+        self.calls[method] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency * (0.5 + self._random.random()))
+        if self.error_rate and self._random.random() < self.error_rate:
+            self.errors[method] += 1
+            return True
+        return False
+
+
+class FakeBotAPI(FakeServer):
+    """
+    Telegram Bot API: send*/edit* возвращают сообщение, остальные методы — True.
+    Подключение: Bot(token, session=AiohttpSession(api=TelegramAPIServer.from_base(fake.url))).
+    """
+
+    def routes(self, app: web.Application) -> None:
+        app.router.add_post("/bot{token}/{method}", self._handle)
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        data = await request.post()
+        if await self._simulate(method):
+            return web.json_response({"ok": False, "error_code": 500, "description": "Internal Server Error"},
+                                     status=500)
+        if method.startswith(("send", "edit")):
+            chat_id = int(data.get("chat_id") or 1)
+            result: Any = {
+                "message_id": int(data.get("message_id") or 1),
+                "date": int(time.time()),
+                "chat": {"id": chat_id, "type": "private"},
+                "from": {"id": 1, "is_bot": True, "first_name": "bot"},
+                "text": data.get("text", ""),
+            }
+        elif method == "getMe":
+            result = {"id": 1, "is_bot": True, "first_name": "bot", "username": "bench_bot"}
+        else:
+            result = True
+        return web.json_response({"ok": True, "result": result})
+
+
+class FakeOpenWeather(FakeServer):
+    """
+    OpenWeather: /data/2.5/weather, /data/2.5/forecast, /data/2.5/group и /geo/1.0/reverse.
+    Ошибки — поровну 429 (лимит) и 502. На 429 бот останавливает все запросы
+    к API на Retry-After секунд — в бенчмарке пауза короче настоящей.
+    /group знает только города из cities ({id: (широта, долгота)}), остальные id пропускает.
+    """
+
+    def __init__(self, latency: float = 0.0, error_rate: float = 0.0, seed: int = 0, retry_after: float = 1.0,
+                 cities: Optional[Dict[int, Tuple[float, float]]] = None):
+        super().__init__(latency, error_rate, seed)
+        self.retry_after = retry_after
+        self.cities = cities or {}
+        # Тела ответов готовим один раз: заглушка не должна быть узким местом
+        self._bodies: Dict[str, Any] = {
+            "weather": make_weather_payload(),
+            "forecast": make_forecast_payload(),
+        }
+
+    def routes(self, app: web.Application) -> None:
+        app.router.add_get("/data/2.5/{endpoint}", self._handle_data)
+        app.router.add_get("/geo/1.0/reverse", self._handle_geo)
+
+    async def _error(self) -> web.Response:
+        if self._random.random() < 0.5:
+            return web.json_response({"cod": 429, "message": "fake rate limit"}, status=429,
+                                     headers={"Retry-After": str(self.retry_after)})
+        return web.json_response({"cod": 502, "message": "fake error"}, status=502)
+
+    async def _handle_data(self, request: web.Request) -> web.Response:
+        endpoint = request.match_info["endpoint"]
+        if endpoint == "group":
+            if await self._simulate(endpoint):
+                return await self._error()
+            ids = [int(city_id) for city_id in request.query["id"].split(",")]
+            return web.json_response(make_group_payload({i: self.cities[i] for i in ids if i in self.cities}))
+        if endpoint not in self._bodies:
+            return web.json_response({"cod": "404", "message": "Internal error"}, status=404)
+        if await self._simulate(endpoint):
+            return await self._error()
+        return web.json_response(self._bodies[endpoint])
+
+    async def _handle_geo(self, request: web.Request) -> web.Response:
+        if await self._simulate("geo/reverse"):
+            return await self._error()
+        return web.json_response(make_geo_payload(float(request.query["lat"]), float(request.query["lon"])))
@@ -1,30 +1,120 @@
+import time
+
+# Время от старта процесса до готовности принимать апдейты (выводится в on_startup)
+STARTED_AT = time.perf_counter()
+
 import asyncio
+import os
+from typing import Optional
 from aiogram import Bot, Dispatcher
 
 from utils.logger import logger
+from middlewares.log_context import setup_log_context
+from middlewares.metrics import setup_metrics, setup_bot_metrics
+from middlewares.flood_control import setup_flood_control, setup_bot_flood_control
 
 #импортируем роутреры с файлов-обработщиков
 #в файлах-обработщиках создаем переменную router=Router()
 from handlers.start import start_router
 from handlers.help import help_router
+from handlers.admin import admin_router
 
-from modules.weather.main import weather_router
+# Функциональные модули (modules/*) подключаются через реестр по манифестам и импортируются при первом обращении
+from services.module_registry import module_registry
+from services.callback_router import setup_callback_index
+
+from services.fsm_storage import fsm_storage
+from services.webhook import run_webhook
+from services.supervisor import run_supervisor, BOT_WORKERS
+from services.user_store import user_store, migrate_from_json, needs_migration
+from services.user_registry import user_registry, RELOAD_INTERVAL
+from services.http_client import http_client
+from services.geo_index import reverse_geocoder
+from services.city_search import city_search
+from services.metrics_server import metrics_server, METRICS_PORT
 
 
 from config import TOKEN
 
+# Как получать апдейты: "polling" (по умолчанию) или "webhook" (настройки — в services/webhook.py)
+BOT_MODE = os.getenv("BOT_MODE", "polling")
+
+
+async def on_startup(bot: Bot, background_jobs: bool = True, worker_index: Optional[int] = None):
+    # background_jobs=False — в воркерах супервизора, кроме первого (services/supervisor.py)
+    # Правки без изменений не уходят в Telegram (подключается первым: пропущенные правки не попадают в метрики)
+    setup_bot_flood_control(bot)
+    # Время запросов к Telegram Bot API и эндпоинт метрик (у каждого воркера свой порт)
+    setup_bot_metrics(bot)
+    await metrics_server.start(port=METRICS_PORT and METRICS_PORT + (worker_index + 1 if worker_index is not None else 0))
+    await user_store.open()
+    # Первый запуск на SQLite: переносим пользователей из старого data/users.json (пока нет отметки о переносе)
+    if await needs_migration(user_store):
+        await migrate_from_json(user_store)
+    # Справочник городов для офлайн-геокодирования читаем в отдельном потоке.
+    # До реестра пользователей: по нему определяется часовой пояс рассылки
+    await asyncio.to_thread(reverse_geocoder.load)
+    await asyncio.to_thread(city_search.load)
+    # В нескольких процессах пользователей регистрируют все воркеры — фоновым задачам нужен свежий реестр
+    await user_registry.start(reload_interval=RELOAD_INTERVAL if background_jobs and BOT_WORKERS > 1 else None)
+    await http_client.start()
+    logger.info(f"Готов к приёму апдейтов через {time.perf_counter() - STARTED_AT:.2f} с после старта. "
+                f"Модули: {module_registry.report()}")
+    if background_jobs:
+        # Фоновые задачи модулей (предзагрузка погоды, утренняя рассылка) стартуют отдельной задачей,
+        # когда polling или вебхук уже запущены: импорт модуля ради них не задерживает старт
+        module_registry.schedule_jobs(bot)
+
+
+async def on_shutdown():
+    await module_registry.stop_jobs()
+    # Сначала сбрасываем накопленные изменения, потом закрываем хранилище
+    await user_registry.stop()
+    await user_store.close()
+    await http_client.close()
+    await metrics_server.stop()
+
+
+def create_dispatcher() -> Dispatcher:
+    # Состояния FSM (например, незаконченная регистрация) переживают перезапуск бота;
+    # хранилище закрывается самим Dispatcher при остановке
+    dp = Dispatcher(storage=fsm_storage)
+    dp.startup.register(on_startup)
+    dp.shutdown.register(on_shutdown)
+    # Нажатия кнопок сразу попадают к роутеру — владельцу префикса, без обхода всех роутеров
+    setup_callback_index(dp)
+    # id апдейта, пользователя и имя обработчика — в каждую запись лога
+    setup_log_context(dp)
+    # Гистограммы времени работы обработчиков
+    setup_metrics(dp)
+    # Лимит частоты на пользователя и чат, склейка повторных нажатий кнопок
+    setup_flood_control(dp)
+    dp.include_router(start_router)
+    dp.include_router(help_router)
+    dp.include_router(admin_router)
+    # Модули, в том числе погода с /city, /now, /tomorrow, /hourly, — по манифестам
+    for router in module_registry.routers():
+        dp.include_router(router)
+    return dp
+
+
 async def main():
     # await async_main()
+    if BOT_WORKERS > 1:
+        # Несколько процессов: апдейты раздаются воркерам по id пользователя
+        await run_supervisor(create_dispatcher, TOKEN, mode=BOT_MODE, workers=BOT_WORKERS)
+        return
+
     bot = Bot(token=TOKEN)
-    dp = Dispatcher()
-    dp.include_router(start_router)
-    dp.include_router(help_router)
-    dp.include_router(weather_router)
-    await dp.start_polling(bot)
+    dp = create_dispatcher()
+    if BOT_MODE == "webhook":
+        await run_webhook(dp, bot)
+    else:
+        await dp.start_polling(bot)
 
 if __name__ == '__main__':
     try:
         asyncio.run(main())
     except KeyboardInterrupt:
         logger.info("Бот остановлен вручную")
-        #print("Бот выключен")
\ No newline at end of file
+        #print("Бот выключен")
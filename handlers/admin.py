@@ -0,0 +1,64 @@
+import os
+
+from aiogram import Router, F, types
+from aiogram.filters import Command
+
+import modules.weather as weather
+from middlewares.flood_control import flood_control, edit_dedup
+from services.callback_router import callback_rejections
+from services.module_registry import module_registry
+from utils.metrics import metrics
+
+admin_router = Router()
+
+# Telegram id администраторов через запятую: ADMIN_IDS=123,456
+ADMIN_IDS = {int(user_id) for user_id in os.getenv("ADMIN_IDS", "").split(",") if user_id.strip()}
+
+# Сколько строк показывать в каждой таблице
+STATS_TOP = 10
+
+
+def _ms(seconds: float) -> str:
+    return "∞" if seconds == float("inf") else f"{seconds * 1000:.0f}"
+
+
+def format_latency_table(rows: list, label: str) -> str:
+    lines = []
+    for row in rows[:STATS_TOP]:
+        lines.append(f"{row[label]} [{row['outcome']}]: {row['count']} шт., "
+                     f"ср. {_ms(row['avg'])} мс, p95 ≤ {_ms(row['p95'])} мс")
+    return "\n".join(lines) or "нет данных"
+
+
+# /stats — задержки обработчиков и внешних API (только для администраторов).
+# При запуске в несколько процессов показывает метрики процесса, обработавшего команду
+@admin_router.message(Command("stats"), F.from_user.id.in_(ADMIN_IDS))
+async def cmd_stats(message: types.Message):
+    upstream = metrics.snapshot("bot_upstream_request_duration_seconds")
+    for row in upstream:
+        row["target"] = f"{row['service']}/{row['endpoint']}"
+
+    # Обращение к атрибутам modules.weather импортирует модуль, если он ещё не загружен
+    cache = weather.weather_service.cache_stats()
+    limiter = weather.weather_service.limiter_stats()
+    resilience = weather.weather_service.resilience_stats()
+    rendered = weather.weather_messages.stats()
+    flood = flood_control.stats()
+
+    await message.answer(
+        "📊 Обработчики:\n"
+        f"{format_latency_table(metrics.snapshot('bot_handler_duration_seconds'), 'handler')}\n\n"
+        "🌐 Внешние API:\n"
+        f"{format_latency_table(upstream, 'target')}\n\n"
+        f"🗄 Кэш погоды: {cache['size']} записей, попаданий {cache['hit_ratio']:.0%}\n"
+        f"📝 Готовые тексты: собрано {rendered['rendered']}, переиспользовано {rendered['reused']}\n"
+        f"⏳ Лимит OpenWeather: запас {limiter['budget']}, в очереди {limiter['queue_depth']}, "
+        f"ожидание ср. {_ms(limiter['wait_avg'])} мс\n"
+        f"🛡 Выключатель OpenWeather: {resilience['breaker']}, повторов {resilience['retried']}, "
+        f"подстраховочных запросов {resilience['hedged']} (быстрее первого {resilience['hedge_wins']}), "
+        f"ответов устаревшими данными {resilience['stale_served']}\n"
+        f"🔘 Отклонённые нажатия кнопок: {dict(callback_rejections) or 'нет'}\n"
+        f"🚦 Флуд: отброшено {flood['dropped']}, склеено нажатий {flood['coalesced']}, "
+        f"правок без изменений {edit_dedup.stats()['skipped']}\n"
+        f"📦 Модули: {module_registry.report()}"
+    )
@@ -1,8 +1,20 @@
-from aiogram import Router, types
+from aiogram import types
 from aiogram.filters import Command
+from aiogram.filters.callback_data import CallbackData
 from aiogram.utils.keyboard import InlineKeyboardBuilder
 
-help_router = Router()
+from services.callback_router import CallbackRouter, legacy_callbacks
+
+help_router = CallbackRouter()
+
+
+# Данные кнопок справки: "help:<тема>", "help:back" — назад в меню
+class HelpTopic(CallbackData, prefix="help"):
+    topic: str
+
+
+# Кнопки в сообщениях, отправленных до перехода на CallbackData (убрать через релиз)
+legacy_callbacks({f"help_{topic}": HelpTopic(topic=topic) for topic in ("weather", "ai", "planner", "back")})
 
 # Главное меню справки
 HELP_MAIN_TEXT = """
@@ -50,9 +62,9 @@ HELP_DETAILS = {
 # Функция для клавиатуры главного меню
 def main_menu_keyboard() -> types.InlineKeyboardMarkup:
     builder = InlineKeyboardBuilder()
-    builder.button(text="🌦 Погода", callback_data="help_weather")
-    builder.button(text="🧠 ИИ", callback_data="help_ai")
-    builder.button(text="📅 Планировщик", callback_data="help_planner")
+    builder.button(text="🌦 Погода", callback_data=HelpTopic(topic="weather"))
+    builder.button(text="🧠 ИИ", callback_data=HelpTopic(topic="ai"))
+    builder.button(text="📅 Планировщик", callback_data=HelpTopic(topic="planner"))
     builder.adjust(1)  # по одному в строке
     return builder.as_markup()
 
@@ -60,7 +72,7 @@ def main_menu_keyboard() -> types.InlineKeyboardMarkup:
 # Функция для клавиатуры возврата
 def back_keyboard() -> types.InlineKeyboardMarkup:
     builder = InlineKeyboardBuilder()
-    builder.button(text="⬅ Назад", callback_data="help_back")
+    builder.button(text="⬅ Назад", callback_data=HelpTopic(topic="back"))
     return builder.as_markup()
 
 
@@ -75,9 +87,9 @@ async def cmd_help(message: types.Message):
 
 
 # Обработчики inline-кнопок
-@help_router.callback_query(lambda c: c.data.startswith("help_"))
-async def process_help_callback(callback: types.CallbackQuery):
-    action = callback.data.split("_")[1]
+@help_router.callback_query(HelpTopic.filter())
+async def process_help_callback(callback: types.CallbackQuery, callback_data: HelpTopic):
+    action = callback_data.topic
 
     if action == "back":
         # Вернуть в главное меню
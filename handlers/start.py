@@ -1,17 +1,17 @@
-import json
-import os
-from aiogram import Router, types, F
+from aiogram import types, F
 from aiogram.filters import Command
 from aiogram.fsm.state import State, StatesGroup
 from aiogram.fsm.context import FSMContext
 from aiogram.types import CallbackQuery, ReplyKeyboardRemove
 
-from services.get_geo import get_location_from_coords_async
+from services.callback_router import CallbackRouter
+from services.get_geo import reverse_geocode
+from services.user_registry import user_registry
+from utils.logger import logger
 from .start_keyboard import gender_keyboard, social_status_keyboard, confirm_keyboard, main_menu_keyboard, send_location_keyboard
+from .start_keyboard import GenderChoice, StatusChoice, ConfirmChoice
 
-start_router = Router()
-
-JSON_FILE_PATH = "data/users.json"
+start_router = CallbackRouter()
 
 
 # Машина состояний для регистрации пользователя 
@@ -25,19 +25,6 @@ class Registration(StatesGroup):
     confirm = State()
 
 
-# работа с JSON-файлом (загрузка и сохранение)
-def load_users():
-    if not os.path.exists(JSON_FILE_PATH):
-        return {}
-    with open(JSON_FILE_PATH, "r", encoding="utf-8") as f:
-        return json.load(f)
-
-
-def save_users(users):
-    with open(JSON_FILE_PATH, "w", encoding="utf-8") as f:
-        json.dump(users, f, ensure_ascii=False, indent=4)
-
-
 # =================================
 # Хендлеры
 # =================================
@@ -45,11 +32,8 @@ def save_users(users):
 # Старт
 @start_router.message(Command("start"))
 async def cmd_start(message: types.Message, state: FSMContext):
-    users = load_users()
-    user_id = str(message.from_user.id)
-
     # Если пользователь уже есть в базе, приветствуем его и показываем главное меню
-    if user_id in users:
+    if user_registry.exists(message.from_user.id):
         await message.answer(
             """👋 С возвращением!
             Я — твой персональный ассистент.
@@ -75,9 +59,9 @@ async def reg_name(message: types.Message, state: FSMContext):
 
 
 # Пол 
-@start_router.callback_query(Registration.gender, F.data.startswith("gender_"))
-async def reg_gender(callback: CallbackQuery, state: FSMContext):
-    gender = "Мужской" if callback.data == "gender_m" else "Женский"
+@start_router.callback_query(Registration.gender, GenderChoice.filter())
+async def reg_gender(callback: CallbackQuery, state: FSMContext, callback_data: GenderChoice):
+    gender = "Мужской" if callback_data.gender == "m" else "Женский"
     await state.update_data(gender=gender)
 
     await callback.message.answer("Теперь введи свой возраст:")
@@ -96,16 +80,17 @@ async def reg_age(message: types.Message, state: FSMContext):
 
 
 # Соц. статус
-@start_router.callback_query(Registration.status)
-async def reg_status(callback: CallbackQuery, state: FSMContext):
+@start_router.callback_query(Registration.status, StatusChoice.filter())
+async def reg_status(callback: CallbackQuery, state: FSMContext, callback_data: StatusChoice):
     status_map = {
-        "social_status_schoolboy": "Школьник",
-        "social_status_student": "Студент",
-        "social_status_worker": "Рабочий",
-        "social_status_other": "Другое"
+        "schoolboy": "Школьник",
+        "student": "Студент",
+        "worker": "Рабочий",
+        "unemployed": "Безработный",
+        "other": "Другое"
     }
 
-    status = status_map.get(callback.data, "Неизвестно")
+    status = status_map.get(callback_data.status, "Неизвестно")
     await state.update_data(status=status)
 
     # Объясняем, что можно сделать — отправить локацию (кнопка) или просто написать город
@@ -133,9 +118,9 @@ async def reg_city(message: types.Message, state: FSMContext):
         lat = message.location.latitude
         lon = message.location.longitude
 
-        # (Опционально) reverse geocoding: определить название города по координатам.
+        # reverse geocoding: определить название города по координатам (локальный справочник, API — запасной вариант).
         try:
-            user_location = await get_location_from_coords_async(lat, lon) # данные о местоположении пользователя - словарь {"name", "ru_name", "en_name", "state", "country", "lat", "lon"}
+            user_location = await reverse_geocode(lat, lon) # данные о местоположении пользователя - словарь {"name", "ru_name", "en_name", "state", "country", "lat", "lon"}
             
             if user_location and user_location.get("ru_name"):
 
@@ -152,7 +137,7 @@ async def reg_city(message: types.Message, state: FSMContext):
                 return  # остаёмся в том же состоянии — ждём корректного ввода
             
         except Exception as e:
-            print(f"Error in geocoding: {e}")
+            logger.error(f"Ошибка геокодирования при регистрации: {e}")
             # даём понятную подсказку и оставляем состояние Registration.city
             await message.answer(
                 "⚠️ Ошибка при определении местоположения. "
@@ -199,13 +184,12 @@ async def reg_city(message: types.Message, state: FSMContext):
 
 
 # Подтверждение — ДА
-@start_router.callback_query(Registration.confirm, F.data == "confirm_yes")
+@start_router.callback_query(Registration.confirm, ConfirmChoice.filter(F.action == "yes"))
 async def reg_confirm_yes(callback: CallbackQuery, state: FSMContext):
     data = await state.get_data()
-    users = load_users()
-    user_id = str(callback.from_user.id)
 
-    users[user_id] = {
+    # Пользователь сразу появляется в реестре, на диск запись уйдёт пачкой
+    user_registry.upsert(callback.from_user.id, {
         "id": callback.from_user.id,
         "name": data.get("name", ""),
         "age": int(data.get("age", 0)),
@@ -218,8 +202,7 @@ async def reg_confirm_yes(callback: CallbackQuery, state: FSMContext):
             "language": "ru",
             "timezone": ""
         }
-    }
-    save_users(users)
+    })
 
     await callback.message.answer("✅ Отлично! Ты зарегистрирован!")
     await callback.message.answer(
@@ -231,7 +214,7 @@ async def reg_confirm_yes(callback: CallbackQuery, state: FSMContext):
 
 
 # Подтверждение — Редактировать
-@start_router.callback_query(Registration.confirm, F.data == "confirm_edit")
+@start_router.callback_query(Registration.confirm, ConfirmChoice.filter(F.action == "edit"))
 async def reg_confirm_edit(callback: CallbackQuery, state: FSMContext):
     await callback.message.answer("✏ Окей, давай начнём заново. Введи своё имя:")
     await state.set_state(Registration.name)
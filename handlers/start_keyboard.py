@@ -1,19 +1,59 @@
+from typing import Literal
+
+from aiogram.filters.callback_data import CallbackData
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
 from aiogram.types import ReplyKeyboardMarkup, KeyboardButton
 
+from services.callback_router import legacy_callbacks
+
 
 """
 КЛАВИАТУРЫ ДЛЯ РЕГИСТРАЦИИ И ГЛАВНОГО МЕНЮ ДЛЯ ФАЙЛА start.py
 """
 
+# ========== ДАННЫЕ КНОПОК ==========
+
+# "gender:m" / "gender:f"
+class GenderChoice(CallbackData, prefix="gender"):
+    gender: Literal["m", "f"]
+
+
+# "status:student" и т. п.
+class StatusChoice(CallbackData, prefix="status"):
+    status: Literal["schoolboy", "student", "worker", "unemployed", "other"]
+
+
+# "confirm:yes" / "confirm:edit"
+class ConfirmChoice(CallbackData, prefix="confirm"):
+    action: Literal["yes", "edit"]
+
+
+# "menu:weather" и т. п.
+class MenuSection(CallbackData, prefix="menu"):
+    section: str
+
+
+# Кнопки в сообщениях, отправленных до перехода на CallbackData (убрать через релиз).
+# Анкета в FSM переживает перезапуск: застрявший на подтверждении должен суметь её закончить
+legacy_callbacks({
+    "gender_m": GenderChoice(gender="m"),
+    "gender_f": GenderChoice(gender="f"),
+    **{f"social_status_{status}": StatusChoice(status=status)
+       for status in ("schoolboy", "student", "worker", "unemployed", "other")},
+    "confirm_yes": ConfirmChoice(action="yes"),
+    "confirm_edit": ConfirmChoice(action="edit"),
+    **{f"menu_{section}": MenuSection(section=section) for section in ("weather", "todo", "ai")},
+})
+
+
 # ========== КЛАВИАТУРЫ И КНОПКИ ==========
 
 # ========== пол ==========
 def gender_keyboard():
     return InlineKeyboardMarkup(
         inline_keyboard=[
-            [InlineKeyboardButton(text="♂ Мужской", callback_data="gender_m")],
-            [InlineKeyboardButton(text="♀ Женский", callback_data="gender_f")]
+            [InlineKeyboardButton(text="♂ Мужской", callback_data=GenderChoice(gender="m").pack())],
+            [InlineKeyboardButton(text="♀ Женский", callback_data=GenderChoice(gender="f").pack())]
         ]
     )
 
@@ -33,11 +73,11 @@ send_location_keyboard = ReplyKeyboardMarkup(
 def social_status_keyboard():
     return InlineKeyboardMarkup(
         inline_keyboard=[
-            [InlineKeyboardButton(text="Школьник", callback_data="social_status_schoolboy")],
-            [InlineKeyboardButton(text="Студент", callback_data="social_status_student")],
-            [InlineKeyboardButton(text="Рабочий", callback_data="social_status_worker")],
-            [InlineKeyboardButton(text="Безработный", callback_data="social_status_unemployed")],
-            [InlineKeyboardButton(text="Другое", callback_data="social_status_other")],
+            [InlineKeyboardButton(text="Школьник", callback_data=StatusChoice(status="schoolboy").pack())],
+            [InlineKeyboardButton(text="Студент", callback_data=StatusChoice(status="student").pack())],
+            [InlineKeyboardButton(text="Рабочий", callback_data=StatusChoice(status="worker").pack())],
+            [InlineKeyboardButton(text="Безработный", callback_data=StatusChoice(status="unemployed").pack())],
+            [InlineKeyboardButton(text="Другое", callback_data=StatusChoice(status="other").pack())],
         ]
     )
 
@@ -45,8 +85,8 @@ def social_status_keyboard():
 def confirm_keyboard():
     return InlineKeyboardMarkup(
         inline_keyboard=[
-            [InlineKeyboardButton(text="✅ Всё верно", callback_data="confirm_yes")],
-            [InlineKeyboardButton(text="✏ Изменить", callback_data="confirm_edit")]
+            [InlineKeyboardButton(text="✅ Всё верно", callback_data=ConfirmChoice(action="yes").pack())],
+            [InlineKeyboardButton(text="✏ Изменить", callback_data=ConfirmChoice(action="edit").pack())]
         ]
     )
 
@@ -54,8 +94,8 @@ def confirm_keyboard():
 def main_menu_keyboard():
     return InlineKeyboardMarkup(
         inline_keyboard=[
-            [InlineKeyboardButton(text="🌤 Погода", callback_data="menu_weather")],
-            [InlineKeyboardButton(text="📅 Планировщик", callback_data="menu_todo")],
-            [InlineKeyboardButton(text="🤖 AI помощник", callback_data="menu_ai")]
+            [InlineKeyboardButton(text="🌤 Погода", callback_data=MenuSection(section="weather").pack())],
+            [InlineKeyboardButton(text="📅 Планировщик", callback_data=MenuSection(section="todo").pack())],
+            [InlineKeyboardButton(text="🤖 AI помощник", callback_data=MenuSection(section="ai").pack())]
         ]
     )
@@ -0,0 +1,224 @@
+"""
+Защита от флуда: лимит частоты апдейтов, склейка повторных нажатий кнопок
+и пропуск правок сообщения, которые ничего не меняют.
+
+- Лимит: не больше FLOOD_USER_LIMIT сообщений и нажатий от пользователя и
+  FLOOD_CHAT_LIMIT в групповом чате за FLOOD_WINDOW секунд (скользящее окно,
+  utils.sliding_window). Лишние сообщения отбрасываются молча, на лишние
+  нажатия бот отвечает коротким уведомлением.
+- Склейка: повторное нажатие той же кнопки того же сообщения, пока первое
+  ещё обрабатывается или прошло меньше CALLBACK_COALESCE_WINDOW секунд,
+  не запускает обработчик снова — на него только снимаются «часики».
+- Правки: editMessageText/editMessageReplyMarkup с тем же текстом и
+  клавиатурой, что уже показаны, в Telegram не отправляются (иначе он
+  отвечает ошибкой "message is not modified"). Бот помнит, что показал в
+  последних EDIT_CACHE_SIZE сообщениях.
+
+Состояние у каждого процесса своё. Супервизор распределяет апдейты по
+воркерам по id пользователя, поэтому лимит пользователя точный, а лимит
+группового чата считается в каждом воркере отдельно.
+"""
+
+import os
+import time
+from collections import Counter
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Set, Tuple
+
+from aiogram import BaseMiddleware, Bot, Dispatcher
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.methods import EditMessageReplyMarkup, EditMessageText, SendMessage, TelegramMethod
+from aiogram.methods.base import Response, TelegramType
+from aiogram.types import CallbackQuery, Chat, InlineKeyboardMarkup, Message, TelegramObject, User
+
+from utils.cache import TTLCache
+from utils.logger import logger
+from utils.metrics import metrics
+from utils.sliding_window import SlidingWindowLimiter
+
+
+FLOOD_WINDOW = float(os.getenv("FLOOD_WINDOW", "10"))
+FLOOD_USER_LIMIT = int(os.getenv("FLOOD_USER_LIMIT", "20"))
+FLOOD_CHAT_LIMIT = int(os.getenv("FLOOD_CHAT_LIMIT", "60"))
+CALLBACK_COALESCE_WINDOW = float(os.getenv("CALLBACK_COALESCE_WINDOW", "1"))
+EDIT_CACHE_SIZE = int(os.getenv("EDIT_CACHE_SIZE", "10000"))
+
+# Ответ на нажатие сверх лимита
+FLOOD_TEXT = "Слишком часто — подождите пару секунд"
+
+# Редактировать сообщение Telegram разрешает 48 часов
+EDIT_TTL = 48 * 3600
+
+
+class FloodControlMiddleware(BaseMiddleware):
+    """
+    Внешний middleware на сообщения и нажатия: лимит частоты и склейка повторных нажатий.
+    """
+
+    def __init__(self,
+                 user_limit: int = FLOOD_USER_LIMIT,
+                 chat_limit: int = FLOOD_CHAT_LIMIT,
+                 window: float = FLOOD_WINDOW,
+                 coalesce_window: float = CALLBACK_COALESCE_WINDOW):
+        self.users = SlidingWindowLimiter(user_limit, window)
+        self.chats = SlidingWindowLimiter(chat_limit, window)
+        # Нажатия, которые сейчас обрабатываются, и недавние (для окна склейки)
+        self._running: Set[Hashable] = set()
+        self._recent = TTLCache(max_size=10_000, default_ttl=coalesce_window)
+
+        # Счётчики для мониторинга: {(вид апдейта, чей лимит): сколько отброшено}
+        self.dropped: Counter = Counter()
+        self.coalesced = 0
+
+    @staticmethod
+    def _callback_key(callback: CallbackQuery) -> Tuple[Any, ...]:
+        message = callback.message
+        target = callback.inline_message_id or (message and (message.chat.id, message.message_id))
+        return callback.from_user.id, target, callback.data
+
+    def _is_duplicate(self, key: Hashable) -> bool:
+        return key in self._running or self._recent.get(key) is not None
+
+    def _over_limit(self, user: Optional[User], chat: Optional[Chat]) -> Optional[str]:
+        if user is not None and not self.users.hit(user.id):
+            return "user"
+        # В личном чате id чата совпадает с id пользователя — хватает лимита пользователя
+        if chat is not None and chat.type != "private" and not self.chats.hit(chat.id):
+            return "chat"
+        return None
+
+    @staticmethod
+    async def _answer(callback: CallbackQuery, text: Optional[str] = None) -> None:
+        try:
+            await callback.answer(text)
+        except Exception as e:
+            logger.error(f"Не удалось ответить на нажатие: {e}")
+
+    async def __call__(self,
+                       handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+                       event: TelegramObject,
+                       data: Dict[str, Any]) -> Any:
+        is_callback = isinstance(event, CallbackQuery)
+        key = self._callback_key(event) if is_callback else None
+        if key is not None and self._is_duplicate(key):
+            self.coalesced += 1
+            await self._answer(event)
+            return None
+
+        scope = self._over_limit(data.get("event_from_user"), data.get("event_chat"))
+        if scope is not None:
+            kind = "callback" if is_callback else "message"
+            self.dropped[kind, scope] += 1
+            logger.debug(f"Апдейт отброшен: лимит частоты ({kind}, {scope})")
+            if is_callback:
+                await self._answer(event, FLOOD_TEXT)
+            return None
+
+        if key is None:
+            return await handler(event, data)
+        self._running.add(key)
+        self._recent.set(key, time.monotonic())
+        try:
+            return await handler(event, data)
+        finally:
+            self._running.discard(key)
+
+    def stats(self) -> dict:
+        return {
+            "dropped": sum(self.dropped.values()),
+            "coalesced": self.coalesced,
+        }
+
+
+def _markup_digest(markup: Any) -> Optional[int]:
+    # Инлайн-клавиатура — часть сообщения; обычная клавиатура (ReplyKeyboardMarkup) к нему не относится
+    if isinstance(markup, InlineKeyboardMarkup):
+        return hash(markup.model_dump_json(exclude_none=True))
+    return None
+
+
+def _text_digest(method: Any) -> int:
+    return hash((method.text, str(method.parse_mode), str(method.entities)))
+
+
+class EditDedupMiddleware(BaseRequestMiddleware):
+    """
+    Middleware сессии бота: не отправляет правки, после которых сообщение не изменится.
+    """
+
+    def __init__(self, max_size: int = EDIT_CACHE_SIZE):
+        # {(id чата, id сообщения) или inline_message_id: (хэш текста, хэш клавиатуры)}
+        self._shown = TTLCache(max_size=max_size, default_ttl=EDIT_TTL)
+
+        # Счётчики для мониторинга: {"cached" — не отправлена, "not_modified" — отклонена Telegram: сколько}
+        self.skipped: Counter = Counter()
+
+    @staticmethod
+    def _key(method: Any) -> Hashable:
+        return method.inline_message_id or (method.chat_id, method.message_id)
+
+    async def __call__(self,
+                       make_request: NextRequestMiddlewareType[TelegramType],
+                       bot: Bot,
+                       method: TelegramMethod[TelegramType]) -> Response[TelegramType]:
+        if isinstance(method, SendMessage):
+            result = await make_request(bot, method)
+            if isinstance(result, Message):
+                self._shown.set((result.chat.id, result.message_id),
+                                (_text_digest(method), _markup_digest(method.reply_markup)))
+            return result
+
+        if not isinstance(method, (EditMessageText, EditMessageReplyMarkup)):
+            return await make_request(bot, method)
+
+        key = self._key(method)
+        shown = self._shown.get(key)
+        if isinstance(method, EditMessageText):
+            content = (_text_digest(method), _markup_digest(method.reply_markup))
+        else:
+            content = (shown[0] if shown else None, _markup_digest(method.reply_markup))
+        if shown is not None and content == shown:
+            self.skipped["cached"] += 1
+            return True
+
+        try:
+            result = await make_request(bot, method)
+        except TelegramBadRequest as e:
+            if "message is not modified" not in e.message:
+                raise
+            self.skipped["not_modified"] += 1
+            result = True
+        self._shown.set(key, content)
+        return result
+
+    def stats(self) -> dict:
+        return {"skipped": sum(self.skipped.values()), **self.skipped}
+
+
+# Общие на процесс: счётчики видны в метриках и /stats
+flood_control = FloodControlMiddleware()
+edit_dedup = EditDedupMiddleware()
+
+metrics.gauge("bot_flood_dropped", "Апдейтов, отброшенных лимитом частоты",
+              lambda: {labels: count for labels, count in flood_control.dropped.items()},
+              ("kind", "scope"))
+metrics.gauge("bot_callbacks_coalesced", "Повторных нажатий, склеенных с уже обработанным",
+              lambda: flood_control.coalesced)
+metrics.gauge("bot_edits_skipped", "Правок сообщений без изменений, не отправленных в Telegram",
+              lambda: {(reason,): count for reason, count in edit_dedup.skipped.items()},
+              ("reason",))
+
+
+def setup_flood_control(dispatcher: Dispatcher) -> None:
+    """
+    Подключает лимит частоты и склейку нажатий к сообщениям и нажатиям кнопок Dispatcher.
+    """
+    dispatcher.message.outer_middleware(flood_control)
+    dispatcher.callback_query.outer_middleware(flood_control)
+
+
+def setup_bot_flood_control(bot: Bot) -> None:
+    """
+    Подключает пропуск правок без изменений для бота.
+    """
+    bot.session.middleware(edit_dedup)
@@ -0,0 +1,71 @@
+"""
+Контекст апдейта для логов: id апдейта, id пользователя и имя обработчика.
+
+Значения кладутся в contextvars из utils.logger и попадают в каждую запись
+лога, сделанную во время обработки апдейта.
+"""
+
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware, Dispatcher
+from aiogram.types import TelegramObject, Update
+
+from utils.logger import update_id_var, user_id_var, handler_var
+
+
+def handler_name(data: Dict[str, Any]) -> str:
+    """
+    Имя обработчика вида "handlers.start.cmd_start" (модуль и функция).
+    """
+    handler = data.get("handler")
+    callback = getattr(handler, "callback", None)
+    if callback is None:
+        return "unknown"
+    return f"{getattr(callback, '__module__', '')}.{getattr(callback, '__name__', type(callback).__name__)}"
+
+
+class UpdateContextMiddleware(BaseMiddleware):
+    """
+    Внешний middleware на апдейт: id апдейта и пользователя.
+    """
+
+    async def __call__(self,
+                       handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+                       event: Update,
+                       data: Dict[str, Any]) -> Any:
+        user = data.get("event_from_user")
+        update_token = update_id_var.set(event.update_id)
+        user_token = user_id_var.set(user.id if user is not None else None)
+        try:
+            return await handler(event, data)
+        finally:
+            user_id_var.reset(user_token)
+            update_id_var.reset(update_token)
+
+
+class HandlerContextMiddleware(BaseMiddleware):
+    """
+    Внутренний middleware на событие: имя выбранного обработчика.
+    """
+
+    async def __call__(self,
+                       handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+                       event: TelegramObject,
+                       data: Dict[str, Any]) -> Any:
+        token = handler_var.set(handler_name(data))
+        try:
+            return await handler(event, data)
+        finally:
+            handler_var.reset(token)
+
+
+def setup_log_context(dispatcher: Dispatcher) -> None:
+    """
+    Подключает middleware контекста ко всем типам событий Dispatcher.
+    """
+    dispatcher.update.outer_middleware(UpdateContextMiddleware())
+    middleware = HandlerContextMiddleware()
+    for name, observer in dispatcher.observers.items():
+        # "update" обрабатывает сам Dispatcher, "error" — не пользовательские обработчики
+        if name not in ("update", "error"):
+            observer.middleware(middleware)
@@ -0,0 +1,80 @@
+"""
+Метрики задержек: обработчики апдейтов и запросы к Telegram Bot API.
+"""
+
+import time
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware, Bot, Dispatcher
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.methods import TelegramMethod
+from aiogram.methods.base import Response, TelegramType
+from aiogram.types import TelegramObject
+
+from utils.metrics import handler_latency, upstream_latency
+
+from .log_context import handler_name
+
+
+class HandlerMetricsMiddleware(BaseMiddleware):
+    """
+    Внутренний middleware на событие: время работы выбранного обработчика.
+    """
+
+    def __init__(self):
+        # Имя обработчика считаем один раз: {id(обработчика): имя}
+        self._names: Dict[int, str] = {}
+
+    async def __call__(self,
+                       handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+                       event: TelegramObject,
+                       data: Dict[str, Any]) -> Any:
+        handler_object = data.get("handler")
+        name = self._names.get(id(handler_object))
+        if name is None:
+            name = self._names[id(handler_object)] = handler_name(data)
+
+        started = time.perf_counter()
+        outcome = "error"
+        try:
+            result = await handler(event, data)
+            outcome = "ok"
+            return result
+        finally:
+            handler_latency.labels(name, outcome).observe(time.perf_counter() - started)
+
+
+class TelegramMetricsMiddleware(BaseRequestMiddleware):
+    """
+    Middleware сессии бота: время каждого запроса к Telegram Bot API по методам.
+    """
+
+    async def __call__(self,
+                       make_request: NextRequestMiddlewareType[TelegramType],
+                       bot: Bot,
+                       method: TelegramMethod[TelegramType]) -> Response[TelegramType]:
+        started = time.perf_counter()
+        outcome = "error"
+        try:
+            response = await make_request(bot, method)
+            outcome = "ok"
+            return response
+        finally:
+            upstream_latency.labels("telegram", method.__api_method__, outcome).observe(time.perf_counter() - started)
+
+
+def setup_metrics(dispatcher: Dispatcher) -> None:
+    """
+    Подключает замер времени ко всем обработчикам Dispatcher.
+    """
+    middleware = HandlerMetricsMiddleware()
+    for name, observer in dispatcher.observers.items():
+        if name not in ("update", "error"):
+            observer.middleware(middleware)
+
+
+def setup_bot_metrics(bot: Bot) -> None:
+    """
+    Подключает замер времени запросов к Telegram Bot API для бота.
+    """
+    bot.session.middleware(TelegramMetricsMiddleware())
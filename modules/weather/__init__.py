@@ -1,4 +1,28 @@
-from .handlers import weather_router
-from .get_weather import WeatherService
+"""
+Модуль погоды.
 
-__all__ = ["weather_router", "WeatherService"]
\ No newline at end of file
+Пакет импортируется дёшево: сервис, обработчики и фоновые задачи подгружаются
+при первом обращении к атрибуту (modules.weather.weather_service и т. п.).
+Лёгкие части, например models, можно импортировать напрямую.
+"""
+
+import importlib
+
+# Атрибут пакета -> модуль, где он определён
+_EXPORTS = {
+    "weather_router": ".main",
+    "weather_service": ".main",
+    "weather_messages": ".main",
+    "WeatherService": ".get_weather",
+    "weather_prefetcher": ".prefetch",
+    "digest_broadcaster": ".digest",
+}
+
+__all__ = list(_EXPORTS)
+
+
+def __getattr__(name: str):
+    module = _EXPORTS.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    return getattr(importlib.import_module(module, __name__), name)
@@ -0,0 +1,102 @@
+from aiogram import Router, F
+from aiogram.filters import Command, CommandObject
+from aiogram.fsm.context import FSMContext
+from aiogram.fsm.state import State, StatesGroup
+from aiogram.types import Message, InlineQuery, InlineQueryResultArticle, InputTextMessageContent
+
+from services.city_search import city_search
+from services.user_registry import user_registry
+
+from .main import weather_messages
+
+# Город пользователя и погода для него: /city, /now, /tomorrow, /hourly и подсказки городов в инлайн-режиме.
+# Подключается к weather_router (main.py), маршрутизируется по манифесту модуля
+city_router = Router()
+
+_NO_CITY = "Сначала укажи свой город: /city Москва"
+_NOT_REGISTERED = "Сначала зарегистрируйся: /start"
+
+
+# Ввод города после /city без названия
+class CityInput(StatesGroup):
+    city = State()
+
+
+async def answer_weather(message: Message, view: str) -> None:
+    # Город берём из реестра: тот же, что указан при регистрации или через /city
+    user = user_registry.get(message.from_user.id)
+    if user is None:
+        await message.answer(_NOT_REGISTERED)
+        return
+    if not user.has_location:
+        await message.answer(_NO_CITY)
+        return
+    await message.answer(await weather_messages.render(view, user.lat, user.lon, lang=user.language or "ru"))
+
+
+@city_router.message(Command("now"))
+async def weather_now(message: Message):
+    await answer_weather(message, "now")
+
+
+@city_router.message(Command("tomorrow"))
+async def weather_tomorrow(message: Message):
+    await answer_weather(message, "tomorrow")
+
+
+@city_router.message(Command("hourly"))
+async def weather_hourly(message: Message):
+    await answer_weather(message, "hourly")
+
+
+# Автодополнение города в инлайн-режиме: @bot моск -> список городов
+# (инлайн-режим включается у @BotFather командой /setinline)
+@city_router.inline_query()
+async def suggest_city(inline_query: InlineQuery):
+    results = [
+        InlineQueryResultArticle(
+            id=str(place["geoname_id"]),
+            title=place["ru_name"],
+            description=f"{place['en_name']}, {place['country']}",
+            input_message_content=InputTextMessageContent(message_text=f"/city {place['ru_name']}")
+        )
+        for place in city_search.suggest(inline_query.query, limit=10)
+    ]
+    await inline_query.answer(results, cache_time=3600, is_personal=False)
+
+
+async def save_city(message: Message, text: str) -> bool:
+    # Определяем город по тексту локально, без запросов к API
+    place = city_search.resolve(text)
+    if place is None:
+        await message.answer("❌ Не нашёл такой город. Попробуй написать название иначе.")
+        return False
+
+    # Город сохраняется в профиле пользователя: переживает перезапуск и виден всем процессам
+    if not await user_registry.update_location(message.from_user.id, place["ru_name"], place["lat"], place["lon"]):
+        await message.answer(_NOT_REGISTERED)
+        return False
+    await message.answer(f"✅ Запомнил твой город: {place['ru_name']}\n"
+                         "Теперь можно узнать погоду:\n"
+                         "/now – сейчас\n"
+                         "/tomorrow – завтра\n"
+                         "/hourly – по часам")
+    return True
+
+
+# /city Москва — сразу запоминаем город, /city — ждём название следующим сообщением
+@city_router.message(Command("city"))
+async def cmd_city(message: Message, command: CommandObject, state: FSMContext):
+    if not user_registry.exists(message.from_user.id):
+        await message.answer(_NOT_REGISTERED)
+    elif command.args:
+        await save_city(message, command.args)
+    else:
+        await state.set_state(CityInput.city)
+        await message.answer("Напиши название своего города")
+
+
+@city_router.message(CityInput.city, F.text)
+async def city_entered(message: Message, state: FSMContext):
+    if await save_city(message, message.text):
+        await state.clear()
@@ -0,0 +1,297 @@
+"""
+Утренняя рассылка прогноза погоды.
+
+Каждую минуту для каждого часового пояса, где есть подписчики, смотрим местное
+время и берём из реестра пользователей корзину (часовой пояс, минута суток).
+Прогноз рендерится один раз на (ячейку сетки, язык) и переиспользуется всеми
+получателями из этой ячейки. Получатели обходятся по возрастанию id, сообщения
+уходят параллельно (не больше DIGEST_CONCURRENCY сразу) в пределах лимита
+отправки. Прогресс каждой рассылки (получатель, до которого включительно всё
+отправлено) сохраняется в SQLite раз в DIGEST_CHECKPOINT_EVERY отправок или
+DIGEST_CHECKPOINT_INTERVAL секунд, поэтому после перезапуска рассылка
+продолжается с места остановки: повторно могут уйти только сообщения
+с последнего сохранения.
+"""
+
+import asyncio
+import os
+import sqlite3
+import threading
+import time
+from collections import deque
+from datetime import datetime, timedelta, timezone
+from typing import Optional, Deque, Dict, Tuple
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramRetryAfter, TelegramForbiddenError, TelegramBadRequest
+
+from services.user_registry import UserRegistry, UserRecord, user_registry
+from utils.geo_grid import cell_key
+from utils.logger import logger
+from utils.rate_limiter import Priority, PriorityRateLimiter
+
+from .get_weather import WeatherService
+from .main import weather_service, weather_messages
+from .rendered import RenderedMessageCache
+
+
+DIGEST_CHECKPOINT_PATH = os.getenv("DIGEST_CHECKPOINT_PATH", "data/digest.sqlite3")
+# Telegram разрешает около 30 сообщений в секунду на бота — оставляем запас
+DIGEST_SEND_RATE = float(os.getenv("DIGEST_SEND_RATE", "25"))
+# Сколько сообщений рассылки отправляется одновременно (темп задаёт DIGEST_SEND_RATE)
+DIGEST_CONCURRENCY = max(1, int(os.getenv("DIGEST_CONCURRENCY", "16")))
+# Прогресс рассылки сохраняется раз в столько получателей…
+DIGEST_CHECKPOINT_EVERY = max(1, int(os.getenv("DIGEST_CHECKPOINT_EVERY", "100")))
+# …или раз в столько секунд, смотря что наступит раньше
+DIGEST_CHECKPOINT_INTERVAL = float(os.getenv("DIGEST_CHECKPOINT_INTERVAL", "5"))
+# Сколько пропущенных минут досылать после перезапуска
+DIGEST_CATCHUP_MINUTES = int(os.getenv("DIGEST_CATCHUP_MINUTES", "30"))
+# Сколько дней хранить отметки о завершённых рассылках
+DIGEST_CHECKPOINT_KEEP_DAYS = 3
+
+
+class DigestCheckpoint:
+    """
+    Прогресс рассылок в SQLite: {run_id: последний получатель, завершена ли}.
+    run_id = "<местная дата>|<часовой пояс>|<минута суток>".
+    """
+
+    def __init__(self, path: str = DIGEST_CHECKPOINT_PATH):
+        self.path = path
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS digest_runs ("
+            "run_id TEXT PRIMARY KEY, "
+            "last_user_id INTEGER, "
+            "done INTEGER NOT NULL DEFAULT 0, "
+            "updated_at REAL NOT NULL)"
+        )
+        return conn
+
+    def _execute(self, sql: str, params: tuple = ()) -> list:
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    async def open(self) -> None:
+        if self._conn is None:
+            self._conn = await asyncio.to_thread(self._connect)
+            cutoff = time.time() - DIGEST_CHECKPOINT_KEEP_DAYS * 86400
+            await asyncio.to_thread(self._execute, "DELETE FROM digest_runs WHERE updated_at < ?", (cutoff,))
+
+    async def close(self) -> None:
+        if self._conn is not None:
+            conn, self._conn = self._conn, None
+            await asyncio.to_thread(conn.close)
+
+    async def get(self, run_id: str) -> Tuple[Optional[int], bool]:
+        """
+        :return: (последний получатель или None, завершена ли рассылка).
+        """
+        rows = await asyncio.to_thread(self._execute, "SELECT last_user_id, done FROM digest_runs WHERE run_id = ?", (run_id,))
+        return (rows[0][0], bool(rows[0][1])) if rows else (None, False)
+
+    async def mark(self, run_id: str, user_id: Optional[int], done: bool = False) -> None:
+        await asyncio.to_thread(
+            self._execute,
+            "INSERT INTO digest_runs (run_id, last_user_id, done, updated_at) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT(run_id) DO UPDATE SET last_user_id = excluded.last_user_id, "
+            "done = excluded.done, updated_at = excluded.updated_at",
+            (run_id, user_id, int(done), time.time())
+        )
+
+
+class DigestBroadcaster:
+    """
+    Рассылка утреннего прогноза по часовым поясам.
+    """
+
+    def __init__(self,
+                 service: WeatherService,
+                 registry: UserRegistry,
+                 checkpoint: DigestCheckpoint,
+                 messages: RenderedMessageCache,
+                 send_rate: float = DIGEST_SEND_RATE,
+                 concurrency: int = DIGEST_CONCURRENCY):
+        self.service = service
+        self.messages = messages
+        self.registry = registry
+        self.checkpoint = checkpoint
+        self.limiter = PriorityRateLimiter(rate=send_rate, capacity=send_rate)
+        self.concurrency = concurrency
+        self.bot: Optional[Bot] = None
+        self._task: Optional[asyncio.Task] = None
+        self._zones: Dict[str, Optional[ZoneInfo]] = {}
+
+        # Метрики
+        self.sent = 0
+        self.failed = 0
+        self.rendered = 0
+
+    def _zone(self, name: str) -> Optional[ZoneInfo]:
+        if name not in self._zones:
+            try:
+                self._zones[name] = ZoneInfo(name)
+            except (ZoneInfoNotFoundError, ValueError):
+                logger.error(f"Неизвестный часовой пояс в настройках пользователей: {name}")
+                self._zones[name] = None
+        return self._zones[name]
+
+    async def _render(self, user: UserRecord, rendered: Dict[Tuple[Tuple[int, int], str], Optional[str]]) -> Optional[str]:
+        """
+        Текст рассылки для пользователя — один раз на (ячейку, язык) за минуту.
+        """
+        lang = user.language or "ru"
+        key = (cell_key(user.lat, user.lon), lang)
+        if key not in rendered:
+            forecast = await self.service.get_forecast_series(user.lat, user.lon, lang=lang, priority=Priority.BACKGROUND)
+            # Текст собираем из уже полученного прогноза, без второго запроса к сервису
+            rendered[key] = (await self.messages.render_loaded("digest", forecast, user.lat, user.lon, lang=lang)
+                             if forecast is not None else None)
+            self.rendered += 1
+        return rendered[key]
+
+    async def _send(self, user_id: int, text: str) -> None:
+        while True:
+            await self.limiter.acquire(Priority.BACKGROUND)
+            try:
+                await self.bot.send_message(user_id, text)
+                self.sent += 1
+                return
+            except TelegramRetryAfter as e:
+                # Telegram просит подождать — останавливаем выдачу токенов и пробуем снова
+                self.limiter.pause(e.retry_after)
+            except (TelegramForbiddenError, TelegramBadRequest) as e:
+                # Пользователь заблокировал бота или чат недоступен — пропускаем
+                self.failed += 1
+                logger.info(f"Рассылка: не удалось отправить пользователю {user_id}: {e}")
+                return
+
+    async def _deliver(self, user_id: int, text: str, slots: asyncio.Semaphore) -> None:
+        try:
+            await self._send(user_id, text)
+        except Exception as e:
+            self.failed += 1
+            logger.error(f"Рассылка: ошибка отправки пользователю {user_id}: {e}")
+        finally:
+            slots.release()
+
+    async def run_bucket(self, run_id: str, tz_name: str, minute: int,
+                         rendered: Dict[Tuple[Tuple[int, int], str], Optional[str]]) -> None:
+        """
+        Рассылка одной корзины получателей с сохранением прогресса.
+        """
+        last_user_id, done = await self.checkpoint.get(run_id)
+        if done:
+            return
+
+        slots = asyncio.Semaphore(self.concurrency)
+        # Получатели в порядке обхода и их отправки (None — отправлять нечего)
+        queue: Deque[Tuple[int, Optional[asyncio.Task]]] = deque()
+        saved_user_id, saved_at, unsaved = last_user_id, time.monotonic(), 0
+        finished = False
+
+        try:
+            # Курсор по корзине реестра в порядке id: после перезапуска продолжаем после last_user_id
+            for user_id in self.registry.digest_recipients(tz_name, minute, after=last_user_id):
+                user = self.registry.get(user_id)
+                task = None
+                if user is not None and user.notifications and user.has_location:
+                    text = await self._render(user, rendered)
+                    if text is not None:
+                        await slots.acquire()
+                        task = asyncio.create_task(self._deliver(user_id, text, slots))
+                queue.append((user_id, task))
+
+                # Курсор сдвигаем только до первой незавершённой отправки: все id до него включительно обработаны
+                while queue and (queue[0][1] is None or queue[0][1].done()):
+                    last_user_id = queue.popleft()[0]
+                    unsaved += 1
+                if unsaved and (unsaved >= DIGEST_CHECKPOINT_EVERY
+                                or time.monotonic() - saved_at >= DIGEST_CHECKPOINT_INTERVAL):
+                    await self.checkpoint.mark(run_id, last_user_id)
+                    saved_user_id, saved_at, unsaved = last_user_id, time.monotonic(), 0
+
+            await asyncio.gather(*(task for _, task in queue if task is not None))
+            if queue:
+                last_user_id = queue[-1][0]
+            finished = True
+        finally:
+            if not finished:
+                # Остановка посреди рассылки: сохраняем, до кого дошли, остальное уйдёт после перезапуска
+                pending = [task for _, task in queue if task is not None and not task.done()]
+                for task in pending:
+                    task.cancel()
+                if pending:
+                    await asyncio.gather(*pending, return_exceptions=True)
+                while queue and (queue[0][1] is None or not queue[0][1].cancelled()):
+                    last_user_id = queue.popleft()[0]
+                if last_user_id != saved_user_id:
+                    await self.checkpoint.mark(run_id, last_user_id)
+
+        await self.checkpoint.mark(run_id, last_user_id, done=True)
+
+    async def run_minute(self, moment: datetime) -> None:
+        """
+        Все рассылки, у которых местное время отправки совпадает с moment (UTC).
+        """
+        rendered: Dict[Tuple[Tuple[int, int], str], Optional[str]] = {}
+        for tz_name in sorted(self.registry.digest_timezones()):
+            zone = self._zone(tz_name)
+            if zone is None:
+                continue
+            local = moment.astimezone(zone)
+            minute = local.hour * 60 + local.minute
+            if self.registry.digest_count(tz_name, minute):
+                run_id = f"{local.date().isoformat()}|{tz_name}|{minute}"
+                await self.run_bucket(run_id, tz_name, minute, rendered)
+
+    async def _loop(self) -> None:
+        # После перезапуска досылаем пропущенные минуты (завершённые рассылки отмечены в checkpoint)
+        current = datetime.now(timezone.utc).replace(second=0, microsecond=0)
+        last_done = current - timedelta(minutes=DIGEST_CATCHUP_MINUTES + 1)
+        while True:
+            current = datetime.now(timezone.utc).replace(second=0, microsecond=0)
+            while last_done < current:
+                last_done += timedelta(minutes=1)
+                try:
+                    await self.run_minute(last_done)
+                except Exception as e:
+                    logger.error(f"Ошибка утренней рассылки за {last_done:%H:%M} UTC: {e}")
+            next_minute = current + timedelta(minutes=1)
+            await asyncio.sleep(max(0.0, (next_minute - datetime.now(timezone.utc)).total_seconds()))
+
+    async def start(self, bot: Bot) -> None:
+        self.bot = bot
+        await self.checkpoint.open()
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.checkpoint.close()
+
+    def stats(self) -> dict:
+        return {
+            "sent": self.sent,
+            "failed": self.failed,
+            "rendered": self.rendered,
+            "timezones": len(self.registry.digest_timezones()),
+        }
+
+
+# Общий рассыльщик для бота
+digest_broadcaster = DigestBroadcaster(weather_service, user_registry, DigestCheckpoint(), weather_messages)
@@ -0,0 +1,262 @@
+"""
+Колоночная модель прогноза и агрегация по дням.
+
+Ответ /forecast (40 записей по 3 часа) разбирается один раз в ForecastSeries:
+каждое поле лежит в своём типизированном массиве (array или, если установлен
+и включён, numpy). Форматтеры больше не ходят по вложенным словарям, а читают
+готовые агрегаты по дням, посчитанные за один проход.
+"""
+
+import os
+from array import array
+from datetime import date, datetime, timezone, timedelta
+from typing import Optional, Dict, Iterable, List, Any, Tuple
+
+from .models import Forecast
+
+try:
+    import numpy as np
+except ImportError:  # numpy — необязательная зависимость
+    np = None
+
+
+# "array" (по умолчанию) или "numpy" — если numpy установлен
+FORECAST_BACKEND = os.getenv("FORECAST_BACKEND", "array")
+
+_NO_DESCRIPTION = "Нет описания"
+
+# Запись прогноза: (dt, temp, feels_like, humidity, wind, condition, description)
+Row = Tuple[int, float, float, int, float, int, str]
+
+
+def _response_row(entry: Dict[str, Any]) -> Row:
+    main = entry.get("main", {})
+    weather = (entry.get("weather") or [{}])[0]
+    return (int(entry.get("dt", 0)), main.get("temp", 0), main.get("feels_like", 0), main.get("humidity", 0),
+            entry.get("wind", {}).get("speed", 0), weather.get("id", 0),
+            weather.get("description", _NO_DESCRIPTION))
+
+
+class ForecastSeries:
+    """
+    Прогноз в колоночном виде: i-й элемент каждой колонки — i-я запись прогноза.
+    """
+    __slots__ = ("timestamps", "temp", "feels_like", "humidity", "wind", "condition",
+                 "descriptions", "tz_offset", "city", "backend")
+
+    def __init__(self, timestamps, temp, feels_like, humidity, wind, condition,
+                 descriptions: Dict[int, str], tz_offset: int = 0, city: Optional[str] = None,
+                 backend: str = "array"):
+        self.timestamps = timestamps  # UTC, секунды
+        self.temp = temp
+        self.feels_like = feels_like
+        self.humidity = humidity
+        self.wind = wind
+        self.condition = condition  # id погодных условий OpenWeather (800 — ясно и т.д.)
+        self.descriptions = descriptions  # id условий -> текстовое описание
+        self.tz_offset = tz_offset  # смещение местного времени от UTC, секунды
+        self.city = city
+        self.backend = backend
+
+    def __len__(self) -> int:
+        return len(self.timestamps)
+
+    @classmethod
+    def from_rows(cls, rows: Iterable[Row], tz_offset: int = 0, city: Optional[str] = None,
+                  backend: str = FORECAST_BACKEND) -> "ForecastSeries":
+        """
+        Собирает колонки из записей (dt, temp, feels_like, humidity, wind, condition, description)
+        за один проход — общий путь для from_response и from_forecast.
+        """
+        timestamps = array("q")
+        temp = array("d")
+        feels_like = array("d")
+        humidity = array("B")
+        wind = array("d")
+        condition = array("H")
+        descriptions: Dict[int, str] = {}
+
+        for dt, row_temp, row_feels_like, row_humidity, row_wind, condition_id, description in rows:
+            timestamps.append(dt)
+            temp.append(row_temp)
+            feels_like.append(row_feels_like)
+            humidity.append(min(int(row_humidity), 255))
+            wind.append(row_wind)
+            condition.append(condition_id)
+            descriptions.setdefault(condition_id, description)
+
+        columns = (timestamps, temp, feels_like, humidity, wind, condition)
+        if backend == "numpy" and np is not None:
+            columns = tuple(np.frombuffer(column, dtype=column.typecode) for column in columns)
+        else:
+            backend = "array"
+        return cls(*columns, descriptions=descriptions, tz_offset=tz_offset, city=city, backend=backend)
+
+    @classmethod
+    def from_response(cls, data: Dict[str, Any], backend: str = FORECAST_BACKEND) -> "ForecastSeries":
+        """
+        Разбирает ответ /forecast за один проход.
+        """
+        city = data.get("city") or {}
+        return cls.from_rows(map(_response_row, data.get("list", ())), tz_offset=int(city.get("timezone", 0)),
+                             city=city.get("name"), backend=backend)
+
+    @classmethod
+    def from_forecast(cls, forecast: Forecast, backend: str = FORECAST_BACKEND) -> "ForecastSeries":
+        """
+        То же, что from_response, но из типизированной модели Forecast.
+        """
+        rows = ((entry.dt, entry.temp, entry.feels_like, entry.humidity, entry.wind_speed,
+                 entry.condition_id, entry.description) for entry in forecast.entries)
+        return cls.from_rows(rows, tz_offset=forecast.tz_offset, city=forecast.city, backend=backend)
+
+    def local_datetime(self, i: int) -> datetime:
+        return datetime.fromtimestamp(int(self.timestamps[i]) + self.tz_offset, tz=timezone.utc).replace(tzinfo=None)
+
+    def local_date(self, i: int) -> date:
+        return self.local_datetime(i).date()
+
+    def description(self, condition_id: int) -> str:
+        return self.descriptions.get(int(condition_id), _NO_DESCRIPTION)
+
+
+class DailyAggregate:
+    """
+    Сводка по отрезку прогноза (обычно по одному дню).
+    """
+    __slots__ = ("date", "count", "temp_min", "temp_max", "temp_mean", "feels_like_mean",
+                 "humidity_mean", "wind_max", "condition", "description")
+
+    def __init__(self, date, count, temp_min, temp_max, temp_mean, feels_like_mean,
+                 humidity_mean, wind_max, condition, description):
+        self.date = date
+        self.count = count
+        self.temp_min = temp_min
+        self.temp_max = temp_max
+        self.temp_mean = temp_mean
+        self.feels_like_mean = feels_like_mean
+        self.humidity_mean = humidity_mean
+        self.wind_max = wind_max
+        self.condition = condition
+        self.description = description
+
+
+class _Accumulator:
+    """
+    Накопитель для одного дня: min/max/сумма и счётчики условий (для моды).
+    """
+    __slots__ = ("date", "count", "temp_min", "temp_max", "temp_sum", "feels_sum",
+                 "humidity_sum", "wind_max", "conditions")
+
+    def __init__(self, day: Optional[date]):
+        self.date = day
+        self.count = 0
+        self.temp_min = float("inf")
+        self.temp_max = float("-inf")
+        self.temp_sum = 0.0
+        self.feels_sum = 0.0
+        self.humidity_sum = 0
+        self.wind_max = 0.0
+        self.conditions: Dict[int, int] = {}
+
+    def add(self, temp: float, feels_like: float, humidity: int, wind: float, condition: int) -> None:
+        self.count += 1
+        if temp < self.temp_min:
+            self.temp_min = temp
+        if temp > self.temp_max:
+            self.temp_max = temp
+        self.temp_sum += temp
+        self.feels_sum += feels_like
+        self.humidity_sum += humidity
+        if wind > self.wind_max:
+            self.wind_max = wind
+        self.conditions[condition] = self.conditions.get(condition, 0) + 1
+
+    def result(self, series: ForecastSeries) -> DailyAggregate:
+        # Мода: самое частое условие, при равенстве — встретившееся раньше
+        condition = max(self.conditions, key=self.conditions.__getitem__)
+        return DailyAggregate(
+            date=self.date,
+            count=self.count,
+            temp_min=self.temp_min,
+            temp_max=self.temp_max,
+            temp_mean=self.temp_sum / self.count,
+            feels_like_mean=self.feels_sum / self.count,
+            humidity_mean=self.humidity_sum / self.count,
+            wind_max=self.wind_max,
+            condition=condition,
+            description=series.description(condition),
+        )
+
+
+def _values(series: ForecastSeries):
+    # Для numpy переводим колонки в списки Python одним вызовом — так цикл ниже быстрее
+    if series.backend == "numpy":
+        return (series.timestamps.tolist(), series.temp.tolist(), series.feels_like.tolist(),
+                series.humidity.tolist(), series.wind.tolist(), series.condition.tolist())
+    return series.timestamps, series.temp, series.feels_like, series.humidity, series.wind, series.condition
+
+
+def aggregate_days(series: ForecastSeries) -> List[DailyAggregate]:
+    """
+    Сводки по дням (по местному времени) за один проход по колонкам.
+    Записи в прогнозе идут по времени, поэтому день заканчивается, как только меняется дата.
+    """
+    days: List[DailyAggregate] = []
+    current: Optional[_Accumulator] = None
+    current_day = None
+    offset = series.tz_offset
+
+    for ts, temp, feels_like, humidity, wind, condition in zip(*_values(series)):
+        day_number = (ts + offset) // 86400
+        if day_number != current_day:
+            if current is not None:
+                days.append(current.result(series))
+            current_day = day_number
+            current = _Accumulator(date(1970, 1, 1) + timedelta(days=day_number))
+        current.add(temp, feels_like, humidity, wind, condition)
+
+    if current is not None:
+        days.append(current.result(series))
+    return days
+
+
+def summarize(series: ForecastSeries, start: int = 0, stop: Optional[int] = None) -> Optional[DailyAggregate]:
+    """
+    Одна сводка по отрезку записей [start, stop) — например, ближайшие 24 часа.
+    """
+    stop = len(series) if stop is None else min(stop, len(series))
+    if start >= stop:
+        return None
+    accumulator = _Accumulator(series.local_date(start))
+    columns = _values(series)
+    for i in range(start, stop):
+        accumulator.add(columns[1][i], columns[2][i], columns[3][i], columns[4][i], columns[5][i])
+    return accumulator.result(series)
+
+
+def tomorrow(days: List[DailyAggregate]) -> Optional[DailyAggregate]:
+    """
+    Сводка на завтра: день после первого дня прогноза (прогноз начинается с текущего момента).
+    """
+    return days[1] if len(days) > 1 else None
+
+
+def rollup(days: List[DailyAggregate], count: int) -> List[DailyAggregate]:
+    """
+    Первые count дней прогноза (3 дня, неделя — сколько есть в ответе).
+    """
+    return days[:count]
+
+
+def as_series(data: Any) -> Optional[ForecastSeries]:
+    """
+    Принимает готовый ForecastSeries, модель Forecast или сырой ответ /forecast.
+    """
+    if isinstance(data, ForecastSeries):
+        return data
+    if isinstance(data, Forecast):
+        return ForecastSeries.from_forecast(data) if data.entries else None
+    if not data or not data.get("list"):
+        return None
+    return ForecastSeries.from_response(data)
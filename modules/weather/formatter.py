@@ -1,9 +1,15 @@
-async def format_current_weather(data: dict) -> str:
+from typing import Optional
+
+from .forecast_model import as_series, aggregate_days, summarize, tomorrow, rollup
+from .models import CurrentWeather
+
+
+async def format_current_weather(data) -> str:
     """
     Форматирует данные о текущей погоде для удобного отображения.
 
     Args:
-        data (dict): Словарь с данными о погоде.
+        data (dict | CurrentWeather): Ответ /weather или типизированная модель.
 
     Returns:
         str: Отформатированная строка с информацией о погоде.
@@ -11,15 +17,22 @@ async def format_current_weather(data: dict) -> str:
     if not data:
         return "Нет данных о погоде."
 
-    weather = data.get("weather", [{}])[0]
-    main = data.get("main", {})
-    wind = data.get("wind", {})
+    if isinstance(data, CurrentWeather):
+        description = data.description
+        temperature = data.temp
+        feels_like = data.feels_like
+        humidity = data.humidity
+        wind_speed = data.wind_speed
+    else:
+        weather = data.get("weather", [{}])[0]
+        main = data.get("main", {})
+        wind = data.get("wind", {})
 
-    description = weather.get("description", "Нет описания")
-    temperature = main.get("temp", 0)
-    feels_like = main.get("feels_like", 0)
-    humidity = main.get("humidity", 0)
-    wind_speed = wind.get("speed", 0)
+        description = weather.get("description", "Нет описания")
+        temperature = main.get("temp", 0)
+        feels_like = main.get("feels_like", 0)
+        humidity = main.get("humidity", 0)
+        wind_speed = wind.get("speed", 0)
 
     return (f"🌤️ Погода: {description}\n"
             f"🌡️ Температура: {temperature}°C\n"
@@ -28,112 +41,100 @@ async def format_current_weather(data: dict) -> str:
             f"🌬️ Скорость ветра: {wind_speed} м/с\n"
             f"📍 Москва, Россия")
 
-async def format_forecast(data: dict) -> str:
+async def format_forecast(data) -> str:
     """
     Форматирует данные о прогнозе погоды для удобного отображения.
 
     Args:
-        data (dict): Словарь с данными о прогнозе погоды.
+        data (dict | ForecastSeries): Ответ /forecast или уже разобранный прогноз.
 
     Returns:
         str: Отформатированная строка с информацией о прогнозе погоды.
     """
-    if not data or "list" not in data:
+    series = as_series(data)
+    if series is None:
         return "Нет данных о прогнозе погоды."
 
     forecast_lines = []
-    for entry in data["list"]:
-        dt_txt = entry.get("dt_txt", "Нет времени")
-        weather = entry.get("weather", [{}])[0]
-        main = entry.get("main", {})
-        wind = entry.get("wind", {})
-
-        description = weather.get("description", "Нет описания")
-        temperature = main.get("temp", 0)
-        humidity = main.get("humidity", 0)
-        wind_speed = wind.get("speed", 0)
-
+    for i in range(len(series)):
         forecast_lines.append(
-            (f"📅 {dt_txt}\n"
-             f"🌤️ Погода: {description}\n"
-             f"🌡️ Температура: {temperature}°C\n"
-             f"💧 Влажность: {humidity}%\n"
-             f"🌬️ Скорость ветра: {wind_speed} м/с\n")
+            (f"📅 {series.local_datetime(i):%Y-%m-%d %H:%M}\n"
+             f"🌤️ Погода: {series.description(series.condition[i])}\n"
+             f"🌡️ Температура: {series.temp[i]}°C\n"
+             f"💧 Влажность: {series.humidity[i]}%\n"
+             f"🌬️ Скорость ветра: {series.wind[i]} м/с\n")
         )
 
     return "\n".join(forecast_lines)
 
-async def format_weekly_forecast(data: dict) -> str:
+async def format_weekly_forecast(data, days: Optional[int] = None) -> str:
     """
     Форматирует данные о недельном прогнозе погоды для удобного отображения.
 
     Args:
-        data (dict): Словарь с данными о недельном прогнозе погоды.
+        data (dict | ForecastSeries): Ответ /forecast или уже разобранный прогноз.
+        days (int, optional): Сколько дней показать (например, 3). По умолчанию — все дни прогноза.
 
     Returns:
         str: Отформатированная строка с информацией о недельном прогнозе погоды.
     """
-    if not data or "list" not in data:
+    series = as_series(data)
+    if series is None:
         return "Нет данных о недельном прогнозе погоды."
 
-    daily_forecast = {}
-    for entry in data["list"]:
-        date = entry.get("dt_txt", "").split(" ")[0]
-        if date not in daily_forecast:
-            daily_forecast[date] = []
-        daily_forecast[date].append(entry)
+    daily = aggregate_days(series)
+    if days is not None:
+        daily = rollup(daily, days)
 
     forecast_lines = []
-    for date, entries in daily_forecast.items():
-        temps = [e.get("main", {}).get("temp", 0) for e in entries]
-        descriptions = [e.get("weather", [{}])[0].get("description", "Нет описания") for e in entries]
-        avg_temp = sum(temps) / len(temps) if temps else 0
-        common_description = max(set(descriptions), key=descriptions.count) if descriptions else "Нет описания"
-
+    for day in daily:
         forecast_lines.append(
-            (f"📅 {date}\n"
-             f"🌤️ Погода: {common_description}\n"
-             f"🌡️ Средняя температура: {avg_temp:.1f}°C\n")
+            (f"📅 {day.date.isoformat()}\n"
+             f"🌤️ Погода: {day.description}\n"
+             f"🌡️ Средняя температура: {day.temp_mean:.1f}°C\n")
         )
 
     return "\n".join(forecast_lines)
 
-async def format_tomorrow_weather(data: dict) -> str:
+async def format_tomorrow_weather(data) -> str:
     """
     Форматирует данные о погоде на завтра для удобного отображения.
 
     Args:
-        data (dict): Словарь с данными о прогнозе погоды.
+        data (dict | ForecastSeries): Ответ /forecast или уже разобранный прогноз.
 
     Returns:
         str: Отформатированная строка с информацией о погоде на завтра.
     """
-    if not data or "list" not in data:
+    series = as_series(data)
+    day = tomorrow(aggregate_days(series)) if series is not None else None
+    if day is None:
         return "Нет данных о погоде на завтра."
 
-    tomorrow_date = None
-    for entry in data["list"]:
-        dt_txt = entry.get("dt_txt", "")
-        if " " in dt_txt:
-            date_part = dt_txt.split(" ")[0]
-            if tomorrow_date is None:
-                tomorrow_date = date_part
-            elif date_part != tomorrow_date:
-                break
+    return (f"📅 Погода на завтра ({day.date.isoformat()}):\n"
+            f"🌤️ Погода: {day.description}\n"
+            f"🌡️ Температура: от {day.temp_min:.0f} до {day.temp_max:.0f}°C\n"
+            f"💧 Влажность: {day.humidity_mean:.0f}%\n"
+            f"🌬️ Скорость ветра: до {day.wind_max} м/с\n")
 
-        weather = entry.get("weather", [{}])[0]
-        main = entry.get("main", {})
-        wind = entry.get("wind", {})
 
-        description = weather.get("description", "Нет описания")
-        temperature = main.get("temp", 0)
-        humidity = main.get("humidity", 0)
-        wind_speed = wind.get("speed", 0)
+async def format_daily_digest(data) -> str:
+    """
+    Форматирует утреннюю сводку: погода на ближайшие сутки из прогноза.
+
+    Args:
+        data (dict | ForecastSeries): Ответ /forecast или уже разобранный прогноз.
 
-        return (f"📅 Погода на завтра ({tomorrow_date}):\n"
-                f"🌤️ Погода: {description}\n"
-                f"🌡️ Температура: {temperature}°C\n"
-                f"💧 Влажность: {humidity}%\n"
-                f"🌬️ Скорость ветра: {wind_speed} м/с\n")
+    Returns:
+        str: Отформатированная строка с утренней сводкой.
+    """
+    series = as_series(data)
+    # Ближайшие 24 часа (8 записей по 3 часа)
+    day = summarize(series, 0, 8) if series is not None else None
+    if day is None:
+        return "Нет данных о прогнозе погоды."
 
-    return "Нет данных о погоде на завтра."
\ No newline at end of file
+    return (f"☀️ Доброе утро! Погода на сегодня:\n"
+            f"🌤️ {day.description}\n"
+            f"🌡️ От {day.temp_min:.0f}°C до {day.temp_max:.0f}°C\n"
+            f"🌬️ Ветер до {day.wind_max} м/с")
@@ -1,70 +1,381 @@
 """
-Код для получения погодных данных по API OpenWeather. Возвращает только сырые данные.
+Код для получения погодных данных по API OpenWeather. Возвращает сырые данные
+или, если включено, типизированные модели из models.py.
 """
 
 import aiohttp
 import asyncio
-from typing import Optional, Dict, Any
-import logging
+import itertools
+import os
+import time
+from dataclasses import dataclass
+from typing import Optional, Dict, Any, Set, AsyncIterator, Iterable, List, Tuple
 
+from services.geo_index import ReverseGeocoder, distance_km, reverse_geocoder
+from services.http_client import HttpClient, http_client
+from utils.logger import logger
+from utils.metrics import upstream_latency
+from utils.cache import TTLCache
+from utils.fast_json import loads
+from utils.geo_grid import cell_key, cell_center
+from utils.single_flight import SingleFlight
+from utils.rate_limiter import Priority, PriorityRateLimiter, RateLimitTimeout
+from utils.resilience import CircuitBreaker, CircuitOpenError, RetryableError, RetryPolicy, parse_retry_after
+from services.openweather_quota import openweather_limiter, openweather_breaker
+from .forecast_model import ForecastSeries, as_series
+from .models import CurrentWeather, Forecast
+
+
+# Время жизни ответов в кэше по конечным точкам (секунды) и размер кэша
+CACHE_TTL = {
+    "weather": float(os.getenv("WEATHER_CACHE_TTL", "600")),
+    "forecast": float(os.getenv("FORECAST_CACHE_TTL", "1800")),
+}
+CACHE_MAX_SIZE = int(os.getenv("WEATHER_CACHE_SIZE", "5000"))
+# Хранить ответы в виде типизированных моделей (models.py) вместо словарей
+WEATHER_TYPED_MODELS = os.getenv("WEATHER_TYPED_MODELS", "0") == "1"
+
+# Модели ответов по конечным точкам
+RESPONSE_MODELS = {
+    "weather": CurrentWeather,
+    "forecast": Forecast,
+}
+
+# Сколько секунд ждёт ответа пользователь и сколько — фоновые запросы (предзагрузка, рассылка)
+WEATHER_DEADLINE = float(os.getenv("WEATHER_DEADLINE", "5"))
+WEATHER_BACKGROUND_DEADLINE = float(os.getenv("WEATHER_BACKGROUND_DEADLINE", "60"))
+# Таймаут одной попытки и количество повторов при временных сбоях (5xx, таймаут, сеть)
+WEATHER_ATTEMPT_TIMEOUT = float(os.getenv("WEATHER_ATTEMPT_TIMEOUT", "3"))
+WEATHER_RETRIES = int(os.getenv("WEATHER_RETRIES", "2"))
+# Через сколько секунд без ответа отправить второй, подстраховочный запрос (0 — не отправлять)
+WEATHER_HEDGE_AFTER = float(os.getenv("WEATHER_HEDGE_AFTER", "0"))
+# Сколько хранить последние данные на случай недоступности API
+WEATHER_STALE_TTL = float(os.getenv("WEATHER_STALE_TTL", str(3 * 3600)))
+# Сколько ждать свежих данных, прежде чем ответить последними известными
+WEATHER_STALE_WAIT = float(os.getenv("WEATHER_STALE_WAIT", "1"))
+# Пакетные запросы (fetch_many): городов в одном запросе group (0 — без group, максимум API — 20)
+# и сколько запросов к API одновременно
+WEATHER_GROUP_SIZE = min(int(os.getenv("WEATHER_GROUP_SIZE", "20")), 20)
+WEATHER_BATCH_CONCURRENCY = int(os.getenv("WEATHER_BATCH_CONCURRENCY", "8"))
+# Город из справочника заменяет центр ячейки в group, если он в этой ячейке и не дальше (км)
+WEATHER_GROUP_MAX_KM = float(os.getenv("WEATHER_GROUP_MAX_KM", "8"))
+
+Location = Tuple[float, float]
+Cell = Tuple[int, int]
+
+
+@dataclass(frozen=True, slots=True)
+class DataInfo:
+    """
+    Версия и свежесть закэшированных данных ячейки.
+    """
+    version: int
+    fetched_at: float  # time.time() получения ответа API
+    fresh_until: float  # time.monotonic(), после которого данные считаются устаревшими
+
+    @property
+    def stale(self) -> bool:
+        return time.monotonic() >= self.fresh_until
 
-# Логгер для модуля
-logging.basicConfig(level=logging.INFO)
-logger = logging.getLogger(__name__)
 
 class WeatherService:
     
-    def __init__(self, api_key: str, base_url: str = "https://api.openweathermap.org/data/2.5"):
+    def __init__(self,
+                 api_key: str,
+                 base_url: str = "https://api.openweathermap.org/data/2.5",
+                 client: HttpClient = http_client,
+                 timeout: Optional[float] = None,
+                 cache: Optional[TTLCache] = None,
+                 limiter: PriorityRateLimiter = openweather_limiter,
+                 typed_models: bool = WEATHER_TYPED_MODELS,
+                 breaker: CircuitBreaker = openweather_breaker,
+                 retry: Optional[RetryPolicy] = None,
+                 geocoder: ReverseGeocoder = reverse_geocoder):
         """
         Инициализация сервиса 
         
         :param API_KEY: API ключ для OpenWeather
         :param base_url: Базовый URL для API
+        :param client: Общий HTTP-клиент (пул соединений на всё приложение)
+        :param timeout: Таймаут одного запроса в секундах. По умолчанию — таймауты клиента.
+        :param cache: Кэш ответов. По умолчанию у каждого сервиса свой TTLCache.
+        :param limiter: Ограничитель частоты запросов (общий на API-ключ)
+        :param typed_models: Возвращать CurrentWeather/Forecast вместо словарей
+        :param breaker: Выключатель запросов к API (общий на API-ключ)
+        :param retry: Политика повторов. По умолчанию — из настроек WEATHER_*.
+        :param geocoder: Справочник городов: по нему ячейки сопоставляются с id городов для запроса group.
         """
 
         self.api_key = api_key
         self.base_url = base_url.rstrip("/")
-        self.session: Optional[aiohttp.ClientSession] = None # Инициализация сессии будет отложена до первого запроса
+        self.client = client
+        self.timeout = aiohttp.ClientTimeout(total=timeout) if timeout else client.timeout
+        self.cache = cache if cache is not None else TTLCache(max_size=CACHE_MAX_SIZE)
+        # Одинаковые одновременные запросы к API выполняются один раз
+        self._inflight = SingleFlight()
+        # Разобранные прогнозы: {ячейка: (сырой ответ, ForecastSeries)}
+        self._series = TTLCache(max_size=CACHE_MAX_SIZE, default_ttl=CACHE_TTL["forecast"])
+        self.limiter = limiter
+        self.typed_models = typed_models
+        # Последние известные данные: отдаются, пока API недоступен (stale-while-revalidate)
+        self._stale = TTLCache(max_size=CACHE_MAX_SIZE, default_ttl=WEATHER_STALE_TTL)
+        # Версия и свежесть данных в кэше: {ключ кэша: DataInfo}. Версия меняется при каждом
+        # новом ответе API, по ней кэш готовых сообщений (rendered.py) понимает, что текст устарел.
+        # Живёт и вытесняется вместе с последними известными данными, иначе росла бы без предела
+        self._info = TTLCache(max_size=CACHE_MAX_SIZE, default_ttl=WEATHER_STALE_TTL)
+        self._version_seq = itertools.count(1)
+        # Повторы, подстраховочные запросы и выключатель (общий для всех запросов к OpenWeather)
+        self.breaker = breaker
+        self.retry = retry if retry is not None else RetryPolicy(
+            retries=WEATHER_RETRIES,
+            attempt_timeout=WEATHER_ATTEMPT_TIMEOUT,
+            hedge_after=WEATHER_HEDGE_AFTER,
+            breaker=breaker
+        )
+        # Фоновые обновления после ответа устаревшими данными
+        self._background: Set[asyncio.Task] = set()
+        self.stale_served = 0
+        self.geocoder = geocoder
 
     async def __aenter__(self):
-        # Инициализация сессии при входе в контекст
-        self.session = aiohttp.ClientSession()
+        # Сессия общая и живёт вместе с приложением — здесь ничего не открываем
         return self
     
     async def __aexit__(self, exc_type, exc_value, traceback):
-        # Закрытие сессии при выходе из контекста
         await self.close()
 
-    async def _fetch(self, endpoint: str, params: Dict[str, str]) -> Optional[Dict[str, Any]]:
+    async def _fetch(self,
+                     endpoint: str,
+                     params: Dict[str, str],
+                     priority: int = Priority.INTERACTIVE,
+                     deadline: Optional[float] = None,
+                     cache_key: Optional[tuple] = None) -> Optional[Dict[str, Any]]:
         """
         Вспомогательный метод для выполнения GET-запросов к API.
         :param endpoint: Конечная точка API (например, "weather", "forecast").
         :param params: Параметры запроса.
+        :param priority: Приоритет в очереди к API (интерактивные запросы раньше фоновых).
+        :param deadline: Момент по time.monotonic(), после которого ответ уже не нужен.
+        :param cache_key: Ключ, под которым сохранить ответ в кэш (один раз на реальный запрос).
         :return: Ответ API в виде словаря или None в случае ошибки.
         """
-        
-        if not self.session:
-            self.session = aiohttp.ClientSession()
+
+        # Ключ нормализованного запроса: одинаковые endpoint + параметры делят один запрос к API.
+        # Приоритет входит в ключ, чтобы пользователь не ждал в очереди за фоновым запросом.
+        key = (endpoint, priority, tuple(sorted((k, str(v)) for k, v in params.items() if k != "appid")))
+        return await self._inflight.do(key, lambda: self._request(endpoint, dict(params), priority, deadline, cache_key))
+
+    async def _request(self,
+                       endpoint: str,
+                       params: Dict[str, str],
+                       priority: int = Priority.INTERACTIVE,
+                       deadline: Optional[float] = None,
+                       cache_key: Optional[tuple] = None) -> Optional[Dict[str, Any]]:
+        """
+        Выполняет запрос к API (без объединения одинаковых запросов): с повторами
+        при временных сбоях, подстраховочным запросом для пользователя и выключателем.
+        """
 
         params["appid"] = self.api_key
+        if deadline is None:
+            deadline = time.monotonic() + (WEATHER_DEADLINE if priority == Priority.INTERACTIVE
+                                           else WEATHER_BACKGROUND_DEADLINE)
 
         try:
-            async with self.session.get(f"{self.base_url}/{endpoint}", params=params) as response:
+            data = await self.retry.call(
+                lambda timeout: self._attempt(endpoint, params, priority, deadline, timeout),
+                deadline,
+                # Подстраховка стоит лишнего запроса к API — только когда ждёт пользователь
+                hedge=priority == Priority.INTERACTIVE
+            )
+        except CircuitOpenError as e:
+            logger.warning(f"OpenWeather: {e}")
+            return None
+        except RetryableError as e:
+            logger.error(f"Запрос {endpoint} к OpenWeather не удался: {e}")
+            return None
+
+        if data is not None and cache_key is not None:
+            self._store(cache_key, endpoint, data)
+        return data
+
+    async def _attempt(self,
+                       endpoint: str,
+                       params: Dict[str, str],
+                       priority: int,
+                       deadline: float,
+                       timeout: Optional[float]) -> Optional[Any]:
+        """
+        Одна попытка запроса к API.
+        Временные сбои (5xx, таймаут, ошибка сети) — RetryableError, остальные ошибки — None.
+        """
+
+        started = None
+        outcome = "error"
+
+        try:
+            # Ждём свой токен в общем лимите запросов к OpenWeather
+            await self.limiter.acquire(priority, deadline)
+            # Время запроса считаем без ожидания в очереди лимита
+            started = time.perf_counter()
+            # Таймаут попытки не дальше дедлайна: часть времени могла уйти на очередь лимита
+            total = min(t for t in (self.timeout.total, timeout, deadline - time.monotonic()) if t is not None)
+            request_timeout = aiohttp.ClientTimeout(total=max(total, 0.001), connect=self.timeout.connect,
+                                                    sock_read=self.timeout.sock_read)
+            async with self.client.session.get(f"{self.base_url}/{endpoint}", params=params, timeout=request_timeout) as response:
                 if response.status == 200:
-                    return await response.json()
+                    # Читаем тело байтами и разбираем быстрым парсером (orjson, если установлен)
+                    data = loads(await response.read())
+                    model = RESPONSE_MODELS.get(endpoint) if self.typed_models else None
+                    if model is not None:
+                        data = model.from_payload(data)
+                    outcome = "ok"
+                    return data
+                elif response.status == 429:
+                    outcome = "rate_limited"
+                    # Лимит тарифа всё-таки превышен — притормаживаем все запросы к API
+                    retry_after = parse_retry_after(response.headers.get("Retry-After"), 60)
+                    self.limiter.pause(retry_after)
+                    logger.error(f"Превышен лимит запросов OpenWeather, пауза {retry_after} с")
+                    return None
                 else:
+                    outcome = f"http_{response.status}"
                     error_message = await response.text()
+                    if response.status >= 500:
+                        logger.warning(f"Ошибка API: {response.status}: {error_message}")
+                        raise RetryableError(f"HTTP {response.status}")
                     logger.error(f"Ошибка API: {response.status}: {error_message}")
                     return None
                 
+        except RateLimitTimeout as e:
+            logger.error(f"⏱ {e}")
+        except RetryableError:
+            raise
         except asyncio.TimeoutError:
-            logger.error("⏱ Таймаут при запросе к OpenWeather")
+            outcome = "timeout"
+            logger.warning("⏱ Таймаут при запросе к OpenWeather")
+            raise RetryableError("таймаут запроса") from None
         except aiohttp.ClientError as e:
-            logger.error(f"🌐 Ошибка клиента: {e}")
+            outcome = "client_error"
+            logger.warning(f"🌐 Ошибка клиента: {e}")
+            raise RetryableError(f"ошибка сети: {e}") from e
+        except asyncio.CancelledError:
+            # Проигравший подстраховочный запрос или ожидание, которое больше не нужно
+            outcome = "cancelled"
+            raise
         except Exception as e:
             logger.error(f"❌ Неизвестная ошибка: {e}")
+        finally:
+            if started is not None:
+                upstream_latency.labels("openweather", endpoint, outcome).observe(time.perf_counter() - started)
 
         return None
+
+    async def _fetch_cached(self,
+                            endpoint: str,
+                            lat: float,
+                            lon: float,
+                            units: str,
+                            lang: str,
+                            priority: int = Priority.INTERACTIVE,
+                            deadline: Optional[float] = None,
+                            refresh: bool = False) -> Optional[Dict[str, Any]]:
+        """
+        Запрос с кэшированием по ячейке сетки координат.
+        Все пользователи из одной ячейки получают один и тот же ответ, а запрос
+        к API идёт по координатам центра ячейки.
+        При refresh=True кэш не читается, а обновляется свежим ответом.
+        """
+        cell = cell_key(lat, lon)
+        key = (endpoint, cell, units, lang)
+
+        cell_lat, cell_lon = cell_center(cell)
+        params = {
+            "lat": cell_lat,
+            "lon": cell_lon,
+            "units": units,
+            "lang": lang
+        }
+
+        if not refresh:
+            data = self.cache.get(key)
+            if data is not None:
+                return data
+            stale = self._stale.get(key)
+            if stale is not None:
+                return await self._revalidate(endpoint, params, key, stale, priority, deadline)
+
+        return await self._fetch(endpoint, params, priority, deadline, cache_key=key)
+
+    async def _revalidate(self,
+                          endpoint: str,
+                          params: Dict[str, str],
+                          key: tuple,
+                          stale: Any,
+                          priority: int,
+                          deadline: Optional[float]) -> Any:
+        """
+        Stale-while-revalidate: свежие данные протухли, но есть последние известные.
+        Если API отвечает быстро, возвращает свежий ответ. Если медленно или API
+        недоступен — сразу последние данные (data_info покажет, что они устарели),
+        а запрос продолжается в фоне и обновит кэш, когда ответ придёт.
+        """
+        if self.breaker.is_open:
+            self.stale_served += 1
+            return stale
+
+        # У фонового обновления свой, длинный дедлайн: пользователь его уже не ждёт
+        task = asyncio.ensure_future(self._fetch(endpoint, params, priority,
+                                                 time.monotonic() + WEATHER_BACKGROUND_DEADLINE, cache_key=key))
+        self._background.add(task)
+        task.add_done_callback(self._forget)
+
+        wait = WEATHER_STALE_WAIT if deadline is None else min(WEATHER_STALE_WAIT, max(0.0, deadline - time.monotonic()))
+        done, _ = await asyncio.wait({task}, timeout=wait)
+        # Фоновый запрос могли отменить (остановка бота): тогда exception() сам бросил бы CancelledError
+        if done and not task.cancelled() and task.exception() is None and task.result() is not None:
+            return task.result()
+        self.stale_served += 1
+        return stale
+
+    def _forget(self, task: asyncio.Task) -> None:
+        self._background.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logger.error(f"Фоновое обновление погоды не удалось: {task.exception()}")
+
+    def _store(self, key: tuple, endpoint: str, data: Any) -> None:
+        """
+        Сохраняет свежий ответ в кэш и выдаёт ему новую версию.
+        Копия живёт дольше — на случай, если API станет недоступен.
+        """
+        ttl = CACHE_TTL.get(endpoint, self.cache.default_ttl)
+        self.cache.set(key, data, ttl=ttl)
+        self._stale.set(key, data)
+        self._info.set(key, DataInfo(next(self._version_seq), time.time(), time.monotonic() + ttl))
+
+    def data_version(self,
+                     endpoint: str,
+                     lat: float,
+                     lon: float,
+                     units: str = "metric",
+                     lang: str = "ru") -> Optional[int]:
+        """
+        Версия закэшированных данных для ячейки или None, если данных ещё не было.
+        Меняется каждый раз, когда в кэш попадает новый ответ API.
+        """
+        info = self._info.get((endpoint, cell_key(lat, lon), units, lang))
+        return info.version if info is not None else None
+
+    def data_info(self,
+                  endpoint: str,
+                  lat: float,
+                  lon: float,
+                  units: str = "metric",
+                  lang: str = "ru") -> Optional["DataInfo"]:
+        """
+        Версия, время получения и свежесть данных для ячейки или None, если данных ещё не было.
+        """
+        return self._info.get((endpoint, cell_key(lat, lon), units, lang))
     
     # ================= Методы для получения различных типов погодных данных ================= #
          
@@ -73,7 +384,9 @@ class WeatherService:
                                   lat: float,
                                   lon: float,
                                   units: str = "metric",
-                                  lang: str = "ru") -> Optional[Dict[str, Any]]:
+                                  lang: str = "ru",
+                                  priority: int = Priority.INTERACTIVE,
+                                  deadline: Optional[float] = None) -> Optional[Dict[str, Any]]:
         """
         Получение текущей погоды по координатам.
 
@@ -82,6 +395,8 @@ class WeatherService:
             lon (float): Долгота.
             units (str, optional): Единицы измерения. По умолчанию "metric".
             lang (str, optional): Язык ответа. По умолчанию "ru".
+            priority (int, optional): Приоритет запроса к API. По умолчанию интерактивный.
+            deadline (float, optional): Момент по time.monotonic(), после которого ответ не нужен.
 
         Returns:
             Optional[Dict[str, Any]]: Словарь с данными о погоде или None в случае ошибки.
@@ -92,27 +407,23 @@ class WeatherService:
             logger.error("Некорректные координаты.")
             return None
         
-        # Параметры для API-запроса
-        params = {
-            "lat": lat,
-            "lon": lon,
-            "units": units,
-            "lang": lang
-        }
-
-        return await self._fetch("weather", params)
+        return await self._fetch_cached("weather", lat, lon, units, lang, priority, deadline)
 
     async def get_forecast(self,
                                    lat: float,
                                    lon: float,
                                    units: str = "metric",
-                                   lang: str = "ru") -> Optional[Dict[str, Any]]:
+                                   lang: str = "ru",
+                                   priority: int = Priority.INTERACTIVE,
+                                   deadline: Optional[float] = None) -> Optional[Dict[str, Any]]:
         """
         Получение прогноза погоды на 5 дней с шагом 3 часа по координатам.
         Args:
             lat (float): Широта.
             lon (float): Долгота.
             units (str, optional): Единицы измерения. По умолчанию "metric".
+            priority (int, optional): Приоритет запроса к API. По умолчанию интерактивный.
+            deadline (float, optional): Момент по time.monotonic(), после которого ответ не нужен.
         Returns:
             Optional[Dict[str, Any]]: Словарь с данными о прогнозе погоды или None в случае ошибки.
         """
@@ -122,20 +433,227 @@ class WeatherService:
             logger.error("Некорректные координаты.")
             return None
         
-        params = {
-            "lat": lat,
-            "lon": lon,
-            "units": units,
-            "lang": lang
-        }
-
-        return await self._fetch("forecast", params)
+        return await self._fetch_cached("forecast", lat, lon, units, lang, priority, deadline)
     
         
+    async def get_forecast_series(self,
+                                  lat: float,
+                                  lon: float,
+                                  units: str = "metric",
+                                  lang: str = "ru",
+                                  priority: int = Priority.INTERACTIVE,
+                                  deadline: Optional[float] = None) -> Optional[ForecastSeries]:
+        """
+        Прогноз в колоночном виде (ForecastSeries). Ответ разбирается один раз:
+        пока в кэше лежит тот же сырой ответ, возвращается уже разобранный прогноз.
+        """
+        data = await self.get_forecast(lat, lon, units, lang, priority, deadline)
+        if data is None:
+            return None
+
+        key = (cell_key(lat, lon), units, lang)
+        cached = self._series.get(key)
+        if cached is not None and cached[0] is data:
+            return cached[1]
+
+        series = as_series(data)
+        if series is None:
+            return None
+        self._series.set(key, (data, series))
+        return series
+
+    async def refresh(self,
+                      endpoint: str,
+                      lat: float,
+                      lon: float,
+                      units: str = "metric",
+                      lang: str = "ru") -> bool:
+        """
+        Фоновое обновление кэша для ячейки (используется предзагрузкой).
+        Запрос идёт с фоновым приоритетом и не мешает пользователям.
+
+        :param endpoint: "weather" или "forecast".
+        :return: True, если данные обновлены.
+        """
+        data = await self._fetch_cached(endpoint, lat, lon, units, lang, priority=Priority.BACKGROUND, refresh=True)
+        return data is not None
+
+    # ================= Пакетные запросы по многим точкам ================= #
+
+    def _group_cities(self, cells: Iterable[Cell]) -> Dict[Cell, int]:
+        """
+        Ячейки, погоду которых можно взять из запроса group: в ячейке есть город
+        из справочника недалеко от её центра. id городов GeoNames совпадают с id OpenWeather.
+        """
+        cities = {}
+        for cell in cells:
+            lat, lon = cell_center(cell)
+            place = self.geocoder.nearest(lat, lon, WEATHER_GROUP_MAX_KM)
+            if place is not None and cell_key(place.lat, place.lon) == cell:
+                cities[cell] = place.geoname_id
+        return cities
+
+    async def _fetch_group(self,
+                           cities: Dict[int, Cell],
+                           units: str,
+                           lang: str,
+                           priority: int,
+                           deadline: Optional[float]) -> Dict[Cell, Any]:
+        """
+        Текущая погода для нескольких городов одним запросом /group.
+        Сохраняет ответы в кэш по ячейкам, как обычный запрос /weather.
+
+        :param cities: {id города: ячейка}.
+        :return: {ячейка: данные} для городов, которые API вернул.
+        """
+        params = {"id": ",".join(map(str, cities)), "units": units, "lang": lang}
+        data = await self._fetch("group", params, priority, deadline)
+        if not isinstance(data, dict):
+            return {}
+
+        found = {}
+        for item in data.get("list", ()):
+            cell = cities.get(item.get("id"))
+            coord = item.get("coord") or {}
+            if cell is None or "lat" not in coord or "lon" not in coord:
+                continue
+            # Город с таким id у OpenWeather оказался в другом месте — эту ячейку запросим по координатам
+            if distance_km(*cell_center(cell), coord["lat"], coord["lon"]) > WEATHER_GROUP_MAX_KM:
+                continue
+            # Запись group — тот же ответ, что у /weather, только смещение часового пояса лежит в sys
+            item.setdefault("timezone", (item.get("sys") or {}).get("timezone", 0))
+            if self.typed_models:
+                item = CurrentWeather.from_payload(item)
+            self._store(("weather", cell, units, lang), "weather", item)
+            found[cell] = item
+        return found
+
+    async def fetch_many(self,
+                         endpoint: str,
+                         locations: Iterable[Location],
+                         units: str = "metric",
+                         lang: str = "ru",
+                         priority: int = Priority.BACKGROUND,
+                         deadline: Optional[float] = None,
+                         refresh: bool = False,
+                         concurrency: int = WEATHER_BATCH_CONCURRENCY) -> AsyncIterator[Tuple[Location, Optional[Any]]]:
+        """
+        Погода ("weather") или прогноз ("forecast") для многих точек сразу.
+
+        Точки из одной ячейки сетки делят один ответ; ответы из кэша отдаются
+        сразу. Текущая погода для ячеек с городом из справочника запрашивается
+        пачками по WEATHER_GROUP_SIZE городов через /group, остальные ячейки —
+        по одной, не больше concurrency запросов одновременно.
+
+        :param locations: Точки (широта, долгота).
+        :param refresh: Не читать кэш, а обновить его свежими ответами (для предзагрузки).
+        :return: Асинхронный поток пар (точка, данные или None) по мере готовности —
+            по одной паре на каждую переданную точку, в произвольном порядке.
+        """
+        cells: Dict[Cell, List[Location]] = {}
+        for location in locations:
+            lat, lon = location
+            if not (-90 <= lat <= 90) or not (-180 <= lon <= 180):
+                logger.error(f"Некорректные координаты: {location}")
+                yield location, None
+                continue
+            cells.setdefault(cell_key(lat, lon), []).append(location)
+
+        pending = []
+        for cell, members in cells.items():
+            data = None if refresh else self.cache.get((endpoint, cell, units, lang))
+            if data is None:
+                pending.append(cell)
+                continue
+            for location in members:
+                yield location, data
+        if not pending:
+            return
+
+        results: asyncio.Queue = asyncio.Queue()
+        semaphore = asyncio.Semaphore(concurrency)
+        tasks: Set[asyncio.Task] = set()
+
+        def spawn(coro) -> None:
+            task = asyncio.ensure_future(coro)
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+
+        async def single(cell: Cell) -> None:
+            data = None
+            try:
+                async with semaphore:
+                    data = await self._fetch_cached(endpoint, *cell_center(cell), units, lang, priority, deadline, refresh)
+            except Exception as e:
+                logger.error(f"Ошибка пакетного запроса {endpoint} для ячейки {cell}: {e}")
+            finally:
+                results.put_nowait((cell, data))
+
+        async def group(cities: Dict[int, Cell]) -> None:
+            found: Dict[Cell, Any] = {}
+            try:
+                async with semaphore:
+                    found = await self._fetch_group(cities, units, lang, priority, deadline)
+            except Exception as e:
+                logger.error(f"Ошибка запроса group к OpenWeather: {e}")
+            for cell in cities.values():
+                if cell in found:
+                    results.put_nowait((cell, found[cell]))
+                else:
+                    # Город не вернулся или запрос не удался — запрашиваем ячейку по координатам
+                    spawn(single(cell))
+
+        by_city = self._group_cities(pending) if endpoint == "weather" and WEATHER_GROUP_SIZE > 0 else {}
+        # Один город в ячейке — не повод для group: обычный запрос /weather ничем не хуже
+        if len(by_city) < 2:
+            by_city = {}
+        chunk: Dict[int, Cell] = {}
+        for cell in pending:
+            if cell not in by_city:
+                spawn(single(cell))
+                continue
+            chunk[by_city[cell]] = cell
+            if len(chunk) == WEATHER_GROUP_SIZE:
+                spawn(group(chunk))
+                chunk = {}
+        if chunk:
+            spawn(group(chunk))
+
+        try:
+            for _ in range(len(pending)):
+                cell, data = await results.get()
+                for location in cells[cell]:
+                    yield location, data
+        finally:
+            # Потребитель бросил поток раньше — недоделанные запросы не нужны
+            for task in list(tasks):
+                task.cancel()
+
     async def close(self):
         """
-        Закрытие сессии.
+        Общая сессия закрывается вместе с приложением (http_client.close()), а не сервисом.
+        """
+
+    def cache_stats(self) -> Dict[str, Any]:
+        """
+        Счётчики кэша: попадания, промахи, вытеснения.
+        """
+        return self.cache.stats()
+
+    def inflight_stats(self) -> Dict[str, Any]:
+        """
+        Счётчики объединения запросов: выполнено, присоединились к идущим.
+        """
+        return self._inflight.stats()
+
+    def resilience_stats(self) -> Dict[str, Any]:
+        """
+        Повторы, подстраховочные запросы, состояние выключателя и ответы устаревшими данными.
+        """
+        return {**self.retry.stats(), "breaker": self.breaker.state, "stale_served": self.stale_served}
+
+    def limiter_stats(self) -> Dict[str, Any]:
+        """
+        Состояние лимита запросов: оставшийся запас, глубина очереди, время ожидания.
         """
-        if self.session:
-            await self.session.close()
-            self.session = None
\ No newline at end of file
+        return self.limiter.stats()
\ No newline at end of file
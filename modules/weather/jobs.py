@@ -0,0 +1,22 @@
+"""
+Фоновые задачи модуля погоды: предзагрузка кэша и утренняя рассылка.
+Запускаются реестром модулей (services/module_registry.py) только в процессе,
+которому положены фоновые задачи.
+"""
+
+from aiogram import Bot
+
+from .digest import digest_broadcaster
+from .prefetch import weather_prefetcher
+
+
+async def start(bot: Bot) -> None:
+    # Фоновое обновление погоды для всех ячеек, где есть пользователи
+    weather_prefetcher.start()
+    # Утренняя рассылка прогноза подписчикам по их местному времени
+    await digest_broadcaster.start(bot)
+
+
+async def stop() -> None:
+    await digest_broadcaster.stop()
+    await weather_prefetcher.stop()
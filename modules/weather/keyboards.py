@@ -2,20 +2,43 @@
 Клавиатуры для модуля погоды.
 """
 
+from typing import Literal
+
+from aiogram.filters.callback_data import CallbackData
 from aiogram.types import (
     InlineKeyboardMarkup,
     InlineKeyboardButton
 )
 
+from services.callback_router import legacy_callbacks
+
+
+class WeatherView(CallbackData, prefix="weather"):
+    """
+    Данные кнопки прогноза: "weather:<вид>", вид — ключ кэша готовых текстов.
+    """
+    view: Literal["now", "tomorrow", "3_days", "week"]
+
+
+# Кнопки в сообщениях, отправленных до перехода на CallbackData (убрать через релиз).
+# Префикс "weather_for_" указан и в manifest.json, чтобы такие нажатия загружали модуль
+legacy_callbacks({
+    "weather_for_today": WeatherView(view="now"),
+    "weather_for_tomorrow": WeatherView(view="tomorrow"),
+    "weather_for_3_days": WeatherView(view="3_days"),
+    "weather_for_week": WeatherView(view="week"),
+})
+
+
 def get_weather_menu() -> InlineKeyboardMarkup:
     """
-    Возвращает клавиатуру с кнопкой для получения прогноза погоды.
+    Возвращает клавиатуру с кнопками прогнозов погоды (по одной в строке).
     """
     return InlineKeyboardMarkup(
         inline_keyboard=[
-            InlineKeyboardButton(text="Погода на сегодня", callback_data="weather_for_today"),
-            InlineKeyboardButton(text="Погода на завтра", callback_data="weather_for_tomorrow"),
-            InlineKeyboardButton(text="Погода на 3 дня", callback_data="weather_for_3_days"),
-            InlineKeyboardButton(text="Погода на неделю", callback_data="weather_for_week")
+            [InlineKeyboardButton(text="Погода на сегодня", callback_data=WeatherView(view="now").pack())],
+            [InlineKeyboardButton(text="Погода на завтра", callback_data=WeatherView(view="tomorrow").pack())],
+            [InlineKeyboardButton(text="Погода на 3 дня", callback_data=WeatherView(view="3_days").pack())],
+            [InlineKeyboardButton(text="Погода на неделю", callback_data=WeatherView(view="week").pack())],
         ]
-    )
\ No newline at end of file
+    )
@@ -1,25 +1,45 @@
 #import asyncio
-import logging
 
 from config import OPENWEATHER_API_KEY
 
-from aiogram import Router, F
+from aiogram.filters import Command
 from aiogram.types import Message, CallbackQuery
 
+from services.callback_router import CallbackRouter
+from services.user_registry import user_registry
+from utils.logger import logger
+from utils.metrics import metrics
+
 #from .handlers import weather_handlers
-from .keyboards import get_weather_menu
-from formatter import (
-    format_current_weather,
-    format_tomorrow_weather,
-    format_weekly_forecast
-)
+from .keyboards import WeatherView, get_weather_menu
+
+from .get_weather import WeatherService
+from .rendered import RenderedMessageCache
+
+weather_router = CallbackRouter()
+
+# Точка для тех, чьё местоположение неизвестно (не зарегистрирован или не указал город)
+DEFAULT_LOCATION = (55.7558, 37.6176)  # Москва
 
-from services import WeatherService
+# Один сервис на всё приложение: запросы идут через общий HTTP-клиент (services.http_client)
+weather_service = WeatherService(OPENWEATHER_API_KEY)
+# Готовые тексты ответов, общие для всех пользователей из одной ячейки
+weather_messages = RenderedMessageCache(weather_service)
 
-weather_router = Router()
+metrics.gauge("bot_weather_cache_entries", "Записей в кэше погоды", lambda: len(weather_service.cache))
+metrics.gauge("bot_weather_cache_hit_ratio", "Доля попаданий в кэш погоды",
+              lambda: weather_service.cache_stats()["hit_ratio"])
+metrics.gauge("bot_openweather_queue_depth", "Запросов в очереди к лимиту OpenWeather",
+              lambda: weather_service.limiter_stats()["queue_depth"])
+metrics.gauge("bot_openweather_budget", "Запас токенов лимита OpenWeather",
+              lambda: weather_service.limiter_stats()["budget"])
+metrics.gauge("bot_openweather_breaker_open", "Выключатель запросов к OpenWeather разомкнут (1) или нет (0)",
+              lambda: float(weather_service.breaker.is_open))
+metrics.gauge("bot_weather_stale_served", "Ответов последними известными данными, пока API недоступен",
+              lambda: weather_service.stale_served)
 
 # /weather команда для получения прогноза погоды
-@weather_router.message(commands=["weather"])
+@weather_router.message(Command("weather"))
 async def cmd_weather(message: Message):
     await message.answer(
         "Выберите, какой прогноз погоды вы хотите получить:",
@@ -29,36 +49,29 @@ async def cmd_weather(message: Message):
 
 
 # Обработчики inline-кнопок для прогноза погоды
-@weather_router.callback_query(F.data.startswith("weather_"))
-async def process_weather_callback(callback: CallbackQuery):
+@weather_router.callback_query(WeatherView.filter())
+async def process_weather_callback(callback: CallbackQuery, callback_data: WeatherView):
     """Обрабатывает нажатия на кнопки прогноза погоды."""
 
-    lat, lon = 55.7558, 37.6176  # Москва по умолчанию
+    # Местоположение и язык — из реестра: та же ячейка сетки, что обновляет предзагрузка
+    user = user_registry.get(callback.from_user.id)
+    lat, lon = (user.lat, user.lon) if user is not None and user.has_location else DEFAULT_LOCATION
+    lang = (user.language if user is not None else None) or "ru"
 
     try:
-        async with WeatherService(OPENWEATHER_API_KEY) as weather_service:
-            if callback.data == "weather_for_today":
-                raw_data = await weather_service.get_current_weather(lat, lon)
-                weather_info = format_current_weather(raw_data)
-            
-            elif callback.data == "weather_for_tomorrow":
-                raw_data = await weather_service.get_weather_for_tomorrow(lat, lon)
-                weather_info = format_tomorrow_weather(raw_data)
-            
-            elif callback.data == "weather_for_3_days":
-                raw_data = await weather_service.get_weather_for_3_days(lat, lon)
-                weather_info = format_weekly_forecast(raw_data)
-            
-            elif callback.data == "weather_for_week":
-                raw_data = await weather_service.get_weather_for_week(lat, lon)
-                weather_info = format_weekly_forecast(raw_data)
-            else:
-                weather_info = "Неизвестный тип прогноза."
+        # Неизвестный вид отсекается ещё при разборе данных кнопки (WeatherView)
+        weather_info = await weather_messages.render(callback_data.view, lat, lon, lang=lang)
 
         await callback.message.edit_text(weather_info)
     
     except Exception as e:
-        logging.error(f"Ошибка при получении прогноза погоды: {e}")
+        logger.error(f"Ошибка при получении прогноза погоды: {e}")
         await callback.message.edit_text("Произошла ошибка при получении данных 😢")
 
-    await callback.answer()
\ No newline at end of file
+    await callback.answer()
+
+
+# /city, /now, /tomorrow, /hourly — в конце: city.py берёт weather_messages из этого модуля
+from .city import city_router  # noqa: E402
+
+weather_router.include_router(city_router)
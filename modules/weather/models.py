@@ -0,0 +1,101 @@
+"""
+Неизменяемые типизированные модели ответов OpenWeather.
+
+Из ответа берутся только поля, которые использует бот, поэтому закэшированная
+модель занимает в разы меньше памяти, чем полное дерево словарей из JSON.
+"""
+
+from dataclasses import dataclass
+from typing import Any, Dict, Optional, Tuple
+
+
+_NO_DESCRIPTION = "Нет описания"
+
+
+def _condition(payload: Dict[str, Any]) -> Tuple[int, str]:
+    weather = (payload.get("weather") or [{}])[0]
+    return weather.get("id", 0), weather.get("description", _NO_DESCRIPTION)
+
+
+@dataclass(frozen=True, slots=True)
+class CurrentWeather:
+    """
+    Текущая погода (ответ /weather).
+    """
+    name: Optional[str]
+    dt: int
+    tz_offset: int
+    temp: float
+    feels_like: float
+    humidity: int
+    wind_speed: float
+    condition_id: int
+    description: str
+    lat: Optional[float] = None
+    lon: Optional[float] = None
+
+    @classmethod
+    def from_payload(cls, payload: Dict[str, Any]) -> "CurrentWeather":
+        main = payload.get("main", {})
+        coord = payload.get("coord", {})
+        condition_id, description = _condition(payload)
+        return cls(
+            name=payload.get("name"),
+            dt=int(payload.get("dt", 0)),
+            tz_offset=int(payload.get("timezone", 0)),
+            temp=main.get("temp", 0),
+            feels_like=main.get("feels_like", 0),
+            humidity=main.get("humidity", 0),
+            wind_speed=payload.get("wind", {}).get("speed", 0),
+            condition_id=condition_id,
+            description=description,
+            lat=coord.get("lat"),
+            lon=coord.get("lon"),
+        )
+
+
+@dataclass(frozen=True, slots=True)
+class ForecastEntry:
+    """
+    Одна запись прогноза (шаг 3 часа).
+    """
+    dt: int
+    temp: float
+    feels_like: float
+    humidity: int
+    wind_speed: float
+    condition_id: int
+    description: str
+
+    @classmethod
+    def from_payload(cls, payload: Dict[str, Any]) -> "ForecastEntry":
+        main = payload.get("main", {})
+        condition_id, description = _condition(payload)
+        return cls(
+            dt=int(payload.get("dt", 0)),
+            temp=main.get("temp", 0),
+            feels_like=main.get("feels_like", 0),
+            humidity=main.get("humidity", 0),
+            wind_speed=payload.get("wind", {}).get("speed", 0),
+            condition_id=condition_id,
+            description=description,
+        )
+
+
+@dataclass(frozen=True, slots=True)
+class Forecast:
+    """
+    Прогноз на 5 дней (ответ /forecast).
+    """
+    city: Optional[str]
+    tz_offset: int
+    entries: Tuple[ForecastEntry, ...]
+
+    @classmethod
+    def from_payload(cls, payload: Dict[str, Any]) -> "Forecast":
+        city = payload.get("city") or {}
+        return cls(
+            city=city.get("name"),
+            tz_offset=int(city.get("timezone", 0)),
+            entries=tuple(ForecastEntry.from_payload(entry) for entry in payload.get("list", ())),
+        )
@@ -0,0 +1,273 @@
+"""
+Фоновая предзагрузка погоды к тому времени, когда пользователи её попросят.
+
+Погода нужна к местному утру и к минуте утренней рассылки, а не круглые
+сутки. Раз в интервал собираем из реестра пользователей пары (ячейка сетки,
+язык), у которых по местному времени скоро рассылка (не дальше
+PREFETCH_LEAD минут) или идёт утро (PREFETCH_MORNING), и обновляем для них
+кэш WeatherService до того, как его кто-то попросит. Первыми обновляются
+ячейки, где нужный момент ближе всего.
+
+Ячейки обновляются пачками (WeatherService.fetch_many: текущая погода для
+городов — одним запросом /group на пачку), пачки равномерно размазаны по
+интервалу, запросы идут с фоновым приоритетом. На предзагрузку уходит не
+больше PREFETCH_BUDGET_SHARE лимита запросов к OpenWeather за интервал —
+остальное остаётся пользователям и рассылке.
+"""
+
+import asyncio
+import math
+import os
+import random
+import time
+from datetime import datetime, timezone
+from typing import Optional, Dict, List, Tuple
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+from services.user_registry import UserRegistry, user_registry
+from utils.geo_grid import cell_center
+from utils.logger import logger
+
+from .get_weather import WeatherService, CACHE_TTL, WEATHER_GROUP_SIZE
+from .main import weather_service
+
+
+# Обновляем данные, когда прошло столько от их времени жизни в кэше
+REFRESH_AT = float(os.getenv("WEATHER_PREFETCH_REFRESH_AT", "0.8"))
+# Как часто пересобирать список ячеек (секунды). По умолчанию — чтобы обновление
+# успевало до того, как текущая погода уйдёт из кэша
+PREFETCH_INTERVAL = float(os.getenv("WEATHER_PREFETCH_INTERVAL", str(CACHE_TTL["weather"] * (1 - REFRESH_AT))))
+# Сколько ячеек обновлять за один шаг цикла (по умолчанию — сколько городов влезает в один запрос /group)
+PREFETCH_BATCH = max(1, int(os.getenv("WEATHER_PREFETCH_BATCH", str(WEATHER_GROUP_SIZE or 1))))
+# За сколько минут до рассылки (и до утра) начинать обновлять погоду
+PREFETCH_LEAD = int(os.getenv("WEATHER_PREFETCH_LEAD", "30"))
+# Местное утро, когда погоду смотрят чаще всего: "начало-конец"
+PREFETCH_MORNING = os.getenv("WEATHER_PREFETCH_MORNING", "06:00-10:00")
+# Доля лимита запросов к OpenWeather, которую может занять предзагрузка
+PREFETCH_BUDGET_SHARE = float(os.getenv("WEATHER_PREFETCH_BUDGET_SHARE", "0.5"))
+
+CellKey = Tuple[Tuple[int, int], str]
+
+
+def _minute(value: str) -> int:
+    """
+    "07:30" -> 450 (минута суток).
+    """
+    hours, minutes = value.split(":")
+    return (int(hours) * 60 + int(minutes)) % 1440
+
+
+MORNING_START, MORNING_END = (_minute(value) for value in PREFETCH_MORNING.split("-"))
+
+
+def minutes_until(local: int, minute: int) -> int:
+    """
+    Сколько минут от local до ближайшего наступления minute (минуты суток).
+    """
+    return (minute - local) % 1440
+
+
+def morning_lead(local: int) -> Optional[int]:
+    """
+    Минут до утра, если до него не дальше PREFETCH_LEAD; 0 — утро уже идёт; None — не утро.
+    """
+    if minutes_until(MORNING_START, local) <= minutes_until(MORNING_START, MORNING_END):
+        return 0
+    lead = minutes_until(local, MORNING_START)
+    return lead if lead <= PREFETCH_LEAD else None
+
+
+def request_cost(endpoint: str, cells: int) -> int:
+    """
+    Сколько запросов к API уйдёт на обновление cells ячеек (текущая погода — пачками /group).
+    """
+    if endpoint == "weather" and WEATHER_GROUP_SIZE > 0:
+        return math.ceil(cells / WEATHER_GROUP_SIZE)
+    return cells
+
+
+class WeatherPrefetcher:
+    """
+    Планировщик фонового обновления погоды по ячейкам сетки.
+    """
+
+    def __init__(self, service: WeatherService, registry: UserRegistry, interval: float = PREFETCH_INTERVAL):
+        self.service = service
+        self.registry = registry
+        self.interval = interval
+        self._task: Optional[asyncio.Task] = None
+        self._zones: Dict[str, Optional[ZoneInfo]] = {}
+
+        # Когда последний раз обновляли: {(endpoint, ячейка, язык): time.monotonic()}
+        self._refreshed_at: Dict[Tuple[str, Tuple[int, int], str], float] = {}
+
+        # Метрики последнего цикла
+        self.cells = 0
+        self.refreshed = 0
+        self.failed = 0
+        self.skipped = 0
+        self.budget = 0
+        self.spent = 0
+        self.cycle_duration = 0.0
+        self.cycle_lag = 0.0
+
+    def _zone(self, name: str) -> Optional[ZoneInfo]:
+        if name not in self._zones:
+            try:
+                self._zones[name] = ZoneInfo(name)
+            except (ZoneInfoNotFoundError, ValueError):
+                logger.error(f"Неизвестный часовой пояс в настройках пользователей: {name}")
+                self._zones[name] = None
+        return self._zones[name]
+
+    def collect_cells(self, moment: Optional[datetime] = None) -> Dict[CellKey, int]:
+        """
+        Пары (ячейка сетки, язык), которым скоро понадобится погода.
+
+        :param moment: Момент (UTC), по умолчанию — сейчас.
+        :return: {(ячейка, язык): минут до ближайшей рассылки или утра у её пользователей}.
+        """
+        moment = moment or datetime.now(timezone.utc)
+        # {часовой пояс: (местная минута суток, минут до утра)} — один расчёт на пояс за цикл
+        local: Dict[str, Tuple[int, Optional[int]]] = {}
+        due: Dict[CellKey, int] = {}
+        # Сводка реестра по (ячейка, язык, пояс, минута рассылки): проход по ней, а не по всем пользователям
+        for cell, language, tz_name, digest_minute in self.registry.schedule():
+            if tz_name not in local:
+                zone = self._zone(tz_name)
+                now = moment.astimezone(zone) if zone is not None else moment
+                minute = now.hour * 60 + now.minute
+                local[tz_name] = minute, morning_lead(minute)
+            minute, lead = local[tz_name]
+            if digest_minute is not None:
+                until_digest = minutes_until(minute, digest_minute)
+                if until_digest <= PREFETCH_LEAD and (lead is None or until_digest < lead):
+                    lead = until_digest
+            if lead is None:
+                continue
+            key = (cell, language or "ru")
+            if lead < due.get(key, PREFETCH_LEAD + 1):
+                due[key] = lead
+        return due
+
+    def _is_stale(self, endpoint: str, cell: Tuple[int, int], lang: str, now: float) -> bool:
+        refreshed_at = self._refreshed_at.get((endpoint, cell, lang))
+        return refreshed_at is None or now - refreshed_at >= CACHE_TTL[endpoint] * REFRESH_AT
+
+    async def _refresh_batch(self, cells: List[Tuple[int, int]], lang: str) -> None:
+        for endpoint in ("weather", "forecast"):
+            now = time.monotonic()
+            # {центр ячейки: ячейка} — fetch_many возвращает те же точки, что получил
+            stale = {cell_center(cell): cell for cell in cells if self._is_stale(endpoint, cell, lang, now)}
+            if not stale:
+                continue
+            cost = request_cost(endpoint, len(stale))
+            if self.spent + cost > self.budget:
+                self.skipped += len(stale)
+                continue
+            self.spent += cost
+            async for location, data in self.service.fetch_many(endpoint, stale, lang=lang, refresh=True):
+                if data is not None:
+                    self._refreshed_at[(endpoint, stale[location], lang)] = time.monotonic()
+                    self.refreshed += 1
+                else:
+                    self.failed += 1
+
+    @staticmethod
+    def _batches(cells: List[CellKey]) -> List[Tuple[List[Tuple[int, int]], str]]:
+        """
+        Пачки до PREFETCH_BATCH ячеек с одним языком (язык — параметр запроса к API),
+        в порядке cells.
+        """
+        by_lang: Dict[str, List[Tuple[int, int]]] = {}
+        for cell, lang in cells:
+            by_lang.setdefault(lang, []).append(cell)
+        batches = [(group[i:i + PREFETCH_BATCH], lang)
+                   for lang, group in by_lang.items()
+                   for i in range(0, len(group), PREFETCH_BATCH)]
+        # Пачки разных языков — по очереди, начиная с самых срочных ячеек
+        order = {key: position for position, key in enumerate(cells)}
+        return sorted(batches, key=lambda batch: order[batch[0][0], batch[1]])
+
+    async def run_cycle(self) -> None:
+        """
+        Один проход по ячейкам, которым скоро понадобится погода, равномерно растянутый на интервал.
+        """
+        started = time.monotonic()
+        due = self.collect_cells()
+        # Сначала ячейки, где рассылка или утро ближе всего
+        cells = sorted(due, key=lambda key: (due[key], key))
+        self.cells = len(cells)
+        self.refreshed = self.failed = self.skipped = self.spent = 0
+        self.budget = int(self.service.limiter.rate * self.interval * PREFETCH_BUDGET_SHARE)
+
+        # Забываем ячейки, которым погода пока не нужна: к следующему разу данные всё равно устареют
+        for key in [k for k in self._refreshed_at if (k[1], k[2]) not in due]:
+            del self._refreshed_at[key]
+
+        batches = self._batches(cells)
+        if batches:
+            step = self.interval / len(batches)
+            # Случайный сдвиг, чтобы несколько процессов не стартовали синхронно
+            await asyncio.sleep(random.uniform(0, step))
+            for i, (batch, lang) in enumerate(batches):
+                try:
+                    await self._refresh_batch(batch, lang)
+                except Exception as e:
+                    self.failed += 1
+                    logger.error(f"Ошибка предзагрузки погоды для ячеек {batch[0]}…{batch[-1]}: {e}")
+                # Следующая пачка — по расписанию, а не сразу
+                delay = started + (i + 1) * step - time.monotonic()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+
+        self.cycle_duration = time.monotonic() - started
+        # Насколько цикл не уложился в интервал (например, упёрлись в лимит API)
+        self.cycle_lag = max(0.0, self.cycle_duration - self.interval)
+        logger.info(
+            f"Предзагрузка погоды: ячеек {self.cells}, обновлено {self.refreshed}, ошибок {self.failed}, "
+            f"не хватило лимита {self.skipped}, запросов {self.spent} из {self.budget}, "
+            f"цикл {self.cycle_duration:.1f} с, отставание {self.cycle_lag:.1f} с"
+        )
+
+    async def _loop(self) -> None:
+        while True:
+            started = time.monotonic()
+            try:
+                await self.run_cycle()
+            except Exception as e:
+                logger.error(f"Ошибка цикла предзагрузки погоды: {e}")
+            await asyncio.sleep(max(0.0, self.interval - (time.monotonic() - started)))
+
+    def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def stats(self) -> dict:
+        now = time.monotonic()
+        oldest = min(self._refreshed_at.values(), default=None)
+        return {
+            "cells": self.cells,
+            "refreshed": self.refreshed,
+            "failed": self.failed,
+            "skipped": self.skipped,
+            "budget": self.budget,
+            "spent": self.spent,
+            "cycle_duration": self.cycle_duration,
+            "cycle_lag": self.cycle_lag,
+            # Возраст самых старых предзагруженных данных
+            "max_data_age": now - oldest if oldest is not None else 0.0,
+        }
+
+
+# Общий планировщик для бота
+weather_prefetcher = WeatherPrefetcher(weather_service, user_registry)
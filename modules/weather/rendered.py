@@ -0,0 +1,132 @@
+"""
+Кэш готовых текстов ответов о погоде.
+
+Все пользователи из одной ячейки сетки видят одинаковый текст, поэтому
+сообщение форматируется один раз на (ячейку, вид, единицы, язык) и
+переиспользуется. Вместе с текстом хранится версия данных, из которых он
+собран (WeatherService.data_version): как только в кэше погоды появляется
+свежий ответ API, версия меняется и текст собирается заново.
+
+Если API недоступен и сервис ответил последними известными данными,
+к тексту добавляется пометка, насколько они устарели.
+"""
+
+import os
+import time
+from functools import partial
+from typing import Optional, Dict, Any, Callable, Awaitable, Tuple
+
+from utils.cache import TTLCache
+from utils.geo_grid import cell_key
+from utils.rate_limiter import Priority
+
+from .formatter import (
+    format_current_weather,
+    format_tomorrow_weather,
+    format_weekly_forecast,
+    format_forecast,
+    format_daily_digest
+)
+from .get_weather import WeatherService, CACHE_TTL, WEATHER_STALE_TTL
+
+
+RENDER_CACHE_SIZE = int(os.getenv("WEATHER_RENDER_CACHE_SIZE", "20000"))
+
+# Вид сообщения -> (конечная точка API с данными, форматтер)
+VIEWS: Dict[str, Tuple[str, Callable[[Any], Awaitable[str]]]] = {
+    "now": ("weather", format_current_weather),
+    "tomorrow": ("forecast", format_tomorrow_weather),
+    "3_days": ("forecast", partial(format_weekly_forecast, days=3)),
+    "week": ("forecast", format_weekly_forecast),
+    "hourly": ("forecast", format_forecast),
+    "digest": ("forecast", format_daily_digest),
+}
+
+
+def stale_note(fetched_at: float) -> str:
+    """
+    Пометка для текста из устаревших данных: сколько минут назад они получены.
+    """
+    minutes = max(1, int((time.time() - fetched_at) // 60))
+    return (f"\n\n⚠️ Данные получены {minutes} мин. назад: сервис погоды сейчас не отвечает, "
+            f"обновим автоматически.")
+
+
+class RenderedMessageCache:
+    """
+    Готовые тексты сообщений: {(ячейка, вид, единицы, язык): (версия данных, текст)}.
+    """
+
+    def __init__(self, service: WeatherService, max_size: int = RENDER_CACHE_SIZE):
+        self.service = service
+        self.cache = TTLCache(max_size=max_size, default_ttl=max(CACHE_TTL.values()))
+
+        # Метрики
+        self.rendered = 0
+        self.reused = 0
+
+    async def _load(self, endpoint: str, lat: float, lon: float, units: str, lang: str,
+                    priority: int, deadline: Optional[float]) -> Any:
+        if endpoint == "weather":
+            return await self.service.get_current_weather(lat, lon, units, lang, priority, deadline)
+        return await self.service.get_forecast_series(lat, lon, units, lang, priority, deadline)
+
+    async def render(self,
+                     view: str,
+                     lat: float,
+                     lon: float,
+                     units: str = "metric",
+                     lang: str = "ru",
+                     priority: int = Priority.INTERACTIVE,
+                     deadline: Optional[float] = None) -> str:
+        """
+        Текст сообщения вида view для точки (lat, lon).
+
+        :param view: Вид сообщения — ключ VIEWS ("now", "tomorrow", "3_days", "week", "hourly", "digest").
+        :return: Готовый текст. Если данных нет, — текст форматтера об их отсутствии (не кэшируется).
+        """
+        endpoint = VIEWS[view][0]
+        data = await self._load(endpoint, lat, lon, units, lang, priority, deadline)
+        return await self.render_loaded(view, data, lat, lon, units, lang)
+
+    async def render_loaded(self,
+                            view: str,
+                            data: Any,
+                            lat: float,
+                            lon: float,
+                            units: str = "metric",
+                            lang: str = "ru") -> str:
+        """
+        То же, что render, но из уже полученных данных (например, рассылка сама
+        запросила прогноз): в сервис погоды второй раз не ходим.
+        Вызывать сразу после получения data, без await между ними, — иначе
+        версия данных в сервисе может оказаться уже другой.
+        """
+        endpoint, formatter = VIEWS[view]
+        if data is None:
+            return await formatter(None)
+
+        # Версию читаем сразу после получения данных: между ними нет await,
+        # поэтому она относится именно к этим данным
+        info = self.service.data_info(endpoint, lat, lon, units, lang)
+        version = info.version if info is not None else None
+        # Пометку об устаревших данных не кэшируем: её текст зависит от текущего времени
+        note = stale_note(info.fetched_at) if info is not None and info.stale else ""
+        key = (cell_key(lat, lon), view, units, lang)
+        cached = self.cache.get(key)
+        if cached is not None and cached[0] == version:
+            self.reused += 1
+            return cached[1] + note
+
+        text = await formatter(data)
+        # Текст нужен, пока сервис может отдавать эти данные — в том числе устаревшими
+        self.cache.set(key, (version, text), ttl=CACHE_TTL[endpoint] + WEATHER_STALE_TTL)
+        self.rendered += 1
+        return text + note
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self.cache),
+            "rendered": self.rendered,
+            "reused": self.reused,
+        }
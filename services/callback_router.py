@@ -0,0 +1,334 @@
+"""
+Маршрутизация нажатий inline-кнопок по префиксу callback-данных.
+
+Данные кнопок описываются типизированными классами aiogram CallbackData
+("help:weather", "weather:now", "gender:m"): префикс, затем поля через ":".
+
+Обычный роутер aiogram перебирает обработчики callback_query по очереди и для
+каждого прогоняет фильтры. CallbackRouter индексирует обработчики по префиксу
+их CallbackData: нажатие разбирается один раз, и проверяются только
+обработчики этого префикса, сколько бы их ни было у роутера.
+
+Роутеры aiogram обходит тоже по очереди. setup_callback_index(dispatcher)
+собирает индексы всех CallbackRouter в одну таблицу префиксов на уровне
+Dispatcher: нажатие сразу попадает к роутеру-владельцу префикса, сколько бы
+роутеров ни было подключено. Корневые фильтры роутеров на пути к владельцу
+проверяются как обычно. Нажатия без префикса из таблицы (и префиксы роутеров
+с собственными внешними middleware) идут обычным обходом роутеров.
+
+Некорректные данные отсекаются до обработчиков:
+- длиннее 64 байт (Telegram такие не присылает — значит, подделка);
+- префикс роутера, но данные не разбираются по его CallbackData;
+- префикс роутера, но ни один обработчик не подошёл (например, кнопка
+  анкеты, когда анкета уже заполнена).
+На такие нажатия бот отвечает коротким уведомлением, и дальше по роутерам
+апдейт не идёт. Префикс принадлежит одному роутеру.
+
+Использование — как у обычного роутера:
+    class HelpTopic(CallbackData, prefix="help"):
+        topic: str
+
+    help_router = CallbackRouter()
+
+    @help_router.callback_query(HelpTopic.filter())
+    async def process_help(callback: CallbackQuery, callback_data: HelpTopic): ...
+
+Старые строковые данные кнопок из уже отправленных сообщений ("help_weather")
+переводятся в новые через legacy_callbacks({"help_weather": HelpTopic(topic="weather")}).
+"""
+
+from collections import Counter
+from typing import Any, Dict, List, Optional, Tuple, Type
+
+from aiogram import Dispatcher, Router
+from aiogram.dispatcher.event.bases import UNHANDLED, SkipHandler
+from aiogram.dispatcher.event.handler import CallbackType, FilterObject, HandlerObject
+from aiogram.dispatcher.event.telegram import TelegramEventObserver
+from aiogram.filters import Filter
+from aiogram.filters.callback_data import MAX_CALLBACK_LENGTH, CallbackData, CallbackQueryFilter
+from aiogram.types import CallbackQuery
+from magic_filter import MagicFilter
+
+from utils.logger import logger
+from utils.metrics import metrics
+
+
+# Ответ на отклонённое нажатие (всплывает вверху чата)
+REJECTED_TEXT = "Кнопка больше не действует"
+
+# {причина: сколько нажатий отклонено} — общий счётчик всех CallbackRouter
+callback_rejections: Counter = Counter()
+
+# Старые данные кнопок -> новые: {"confirm_yes": "confirm:yes"}
+_legacy: Dict[str, str] = {}
+
+# Версия дерева CallbackRouter: меняется, когда роутер подключается или у него появляется обработчик.
+# По ней таблица префиксов Dispatcher понимает, что её пора пересобрать (например, после загрузки модуля)
+_tree_version = 0
+
+
+def _touch() -> None:
+    global _tree_version
+    _tree_version += 1
+
+
+def legacy_callbacks(aliases: Dict[str, CallbackData]) -> None:
+    """
+    Регистрирует старые строковые данные кнопок как синонимы новых.
+
+    Кнопки в уже отправленных сообщениях и состояние FSM переживают обновление
+    бота: пользователь, застрявший на шаге анкеты, должен суметь её закончить.
+    """
+    for old, new in aliases.items():
+        _legacy[old] = new.pack()
+
+
+async def _reject(event: CallbackQuery, reason: str) -> str:
+    callback_rejections[reason] += 1
+    logger.debug(f"Нажатие отклонено ({reason}): {event.data!r}")
+    try:
+        await event.answer(REJECTED_TEXT)
+    except Exception as e:
+        logger.error(f"Не удалось ответить на отклонённое нажатие: {e}")
+    return reason
+
+
+def _oversized(data: str) -> bool:
+    # Длина в символах не меньше длины в байтах: кодируем только короткие строки
+    return len(data) > MAX_CALLBACK_LENGTH or len(data.encode()) > MAX_CALLBACK_LENGTH
+
+
+class CallbackRule(Filter):
+    """
+    Правило из CallbackData.filter(rule) над уже разобранными данными.
+
+    Заменяет CallbackQueryFilter в индексированных обработчиках: данные
+    разбираются один раз в IndexedCallbackObserver.trigger, а не каждым фильтром.
+    """
+
+    __slots__ = ("rule",)
+
+    def __init__(self, rule: Optional[MagicFilter]):
+        self.rule = rule
+
+    async def __call__(self, callback: CallbackQuery, callback_data: Optional[CallbackData] = None) -> bool:
+        return callback_data is not None and (self.rule is None or bool(self.rule.resolve(callback_data)))
+
+
+class IndexedCallbackObserver(TelegramEventObserver):
+    """
+    Наблюдатель callback_query с индексом обработчиков по префиксу CallbackData.
+
+    Обработчики без фильтра CallbackData (например, только по состоянию FSM)
+    получают нажатия с чужими префиксами и без данных, в порядке регистрации.
+    """
+
+    def __init__(self, router: Router, event_name: str = "callback_query"):
+        super().__init__(router=router, event_name=event_name)
+        # {префикс: (класс данных, обработчики)}
+        self._index: Dict[str, Tuple[Type[CallbackData], List[HandlerObject]]] = {}
+        # Разделители префиксов (обычно только ":")
+        self._separators: List[str] = []
+        self._fallback: List[HandlerObject] = []
+
+    def register(self,
+                 callback: CallbackType,
+                 *filters: CallbackType,
+                 flags: Optional[Dict[str, Any]] = None,
+                 **kwargs: Any) -> CallbackType:
+        super().register(callback, *filters, flags=flags, **kwargs)
+        handler = self.handlers[-1]
+
+        data_filter = next((f for f in handler.filters if isinstance(f.callback, CallbackQueryFilter)), None)
+        if data_filter is None:
+            self._fallback.append(handler)
+            return callback
+
+        data_class = data_filter.callback.callback_data
+        prefix = data_class.__prefix__
+        indexed = self._index.get(prefix)
+        if indexed is not None and indexed[0] is not data_class:
+            raise ValueError(f"Префикс callback-данных {prefix!r} уже занят классом {indexed[0].__name__}")
+        if indexed is None:
+            indexed = self._index[prefix] = (data_class, [])
+            if data_class.__separator__ not in self._separators:
+                self._separators.append(data_class.__separator__)
+
+        handler.filters[handler.filters.index(data_filter)] = FilterObject(CallbackRule(data_filter.callback.rule))
+        indexed[1].append(handler)
+        _touch()
+        return callback
+
+    @property
+    def prefixes(self) -> List[str]:
+        return list(self._index)
+
+    def _lookup(self, data: str) -> Optional[Tuple[Type[CallbackData], List[HandlerObject]]]:
+        for separator in self._separators:
+            indexed = self._index.get(data.partition(separator)[0])
+            if indexed is not None:
+                return indexed
+        return None
+
+    async def _run(self, handlers: List[HandlerObject], event: CallbackQuery, kwargs: Dict[str, Any]) -> Any:
+        # Тот же порядок, что в TelegramEventObserver.trigger: фильтры, затем middleware и обработчик
+        for handler in handlers:
+            kwargs["handler"] = handler
+            result, data = await handler.check(event, **kwargs)
+            if result:
+                kwargs.update(data)
+                try:
+                    wrapped_inner = self.outer_middleware.wrap_middlewares(self._resolve_middlewares(), handler.call)
+                    return await wrapped_inner(event, kwargs)
+                except SkipHandler:
+                    continue
+        return UNHANDLED
+
+    async def dispatch(self, indexed: Tuple[Type[CallbackData], List[HandlerObject]],
+                       event: CallbackQuery, data: str, kwargs: Dict[str, Any]) -> Any:
+        """
+        Разбор данных и обработчики префикса (indexed — из _lookup).
+        """
+        data_class, handlers = indexed
+        try:
+            kwargs["callback_data"] = data_class.unpack(data)
+        except (TypeError, ValueError):
+            return await _reject(event, "malformed")
+
+        result = await self._run(handlers, event, kwargs)
+        if result is UNHANDLED:
+            return await _reject(event, "unmatched")
+        return result
+
+    async def trigger(self, event: CallbackQuery, **kwargs: Any) -> Any:
+        data = event.data
+        if data is None:
+            return await self._run(self._fallback, event, kwargs)
+        if _oversized(data):
+            return await _reject(event, "oversized")
+
+        data = _legacy.get(data, data)
+        indexed = self._lookup(data)
+        if indexed is None:
+            return await self._run(self._fallback, event, kwargs)
+        return await self.dispatch(indexed, event, data, kwargs)
+
+
+class DispatcherCallbackObserver(TelegramEventObserver):
+    """
+    Наблюдатель callback_query у Dispatcher: одна таблица префиксов всех CallbackRouter.
+
+    Собственные обработчики Dispatcher (если есть) проверяются первыми, как обычно.
+    """
+
+    def __init__(self, router: Router, event_name: str = "callback_query"):
+        super().__init__(router=router, event_name=event_name)
+        # {префикс: (наблюдатель роутера-владельца, наблюдатели роутеров на пути к нему сверху вниз)}
+        self._table: Dict[str, Tuple[IndexedCallbackObserver, Tuple[TelegramEventObserver, ...]]] = {}
+        self._separators: List[str] = []
+        self._version = -1
+
+    def _path(self, router: Router) -> Optional[Tuple[TelegramEventObserver, ...]]:
+        # Корневые фильтры роутеров от владельца до Dispatcher. Внешние middleware по пути
+        # выполняются только при обычном обходе — такие префиксы в таблицу не попадают
+        path = []
+        while router is not None and router is not self.router:
+            observer = router.observers[self.event_name]
+            if len(observer.outer_middleware):
+                return None
+            path.append(observer)
+            router = router.parent_router
+        return tuple(reversed(path)) if router is self.router else None
+
+    def _build(self) -> None:
+        table: Dict[str, Tuple[IndexedCallbackObserver, Tuple[TelegramEventObserver, ...]]] = {}
+        separators: List[str] = []
+        for router in self.router.chain_tail:
+            observer = router.observers[self.event_name]
+            if not isinstance(observer, IndexedCallbackObserver) or not observer.prefixes:
+                continue
+            path = self._path(router)
+            if path is None:
+                continue
+            for prefix in observer.prefixes:
+                # Префикс принадлежит первому по порядку обхода роутеру — как и без таблицы
+                table.setdefault(prefix, (observer, path))
+            separators += [separator for separator in observer._separators if separator not in separators]
+        self._table, self._separators, self._version = table, separators, _tree_version
+
+    def _lookup(self, data: str) -> Optional[Tuple[IndexedCallbackObserver, Tuple[TelegramEventObserver, ...]]]:
+        for separator in self._separators:
+            entry = self._table.get(data.partition(separator)[0])
+            if entry is not None:
+                return entry
+        return None
+
+    async def trigger(self, event: CallbackQuery, **kwargs: Any) -> Any:
+        if self.handlers:
+            result = await super().trigger(event, **kwargs)
+            if result is not UNHANDLED:
+                return result
+
+        data = event.data
+        if data is None:
+            return UNHANDLED
+        if _oversized(data):
+            return await _reject(event, "oversized")
+        if self._version != _tree_version:
+            self._build()
+
+        data = _legacy.get(data, data)
+        entry = self._lookup(data)
+        if entry is None:
+            return UNHANDLED
+        observer, path = entry
+        indexed = observer._lookup(data)
+        if indexed is None:
+            return UNHANDLED
+        for level in path:
+            passed, extra = await level.check_root_filters(event, **kwargs)
+            if not passed:
+                # Роутер на пути не принимает нажатие — пусть решает обычный обход
+                return UNHANDLED
+            kwargs.update(extra)
+        kwargs["event_router"] = observer.router
+        return await observer.dispatch(indexed, event, data, kwargs)
+
+
+class CallbackRouter(Router):
+    """
+    Роутер, у которого нажатия кнопок выбираются по индексу префиксов.
+    """
+
+    def __init__(self, *, name: Optional[str] = None):
+        super().__init__(name=name)
+        self.callback_query = self.observers["callback_query"] = IndexedCallbackObserver(router=self)
+
+    @property
+    def parent_router(self) -> Optional[Router]:
+        return self._parent_router
+
+    @parent_router.setter
+    def parent_router(self, router: Router) -> None:
+        Router.parent_router.fset(self, router)
+        _touch()
+
+
+def setup_callback_index(dispatcher: Dispatcher) -> None:
+    """
+    Подключает таблицу префиксов callback-данных на уровне Dispatcher.
+
+    Уже подключённые к dispatcher.callback_query обработчики, фильтры и middleware сохраняются.
+    """
+    old = dispatcher.callback_query
+    observer = DispatcherCallbackObserver(router=dispatcher)
+    observer.handlers = old.handlers
+    observer._handler = old._handler
+    observer.middleware = old.middleware
+    observer.outer_middleware = old.outer_middleware
+    dispatcher.callback_query = dispatcher.observers["callback_query"] = observer
+
+
+metrics.gauge("bot_callback_rejected", "Отклонённых нажатий inline-кнопок",
+              lambda: {(reason,): count for reason, count in callback_rejections.items()},
+              ("reason",))
@@ -0,0 +1,333 @@
+"""
+Офлайн прямое геокодирование: название города -> координаты, и автодополнение.
+
+Индекс строится один раз из выгрузки GeoNames (см. services.geo_index) и
+сохраняется в компактный бинарный файл, который бот быстро загружает при старте:
+
+    python -m services.city_search build [data/cities15000.txt] [data/cities.idx]
+
+Внутри индекса:
+- колонки городов (названия, страна, координаты, население) в массивах;
+- отсортированный список нормализованных названий (русские, латинские и
+  альтернативные названия) с номерами городов. Поиск по префиксу — это бинарный
+  поиск по отсортированному списку (тот же префиксный обход, что и в trie,
+  но без миллиона маленьких словарей в памяти);
+- опечатки исправляются расстоянием Левенштейна; кандидатов заранее отбирает
+  индекс биграмм (строка с k опечатками теряет не больше 2k своих биграмм).
+"""
+
+import argparse
+import heapq
+import os
+import pickle
+import re
+import sys
+from array import array
+from bisect import bisect_left
+from collections import Counter
+from typing import Optional, Dict, List, Tuple
+
+from services.geo_index import read_geonames, GAZETTEER_PATH
+from utils.logger import logger
+
+
+CITY_INDEX_PATH = os.getenv("CITY_INDEX_PATH", "data/cities.idx")
+# 3: русские названия из alternateNamesV2 (индексы старых версий перестраиваются)
+_INDEX_VERSION = 3
+
+_SEPARATORS = re.compile(r"[\s\-‐–—'’`.,()]+")
+_LATIN_OR_CYRILLIC = re.compile(r"^[0-9a-zа-я ]+$")
+
+
+def normalize(text: str) -> str:
+    """
+    Нормализация названия: нижний регистр, ё -> е, дефисы и точки -> пробел.
+    "Санкт-Петербург" и "санкт петербург" дают одну и ту же строку.
+    """
+    text = text.casefold().replace("ё", "е")
+    return _SEPARATORS.sub(" ", text).strip()
+
+
+def _max_typos(length: int) -> int:
+    if length <= 3:
+        return 0
+    if length <= 6:
+        return 1
+    return 2
+
+
+def _bigrams(key: str) -> set:
+    # Пробелы по краям, чтобы первая и последняя буквы тоже попадали в биграммы
+    padded = f" {key} "
+    return {padded[i:i + 2] for i in range(len(padded) - 1)}
+
+
+def _build_bigram_index(keys: List[str]) -> Dict[str, array]:
+    postings: Dict[str, array] = {}
+    for pos, key in enumerate(keys):
+        if pos and keys[pos - 1] == key:
+            continue  # одинаковые названия разных городов стоят подряд — индексируем первое
+        for gram in _bigrams(key):
+            postings.setdefault(gram, array("I")).append(pos)
+    return postings
+
+
+def _levenshtein(a: str, b: str, limit: int) -> int:
+    """
+    Расстояние Левенштейна с ранним выходом: если расстояние заведомо больше limit,
+    возвращается limit + 1.
+    """
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous = list(range(len(b) + 1))
+    for i, ch_a in enumerate(a, 1):
+        current = [i]
+        row_min = i
+        for j, ch_b in enumerate(b, 1):
+            cost = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ch_a != ch_b))
+            current.append(cost)
+            if cost < row_min:
+                row_min = cost
+        if row_min > limit:
+            return limit + 1
+        previous = current
+    return previous[-1]
+
+
+class CitySearch:
+    """
+    Поиск городов по названию в локальном индексе.
+    """
+
+    def __init__(self):
+        # Колонки городов
+        self.ru_names: List[str] = []
+        self.en_names: List[str] = []
+        self.countries: List[str] = []
+        self.lat = array("f")
+        self.lon = array("f")
+        self.population = array("I")
+        self.geoname_ids = array("I")
+
+        # Отсортированные нормализованные названия и номера городов для них
+        self.keys: List[str] = []
+        self.key_places = array("I")
+        # Биграмма -> позиции названий в self.keys (для поиска с опечатками)
+        self.bigrams: Dict[str, array] = {}
+
+    def __len__(self) -> int:
+        return len(self.ru_names)
+
+    # ================= Построение и загрузка индекса ================= #
+
+    @classmethod
+    def build(cls, gazetteer_path: str = GAZETTEER_PATH) -> "CitySearch":
+        """
+        Строит индекс из выгрузки GeoNames.
+        """
+        index = cls()
+        pairs: List[Tuple[str, int]] = []
+        for place in read_geonames(gazetteer_path):
+            idx = len(index.ru_names)
+            index.ru_names.append(place.ru_name)
+            index.en_names.append(place.en_name)
+            index.countries.append(sys.intern(place.country))
+            index.lat.append(place.lat)
+            index.lon.append(place.lon)
+            index.population.append(min(place.population, 2 ** 32 - 1))
+            index.geoname_ids.append(place.geoname_id)
+
+            names = {normalize(place.name), normalize(place.en_name), normalize(place.ru_name)}
+            # Из альтернативных названий берём только кириллицу и латиницу — остальные пользователи не вводят
+            names.update(n for n in map(normalize, place.alt_names) if _LATIN_OR_CYRILLIC.match(n))
+            pairs.extend((name, idx) for name in names if name)
+
+        pairs.sort()
+        index.keys = [name for name, _ in pairs]
+        index.key_places = array("I", (idx for _, idx in pairs))
+        index.bigrams = _build_bigram_index(index.keys)
+        return index
+
+    def save(self, path: str = CITY_INDEX_PATH) -> None:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        payload = {
+            "version": _INDEX_VERSION,
+            "ru_names": self.ru_names,
+            "en_names": self.en_names,
+            "countries": self.countries,
+            "lat": self.lat,
+            "lon": self.lon,
+            "population": self.population,
+            "geoname_ids": self.geoname_ids,
+            # Ключи храним одной строкой: так файл меньше и грузится быстрее списка строк
+            "keys": "\n".join(self.keys),
+            "key_places": self.key_places,
+            "bigrams": self.bigrams,
+        }
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            pickle.dump(payload, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def from_file(cls, path: str = CITY_INDEX_PATH) -> "CitySearch":
+        with open(path, "rb") as f:
+            payload = pickle.load(f)
+        if payload.get("version") != _INDEX_VERSION:
+            raise ValueError(f"Неподдерживаемая версия индекса городов: {payload.get('version')}")
+
+        index = cls()
+        index.ru_names = payload["ru_names"]
+        index.en_names = payload["en_names"]
+        index.countries = payload["countries"]
+        index.lat = payload["lat"]
+        index.lon = payload["lon"]
+        index.population = payload["population"]
+        index.geoname_ids = payload["geoname_ids"]
+        index.keys = payload["keys"].split("\n") if payload["keys"] else []
+        index.key_places = payload["key_places"]
+        index.bigrams = payload["bigrams"]
+        return index
+
+    def load(self, path: str = CITY_INDEX_PATH, gazetteer_path: str = GAZETTEER_PATH) -> int:
+        """
+        Загружает готовый индекс. Если его нет (или он старой версии), но есть выгрузка GeoNames —
+        строит индекс из неё (медленнее) и сохраняет для следующих запусков.
+
+        :return: Количество городов в индексе.
+        """
+        loaded = None
+        if os.path.exists(path):
+            try:
+                loaded = self.from_file(path)
+            except ValueError as e:
+                # Индекс старой версии: перестраиваем из справочника, если он есть
+                logger.warning(f"Индекс городов {path} не загружен: {e}")
+
+        if loaded is None and os.path.exists(gazetteer_path):
+            logger.warning(f"Строим индекс городов {path} из {gazetteer_path}")
+            loaded = self.build(gazetteer_path)
+            loaded.save(path)
+        elif loaded is None:
+            logger.warning("Нет ни индекса, ни справочника городов: поиск города по названию недоступен")
+            return 0
+
+        for slot in ("ru_names", "en_names", "countries", "lat", "lon", "population",
+                     "geoname_ids", "keys", "key_places", "bigrams"):
+            setattr(self, slot, getattr(loaded, slot))
+        logger.info(f"Индекс городов загружен: {len(self)} городов, {len(self.keys)} названий")
+        return len(self)
+
+    # ================= Поиск ================= #
+
+    def place(self, idx: int) -> Dict:
+        return {
+            "name": self.en_names[idx],
+            "ru_name": self.ru_names[idx],
+            "en_name": self.en_names[idx],
+            "country": self.countries[idx],
+            "lat": round(self.lat[idx], 4),
+            "lon": round(self.lon[idx], 4),
+            "geoname_id": self.geoname_ids[idx],
+        }
+
+    def _top(self, places: set, limit: int) -> List[Dict]:
+        # Среди подходящих городов сначала самые крупные: куча на limit элементов, без сортировки всех
+        ranked = heapq.nlargest(limit, places, key=self.population.__getitem__)
+        return [self.place(idx) for idx in ranked]
+
+    def _prefix_places(self, prefix: str) -> set:
+        # Все названия с префиксом стоят подряд: берём их целиком, ранжирует _top.
+        # Обрезать список раньше нельзя — по алфавиту первыми идут не самые крупные города
+        start = bisect_left(self.keys, prefix)
+        end = bisect_left(self.keys, prefix + "\U0010ffff", start)
+        return set(self.key_places[start:end])
+
+    def _exact_places(self, key: str) -> set:
+        places = set()
+        pos = bisect_left(self.keys, key)
+        while pos < len(self.keys) and self.keys[pos] == key:
+            places.add(self.key_places[pos])
+            pos += 1
+        return places
+
+    def _fuzzy_places(self, key: str) -> set:
+        """
+        Названия на расстоянии Левенштейна не больше допустимого.
+        Левенштейн считается только для названий, у которых достаточно общих
+        биграмм с запросом, — остальные заведомо дальше допустимого.
+        """
+        limit = _max_typos(len(key))
+        if not limit:
+            return set()
+
+        grams = _bigrams(key)
+        min_shared = len(grams) - 2 * limit
+        counts = Counter()
+        for gram in grams:
+            counts.update(self.bigrams.get(gram, ()))
+
+        best_distance = limit + 1
+        places = set()
+        for pos, shared in counts.items():
+            if shared < min_shared:
+                continue
+            candidate = self.keys[pos]
+            distance = _levenshtein(key, candidate, min(limit, best_distance))
+            if distance < best_distance:
+                best_distance, places = distance, set()
+            if distance == best_distance and distance <= limit:
+                # Добавляем все города с этим названием (они стоят подряд)
+                places.update(self._exact_places(candidate))
+        return places
+
+    def resolve(self, text: str) -> Optional[Dict]:
+        """
+        Определяет город по введённому тексту: точное совпадение, затем
+        крупнейший город по префиксу, затем поиск с опечатками.
+
+        :return: Словарь с названием и координатами или None.
+        """
+        key = normalize(text)
+        if not key or not self.keys:
+            return None
+
+        places = self._exact_places(key)
+        if not places and len(key) >= 3:
+            places = self._prefix_places(key)
+        if not places:
+            places = self._fuzzy_places(key)
+        return self._top(places, 1)[0] if places else None
+
+    def suggest(self, text: str, limit: int = 10) -> List[Dict]:
+        """
+        Подсказки для автодополнения по началу названия (с учётом опечаток,
+        если по префиксу ничего не нашлось).
+        """
+        key = normalize(text)
+        if not key or not self.keys:
+            return []
+
+        places = self._prefix_places(key)
+        if not places:
+            places = self._fuzzy_places(key)
+        return self._top(places, limit)
+
+
+# Общий индекс для всего бота (заполняется при старте)
+city_search = CitySearch()
+
+
+if __name__ == "__main__":
+    # python -m services.city_search build [gazetteer] [index]
+    parser = argparse.ArgumentParser(prog="python -m services.city_search",
+                                     description="Индекс городов для поиска по названию")
+    commands = parser.add_subparsers(dest="command", required=True)
+    build = commands.add_parser("build", help="построить индекс из выгрузки GeoNames")
+    build.add_argument("gazetteer", nargs="?", default=GAZETTEER_PATH, help="выгрузка GeoNames (cities15000.txt)")
+    build.add_argument("index", nargs="?", default=CITY_INDEX_PATH, help="куда сохранить индекс")
+    args = parser.parse_args()
+
+    built = CitySearch.build(args.gazetteer)
+    built.save(args.index)
+    logger.info(f"Индекс городов сохранён в {args.index}: {len(built)} городов, {len(built.keys)} названий")
@@ -0,0 +1,175 @@
+"""
+Хранилище состояний FSM (aiogram) в SQLite.
+
+Стандартный MemoryStorage теряет все состояния при перезапуске: пользователь,
+который был на середине регистрации (handlers/start.py), начинает с начала.
+SQLiteStorage реализует интерфейс aiogram BaseStorage и пишет каждое изменение
+в SQLite (WAL), а читает через горячий кэш в памяти. Брошенные состояния
+удаляются по истечении FSM_STATE_TTL.
+
+Один файл базы могут использовать несколько процессов на одной машине. Горячий
+кэш процесса живёт FSM_HOT_TTL секунд: если апдейты одного пользователя могут
+попадать в разные процессы (без распределения по user id), поставьте FSM_HOT_TTL=0.
+"""
+
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Optional, Dict, Any, Mapping, Tuple
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, StorageKey, StateType, DefaultKeyBuilder, KeyBuilder
+from aiogram.fsm.storage.memory import MemoryStorage
+
+from utils.cache import TTLCache
+from utils.logger import logger
+
+
+# Какое хранилище использовать: "sqlite" (по умолчанию) или "memory" (стандартное aiogram, без сохранения)
+FSM_STORAGE_BACKEND = os.getenv("FSM_STORAGE_BACKEND", "sqlite")
+FSM_STORAGE_PATH = os.getenv("FSM_STORAGE_PATH", "data/fsm.sqlite3")
+# Через сколько секунд без изменений состояние считается брошенным
+FSM_STATE_TTL = float(os.getenv("FSM_STATE_TTL", str(24 * 3600)))
+# Сколько секунд процесс доверяет своему кэшу, не перечитывая базу
+FSM_HOT_TTL = float(os.getenv("FSM_HOT_TTL", "300"))
+FSM_HOT_CACHE_SIZE = int(os.getenv("FSM_HOT_CACHE_SIZE", "10000"))
+# Как часто удалять из базы просроченные состояния (секунды)
+FSM_PURGE_INTERVAL = 600
+
+
+class SQLiteStorage(BaseStorage):
+    """
+    FSM-хранилище: одна строка на ключ (состояние, данные в JSON, срок жизни).
+    """
+
+    def __init__(self,
+                 path: str = FSM_STORAGE_PATH,
+                 state_ttl: float = FSM_STATE_TTL,
+                 hot_ttl: float = FSM_HOT_TTL,
+                 key_builder: Optional[KeyBuilder] = None):
+        self.path = path
+        self.state_ttl = state_ttl
+        self.key_builder = key_builder or DefaultKeyBuilder(with_bot_id=True, with_business_connection_id=True,
+                                                            with_destiny=True)
+        self._conn: Optional[sqlite3.Connection] = None
+        self._conn_lock = threading.Lock()
+        self._open_lock = asyncio.Lock()
+        # Горячий кэш: {ключ: (состояние, данные)}
+        self._hot = TTLCache(max_size=FSM_HOT_CACHE_SIZE, default_ttl=hot_ttl)
+        self._purged_at = 0.0
+
+    def _connect(self) -> sqlite3.Connection:
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        # Другой процесс может держать запись — ждём, а не падаем
+        conn.execute("PRAGMA busy_timeout=5000")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS fsm ("
+            "key TEXT PRIMARY KEY, "
+            "state TEXT, "
+            "data TEXT NOT NULL DEFAULT '{}', "
+            "expires_at REAL NOT NULL)"
+        )
+        return conn
+
+    def _execute(self, sql: str, params: tuple = ()) -> list:
+        with self._conn_lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    async def open(self) -> None:
+        # Dispatcher создаётся до запуска event loop-задач, поэтому базу открываем при первом обращении
+        if self._conn is None:
+            async with self._open_lock:
+                if self._conn is None:
+                    self._conn = await asyncio.to_thread(self._connect)
+
+    async def close(self) -> None:
+        if self._conn is not None:
+            conn, self._conn = self._conn, None
+            await asyncio.to_thread(conn.close)
+        self._hot.clear()
+
+    async def _load(self, key: str) -> Tuple[Optional[str], Dict[str, Any]]:
+        cached = self._hot.get(key)
+        if cached is not None:
+            return cached
+
+        await self.open()
+        rows = await asyncio.to_thread(
+            self._execute, "SELECT state, data FROM fsm WHERE key = ? AND expires_at > ?", (key, time.time())
+        )
+        record = (rows[0][0], json.loads(rows[0][1])) if rows else (None, {})
+        self._hot.set(key, record)
+        return record
+
+    def _write(self, key: str, column: str, value: Optional[str]) -> None:
+        # Пишем только свою колонку: изменения состояния и данных из разных процессов не затирают друг друга
+        now = time.time()
+        with self._conn_lock:
+            # Просроченная запись не должна ожить вместе со второй колонкой
+            self._conn.execute("DELETE FROM fsm WHERE key = ? AND expires_at <= ?", (key, now))
+            self._conn.execute(
+                f"INSERT INTO fsm (key, {column}, expires_at) VALUES (?, ?, ?) "
+                f"ON CONFLICT(key) DO UPDATE SET {column} = excluded.{column}, expires_at = excluded.expires_at",
+                (key, value, now + self.state_ttl)
+            )
+            # Пустая запись ничем не отличается от отсутствующей — удаляем строку
+            self._conn.execute("DELETE FROM fsm WHERE key = ? AND state IS NULL AND data = '{}'", (key,))
+
+    async def _save(self, key: str, column: str, value: Optional[str], decoded: Any) -> None:
+        await self.open()
+        await asyncio.to_thread(self._write, key, column, value)
+        # Кэш обновляем только после успешной записи в базу. Вторую колонку знаем только из кэша —
+        # если записи в нём нет, следующее чтение пойдёт в базу
+        cached = self._hot.get(key)
+        if cached is not None:
+            state, data = cached
+            self._hot.set(key, (decoded, data) if column == "state" else (state, decoded))
+        await self._purge_expired()
+
+    async def _purge_expired(self) -> None:
+        now = time.time()
+        if now - self._purged_at < FSM_PURGE_INTERVAL:
+            return
+        self._purged_at = now
+        try:
+            await asyncio.to_thread(self._execute, "DELETE FROM fsm WHERE expires_at <= ?", (now,))
+        except sqlite3.Error as e:
+            logger.error(f"Не удалось удалить просроченные состояния FSM: {e}")
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        state = state.state if isinstance(state, State) else state
+        await self._save(self.key_builder.build(key), "state", state, state)
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        state, _ = await self._load(self.key_builder.build(key))
+        return state
+
+    async def set_data(self, key: StorageKey, data: Mapping[str, Any]) -> None:
+        data = dict(data)
+        await self._save(self.key_builder.build(key), "data", json.dumps(data, ensure_ascii=False), data)
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        _, data = await self._load(self.key_builder.build(key))
+        # Копия, чтобы изменения у вызывающего не попали в кэш мимо базы
+        return dict(data)
+
+
+def create_fsm_storage(backend: str = FSM_STORAGE_BACKEND) -> BaseStorage:
+    """
+    Создаёт FSM-хранилище по имени бэкенда.
+    """
+    if backend == "memory":
+        return MemoryStorage()
+    if backend == "sqlite":
+        return SQLiteStorage()
+    raise ValueError(f"Неизвестный бэкенд FSM-хранилища: {backend}")
+
+
+# Общее хранилище FSM для Dispatcher
+fsm_storage = create_fsm_storage()
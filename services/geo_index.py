@@ -0,0 +1,314 @@
+"""
+Офлайн обратное геокодирование: координаты -> ближайший город.
+
+Города загружаются из локального файла в формате выгрузки GeoNames
+(например, cities15000.txt с https://download.geonames.org/export/dump/).
+Русские названия городов берутся из alternateNamesV2.txt той же выгрузки;
+файл огромный, поэтому нужные названия один раз выбираются из него в компактный
+кэш (RU_NAMES_PATH), и при следующих запусках читается только кэш.
+Для быстрого поиска города раскладываются по ячейкам сетки 1°×1°,
+поэтому поиск ближайшего города проверяет только несколько соседних ячеек.
+"""
+
+import argparse
+import math
+import os
+import pickle
+from typing import Optional, Dict, Iterator, List, Set, Tuple
+
+from utils.logger import logger
+
+
+GAZETTEER_PATH = os.getenv("GAZETTEER_PATH", "data/cities15000.txt")
+# Необязательный файл с названиями регионов (admin1CodesASCII.txt из GeoNames)
+ADMIN1_PATH = os.getenv("GAZETTEER_ADMIN1_PATH", "data/admin1CodesASCII.txt")
+# Необязательный файл альтернативных названий (alternateNamesV2.txt из GeoNames): русские названия городов
+ALTERNATE_NAMES_PATH = os.getenv("GAZETTEER_ALTERNATE_NAMES_PATH", "data/alternateNamesV2.txt")
+# Кэш русских названий городов справочника, выбранных из ALTERNATE_NAMES_PATH
+RU_NAMES_PATH = os.getenv("GAZETTEER_RU_NAMES_PATH", "data/ru_names.idx")
+_RU_NAMES_VERSION = 1
+
+# Радиус поиска города (км): если ближе никого нет — идём в API
+SEARCH_RADIUS_KM = float(os.getenv("GEO_SEARCH_RADIUS_KM", "30"))
+
+EARTH_RADIUS_KM = 6371.0
+_CELL_DEG = 1.0
+
+
+class Place:
+    """
+    Город из справочника.
+    """
+    __slots__ = ("geoname_id", "name", "ru_name", "en_name", "state", "country",
+                 "lat", "lon", "population", "timezone", "alt_names")
+
+    def __init__(self, geoname_id: int, name: str, ru_name: str, en_name: str,
+                 state: Optional[str], country: str, lat: float, lon: float,
+                 population: int, timezone: Optional[str], alt_names: Tuple[str, ...] = ()):
+        self.geoname_id = geoname_id
+        self.name = name
+        self.ru_name = ru_name
+        self.en_name = en_name
+        self.state = state
+        self.country = country
+        self.lat = lat
+        self.lon = lon
+        self.population = population
+        self.timezone = timezone
+        self.alt_names = alt_names
+
+    def as_dict(self) -> Dict:
+        """
+        Словарь в том же формате, что и get_location_from_coords_async.
+        """
+        return {
+            "name": self.name,
+            "ru_name": self.ru_name,
+            "en_name": self.en_name,
+            "state": self.state,
+            "country": self.country,
+            "lat": self.lat,
+            "lon": self.lon
+        }
+
+
+def read_admin1_names(path: str = ADMIN1_PATH) -> Dict[str, str]:
+    """
+    Читает названия регионов: {"RU.48": "Moscow", ...}.
+    """
+    names = {}
+    if not os.path.exists(path):
+        return names
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            parts = line.rstrip("\n").split("\t")
+            if len(parts) >= 2:
+                names[parts[0]] = parts[1]
+    return names
+
+
+def read_russian_names(path: str = ALTERNATE_NAMES_PATH, geoname_ids: Optional[Set[int]] = None) -> Dict[int, str]:
+    """
+    Читает русские названия: {geoname_id: название}.
+
+    Берутся строки с isolanguage=ru, кроме разговорных и исторических;
+    если у города их несколько — предпочтительное (isPreferredName),
+    иначе первое. Кириллица сама по себе русского названия не означает:
+    у городов есть белорусские, украинские, болгарские и другие варианты.
+
+    :param geoname_ids: Какие города нужны (None — все).
+    """
+    names: Dict[int, str] = {}
+    preferred: Set[int] = set()
+    if not os.path.exists(path):
+        return names
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            # alternateNameId, geonameid, isolanguage, alternate name, isPreferredName,
+            # isShortName, isColloquial, isHistoric, from, to
+            parts = line.rstrip("\n").split("\t")
+            if len(parts) < 8 or parts[2] != "ru" or not parts[3]:
+                continue
+            if parts[6] == "1" or parts[7] == "1":
+                continue
+            geoname_id = int(parts[1])
+            if geoname_ids is not None and geoname_id not in geoname_ids:
+                continue
+            if geoname_id in preferred:
+                continue
+            if parts[4] == "1":
+                preferred.add(geoname_id)
+                names[geoname_id] = parts[3]
+            else:
+                names.setdefault(geoname_id, parts[3])
+    return names
+
+
+def _read_geoname_ids(path: str) -> Set[int]:
+    with open(path, "r", encoding="utf-8") as f:
+        return {int(line.split("\t", 1)[0]) for line in f if line.strip()}
+
+
+def save_russian_names(names: Dict[int, str], path: str = RU_NAMES_PATH) -> None:
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        pickle.dump({"version": _RU_NAMES_VERSION, "names": names}, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, path)
+
+
+def _read_cached_names(path: str) -> Optional[Dict[int, str]]:
+    try:
+        with open(path, "rb") as f:
+            payload = pickle.load(f)
+    except (OSError, pickle.UnpicklingError, EOFError, AttributeError) as e:
+        logger.warning(f"Кэш русских названий {path} не загружен: {e}")
+        return None
+    if payload.get("version") != _RU_NAMES_VERSION:
+        logger.warning(f"Кэш русских названий {path} старой версии: {payload.get('version')}")
+        return None
+    return payload["names"]
+
+
+def load_russian_names(path: str = GAZETTEER_PATH, alternate_names_path: str = ALTERNATE_NAMES_PATH,
+                       cache_path: str = RU_NAMES_PATH) -> Dict[int, str]:
+    """
+    Русские названия городов справочника path.
+
+    Читает кэш cache_path. Если его нет, он старой версии или старше справочника
+    либо alternate_names_path — выбирает названия из alternate_names_path
+    (медленно) и сохраняет кэш для следующих запусков.
+    """
+    cached = _read_cached_names(cache_path) if os.path.exists(cache_path) else None
+    if not os.path.exists(alternate_names_path):
+        # Выгрузки нет (например, на сервер положили только кэш) — берём что есть
+        return cached or {}
+    if cached is not None:
+        built_at = os.path.getmtime(cache_path)
+        if os.path.getmtime(alternate_names_path) <= built_at and os.path.getmtime(path) <= built_at:
+            return cached
+
+    logger.warning(f"Выбираем русские названия городов из {alternate_names_path} в {cache_path}")
+    # Файл альтернативных названий огромный: держим в памяти только города справочника
+    names = read_russian_names(alternate_names_path, _read_geoname_ids(path))
+    try:
+        save_russian_names(names, cache_path)
+    except OSError as e:
+        logger.error(f"Не удалось сохранить кэш русских названий {cache_path}: {e}")
+    return names
+
+
+def read_geonames(path: str = GAZETTEER_PATH, admin1_path: str = ADMIN1_PATH,
+                  alternate_names_path: str = ALTERNATE_NAMES_PATH,
+                  ru_names_path: str = RU_NAMES_PATH) -> Iterator[Place]:
+    """
+    Построчно читает выгрузку GeoNames и возвращает города.
+
+    Русское название берётся из alternateNamesV2 (см. load_russian_names),
+    если его там нет — используется основное название.
+    """
+    admin1 = read_admin1_names(admin1_path)
+    ru_names = load_russian_names(path, alternate_names_path, ru_names_path)
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            parts = line.rstrip("\n").split("\t")
+            if len(parts) < 18:
+                continue
+            alt_names = tuple(n for n in parts[3].split(",") if n)
+            geoname_id = int(parts[0])
+            name = parts[1]
+            country = parts[8]
+            yield Place(
+                geoname_id=geoname_id,
+                name=name,
+                ru_name=ru_names.get(geoname_id, name),
+                en_name=parts[2] or name,
+                state=admin1.get(f"{country}.{parts[10]}"),
+                country=country,
+                lat=float(parts[4]),
+                lon=float(parts[5]),
+                population=int(parts[14] or 0),
+                timezone=parts[17] or None,
+                alt_names=alt_names,
+            )
+
+
+def distance_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """
+    Расстояние между точками по формуле гаверсинусов.
+    """
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    d_phi = phi2 - phi1
+    d_lambda = math.radians(lon2 - lon1)
+    a = math.sin(d_phi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(d_lambda / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
+
+
+def _cell(lat: float, lon: float) -> Tuple[int, int]:
+    return int(math.floor(lat / _CELL_DEG)), int(math.floor(lon / _CELL_DEG)) % 360
+
+
+class ReverseGeocoder:
+    """
+    Поиск ближайшего города по координатам в локальном справочнике.
+    """
+
+    def __init__(self):
+        self.places: List[Place] = []
+        self._grid: Dict[Tuple[int, int], List[int]] = {}
+
+    def __len__(self) -> int:
+        return len(self.places)
+
+    def add(self, place: Place) -> None:
+        self._grid.setdefault(_cell(place.lat, place.lon), []).append(len(self.places))
+        self.places.append(place)
+
+    def load(self, path: str = GAZETTEER_PATH) -> int:
+        """
+        Загружает справочник городов вместо текущего (повторный вызов не дублирует города).
+        Если файла нет — индекс остаётся пустым, и геокодирование целиком идёт через API.
+
+        :return: Количество загруженных городов.
+        """
+        if not os.path.exists(path):
+            logger.warning(f"Справочник городов {path} не найден, геокодирование только через API")
+            return 0
+        loaded = ReverseGeocoder()
+        for place in read_geonames(path):
+            loaded.add(place)
+        # Подменяем целиком: поиск, идущий параллельно, видит либо старый, либо новый индекс
+        self.places, self._grid = loaded.places, loaded._grid
+        logger.info(f"Справочник городов загружен: {len(self.places)} городов")
+        return len(self.places)
+
+    def nearest(self, lat: float, lon: float, radius_km: float = SEARCH_RADIUS_KM) -> Optional[Place]:
+        """
+        Ближайший город в радиусе radius_km или None.
+        """
+        if not self._grid:
+            return None
+
+        # Сколько ячеек нужно проверить вокруг точки, чтобы покрыть радиус
+        lat_cells = int(math.ceil(radius_km / 111.0 / _CELL_DEG))
+        cos_lat = max(math.cos(math.radians(lat)), 0.01)
+        lon_cells = min(int(math.ceil(radius_km / (111.0 * cos_lat) / _CELL_DEG)), 180)
+
+        center_lat, center_lon = _cell(lat, lon)
+        best: Optional[Place] = None
+        best_distance = radius_km
+        for d_lat in range(-lat_cells, lat_cells + 1):
+            for d_lon in range(-lon_cells, lon_cells + 1):
+                for idx in self._grid.get((center_lat + d_lat, (center_lon + d_lon) % 360), ()):
+                    place = self.places[idx]
+                    distance = distance_km(lat, lon, place.lat, place.lon)
+                    if distance <= best_distance:
+                        best, best_distance = place, distance
+        return best
+
+    def lookup(self, lat: float, lon: float, radius_km: float = SEARCH_RADIUS_KM) -> Optional[Dict]:
+        """
+        То же, что nearest, но в формате словаря get_location_from_coords_async.
+        """
+        place = self.nearest(lat, lon, radius_km)
+        return place.as_dict() if place else None
+
+
+# Общий индекс для всего бота (заполняется при старте)
+reverse_geocoder = ReverseGeocoder()
+
+
+if __name__ == "__main__":
+    # python -m services.geo_index ru-names [gazetteer] [alternate_names] [cache]
+    parser = argparse.ArgumentParser(prog="python -m services.geo_index",
+                                     description="Справочник городов для обратного геокодирования")
+    commands = parser.add_subparsers(dest="command", required=True)
+    ru = commands.add_parser("ru-names", help="выбрать русские названия из alternateNamesV2 в кэш")
+    ru.add_argument("gazetteer", nargs="?", default=GAZETTEER_PATH, help="выгрузка GeoNames (cities15000.txt)")
+    ru.add_argument("alternate_names", nargs="?", default=ALTERNATE_NAMES_PATH, help="alternateNamesV2.txt")
+    ru.add_argument("cache", nargs="?", default=RU_NAMES_PATH, help="куда сохранить кэш")
+    args = parser.parse_args()
+
+    built = read_russian_names(args.alternate_names, _read_geoname_ids(args.gazetteer))
+    save_russian_names(built, args.cache)
+    logger.info(f"Кэш русских названий сохранён в {args.cache}: {len(built)} городов")
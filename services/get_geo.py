@@ -1,10 +1,21 @@
 # file: reverse_geocode_openweather_async.py
 import asyncio
+import os
+import time
 import aiohttp
 from typing import Optional, Dict
 from config import OPENWEATHER_API_KEY
 
-from pprint import pprint
+from services.http_client import http_client
+from services.openweather_quota import openweather_limiter, openweather_breaker
+from utils.rate_limiter import Priority, RateLimitTimeout
+from utils.resilience import CircuitOpenError, RetryableError, RetryPolicy
+from services.geo_index import reverse_geocoder
+from utils.cache import TTLCache
+from utils.geo_grid import cell_key
+from utils.fast_json import loads
+from utils.logger import logger
+from utils.metrics import upstream_latency
 
 
 """
@@ -15,6 +26,8 @@ lat (float): Широта места
 lon (float): Долгота места  
 api_key (str, optional): Ключ API OpenWeather. Если не указан, берется из config.py
 limit (int, optional): Максимальное количество возвращаемых результатов. По умолчанию 1.
+priority (int, optional): Приоритет в общем лимите запросов к OpenWeather. По умолчанию интерактивный.
+deadline (float, optional): Момент по time.monotonic(), после которого ответ уже не нужен.
         
 Returns:
 Optional[Dict]: Словарь с данными о местоположении или None в случае ошибки.
@@ -33,8 +46,25 @@ ValueError: Если API ключ не задан ни в параметрах,
 """
 URL = "http://api.openweathermap.org/geo/1.0/reverse"
 
+# Сколько секунд пользователь ждёт геокодер, таймаут одной попытки и повторы при временных сбоях
+GEO_DEADLINE = float(os.getenv("GEO_DEADLINE", "5"))
+GEO_ATTEMPT_TIMEOUT = float(os.getenv("GEO_ATTEMPT_TIMEOUT", "3"))
+GEO_RETRIES = int(os.getenv("GEO_RETRIES", "1"))
+# Через сколько секунд без ответа отправить подстраховочный запрос (0 — не отправлять)
+GEO_HEDGE_AFTER = float(os.getenv("GEO_HEDGE_AFTER", "0"))
+# Сколько помнить ответы API на случай, если геокодер станет недоступен
+GEO_STALE_TTL = float(os.getenv("GEO_STALE_TTL", str(90 * 24 * 3600)))
 
-async def get_location_from_coords_async(lat: float, lon: float, api_key: Optional[str] = None, limit: int = 1) -> Optional[Dict]:
+geo_retry = RetryPolicy(
+    retries=GEO_RETRIES,
+    attempt_timeout=GEO_ATTEMPT_TIMEOUT,
+    hedge_after=GEO_HEDGE_AFTER,
+    breaker=openweather_breaker
+)
+
+
+async def get_location_from_coords_async(lat: float, lon: float, api_key: Optional[str] = None, limit: int = 1,
+                                         priority: int = Priority.INTERACTIVE, deadline: Optional[float] = None) -> Optional[Dict]:
     key = api_key or OPENWEATHER_API_KEY
     if not key:
         raise ValueError("API key не задан. Установи OPENWEATHER_API_KEY в окружении или передай api_key в функцию.")
@@ -47,41 +77,124 @@ async def get_location_from_coords_async(lat: float, lon: float, api_key: Option
         "appid": key
     }
 
-    timeout = aiohttp.ClientTimeout(total=10)
-    async with aiohttp.ClientSession(timeout=timeout) as session:
-        try:
-            async with session.get(URL, params=params) as resp:
-                # если статус запроса != ОК
-                if resp.status != 200:
-                    text = await resp.text()
-                    # вывод ошибки в терминал
-                    print(f"HTTP {resp.status}: {text}")
-                    return None
+    # без дедлайна пользователь ждал бы до общего таймаута HTTP-клиента
+    if deadline is None:
+        deadline = time.monotonic() + GEO_DEADLINE
+
+    # повторы при временных сбоях и общий с погодой выключатель: если OpenWeather лежит, не ждём таймаутов
+    try:
+        return await geo_retry.call(lambda timeout: _reverse_attempt(params, priority, deadline, timeout),
+                                    deadline, hedge=priority == Priority.INTERACTIVE)
+    except CircuitOpenError as e:
+        logger.warning(f"Геокодер OpenWeather: {e}")
+    except RetryableError as e:
+        logger.error(f"Геокодер OpenWeather: запрос не удался: {e}")
+    return None
+
+
+async def _reverse_attempt(params: Dict[str, str], priority: int, deadline: float,
+                           timeout: Optional[float]) -> Optional[Dict]:
+    """
+    Одна попытка запроса к геокодеру.
+    Временные сбои (5xx, таймаут, ошибка сети) — RetryableError, остальные ошибки — None.
+    """
+    # общий HTTP-клиент приложения: соединение с OpenWeather переиспользуется между запросами
+    session = http_client.session
+    started = None
+    outcome = "error"
+    try:
+        # общий с погодой лимит запросов к OpenWeather
+        await openweather_limiter.acquire(priority, deadline)
+        started = time.perf_counter()
+        # таймаут попытки не дальше дедлайна: часть времени могла уйти на очередь лимита
+        total = min(t for t in (timeout, deadline - time.monotonic()) if t is not None)
+        request_timeout = aiohttp.ClientTimeout(total=max(total, 0.001), connect=http_client.timeout.connect,
+                                                sock_read=http_client.timeout.sock_read)
+        async with session.get(URL, params=params, timeout=request_timeout) as resp:
+            # если статус запроса != ОК
+            if resp.status != 200:
+                outcome = f"http_{resp.status}"
+                text = await resp.text()
+                if resp.status >= 500:
+                    logger.warning(f"Геокодер OpenWeather: HTTP {resp.status}: {text}")
+                    raise RetryableError(f"HTTP {resp.status}")
+                logger.error(f"Геокодер OpenWeather: HTTP {resp.status}: {text}")
+                return None
                 
-                data = await resp.json()
-
-                # если API вернул пустой jsom-файл 
-                if not data:
-                    return None
-                place = data[0]
-
-                local_names = place.get("local_names", {})
-
-                # возвращаем все нужные данные
-                return {
-                    "name": place.get("name"),
-                    "ru_name": local_names.get("ru", place.get("name")),
-                    "en_name": local_names.get("en", place.get("name")),
-                    # "ba_name": local_names.get("ba", place.get("name")),
-                    "state": place.get("state"),
-                    "country": place.get("country"),
-                    "lat": place.get("lat"),
-                    "lon": place.get("lon")
-                }
-            
-        except asyncio.TimeoutError:
-            print("Timeout при запросе к OpenWeather.")
-        except aiohttp.ClientError as e:
-            print(f"Network/Client error: {e}")
+            # тело читаем байтами и разбираем быстрым парсером (orjson, если установлен)
+            data = loads(await resp.read())
+            outcome = "ok"
+
+            # если API вернул пустой jsom-файл 
+            if not data:
+                return None
+
+            place = data[0]
+            local_names = place.get("local_names") or {}
+
+            # возвращаем все нужные данные
+            return {
+                "name": place.get("name"),
+                "ru_name": local_names.get("ru", place.get("name")),
+                "en_name": local_names.get("en", place.get("name")),
+                "state": place.get("state"),
+                "country": place.get("country"),
+                "lat": place.get("lat"),
+                "lon": place.get("lon")
+            }
+        
+    except RateLimitTimeout as e:
+        logger.error(f"Геокодер OpenWeather: {e}")
+    except asyncio.TimeoutError:
+        outcome = "timeout"
+        logger.warning("Геокодер OpenWeather: таймаут запроса")
+        raise RetryableError("таймаут запроса") from None
+    except aiohttp.ClientError as e:
+        outcome = "client_error"
+        logger.warning(f"Геокодер OpenWeather: ошибка сети: {e}")
+        raise RetryableError(f"ошибка сети: {e}") from e
+    except asyncio.CancelledError:
+        # проигравший подстраховочный запрос
+        outcome = "cancelled"
+        raise
+    finally:
+        if started is not None:
+            upstream_latency.labels("openweather", "geo/reverse", outcome).observe(time.perf_counter() - started)
     return None
 
+
+
+# Результаты API кэшируются по ячейке ~1 км: повторные запросы из той же точки не ходят в сеть
+_api_memo = TTLCache(max_size=10_000, default_ttl=7 * 24 * 3600)
+# Те же ответы, но дольше: отдаются, если геокодер недоступен
+_api_stale = TTLCache(max_size=10_000, default_ttl=GEO_STALE_TTL)
+_MEMO_CELL_DEG = 0.01
+
+
+async def reverse_geocode(lat: float, lon: float) -> Optional[Dict]:
+    """
+    Определяет город по координатам.
+    Сначала ищет в локальном справочнике (services.geo_index), API вызывается
+    только если рядом нет ни одного города из справочника.
+
+    Если API недоступен, возвращает последний ответ для этой точки с пометкой "stale": True.
+
+    Returns:
+    Optional[Dict]: Словарь того же формата, что и get_location_from_coords_async.
+    """
+    place = reverse_geocoder.lookup(lat, lon)
+    if place is not None:
+        return place
+
+    key = cell_key(lat, lon, _MEMO_CELL_DEG)
+    place = _api_memo.get(key)
+    if place is None:
+        place = await get_location_from_coords_async(lat, lon)
+        if place is not None:
+            _api_memo.set(key, place)
+            _api_stale.set(key, place)
+        else:
+            stale = _api_stale.get(key)
+            if stale is not None:
+                place = {**stale, "stale": True}
+    return place
@@ -0,0 +1,88 @@
+"""
+Общий HTTP-клиент для всех запросов к OpenWeather.
+
+Одна aiohttp.ClientSession на всё приложение: соединения переиспользуются
+(keep-alive), DNS кэшируется, ответы приходят сжатыми (gzip).
+Открывается и закрывается вместе с Dispatcher (startup/shutdown).
+"""
+
+import os
+from typing import Optional
+
+import aiohttp
+
+from utils.logger import logger
+
+
+# Настройки пула соединений и таймаутов (секунды)
+HTTP_TOTAL_TIMEOUT = float(os.getenv("HTTP_TOTAL_TIMEOUT", "10"))
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "3"))
+HTTP_READ_TIMEOUT = float(os.getenv("HTTP_READ_TIMEOUT", "5"))
+HTTP_POOL_LIMIT = int(os.getenv("HTTP_POOL_LIMIT", "100"))
+HTTP_POOL_LIMIT_PER_HOST = int(os.getenv("HTTP_POOL_LIMIT_PER_HOST", "20"))
+HTTP_KEEPALIVE_TIMEOUT = float(os.getenv("HTTP_KEEPALIVE_TIMEOUT", "30"))
+HTTP_DNS_CACHE_TTL = int(os.getenv("HTTP_DNS_CACHE_TTL", "300"))
+
+
+class HttpClient:
+    """
+    Обёртка над общей aiohttp.ClientSession.
+    """
+
+    def __init__(self,
+                 total_timeout: float = HTTP_TOTAL_TIMEOUT,
+                 connect_timeout: float = HTTP_CONNECT_TIMEOUT,
+                 read_timeout: float = HTTP_READ_TIMEOUT,
+                 limit: int = HTTP_POOL_LIMIT,
+                 limit_per_host: int = HTTP_POOL_LIMIT_PER_HOST,
+                 keepalive_timeout: float = HTTP_KEEPALIVE_TIMEOUT,
+                 dns_cache_ttl: int = HTTP_DNS_CACHE_TTL):
+        self.timeout = aiohttp.ClientTimeout(
+            total=total_timeout,
+            connect=connect_timeout,
+            sock_read=read_timeout
+        )
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.keepalive_timeout = keepalive_timeout
+        self.dns_cache_ttl = dns_cache_ttl
+        self._session: Optional[aiohttp.ClientSession] = None
+
+    def _create_session(self) -> aiohttp.ClientSession:
+        connector = aiohttp.TCPConnector(
+            limit=self.limit,
+            limit_per_host=self.limit_per_host,
+            keepalive_timeout=self.keepalive_timeout,
+            ttl_dns_cache=self.dns_cache_ttl,
+            use_dns_cache=True
+        )
+        return aiohttp.ClientSession(
+            connector=connector,
+            timeout=self.timeout,
+            headers={"Accept-Encoding": "gzip, deflate"},
+            auto_decompress=True
+        )
+
+    async def start(self) -> None:
+        if self._session is None or self._session.closed:
+            self._session = self._create_session()
+            logger.info("HTTP-клиент запущен")
+
+    @property
+    def session(self) -> aiohttp.ClientSession:
+        """
+        Общая сессия. Если клиент ещё не запущен (например, в скриптах), создаётся лениво.
+        """
+        if self._session is None or self._session.closed:
+            self._session = self._create_session()
+        return self._session
+
+    async def close(self) -> None:
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+            logger.info("HTTP-клиент остановлен")
+
+
+# Общий клиент для всего бота
+http_client = HttpClient()
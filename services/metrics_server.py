@@ -0,0 +1,57 @@
+"""
+HTTP-эндпоинт с метриками в текстовом формате Prometheus (GET /metrics).
+"""
+
+import os
+from typing import Optional
+
+from aiohttp import web
+
+from utils.logger import logger
+from utils.metrics import Metrics, metrics
+
+
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+# 0 — не запускать эндпоинт. Воркеры супервизора слушают METRICS_PORT + 1 + номер воркера
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9108"))
+
+CONTENT_TYPE = "text/plain; version=0.0.4"
+
+
+class MetricsServer:
+    """
+    Небольшой aiohttp-сервер для сборщика метрик.
+    """
+
+    def __init__(self, registry: Metrics = metrics):
+        self.registry = registry
+        self._runner: Optional[web.AppRunner] = None
+
+    async def handle(self, request: web.Request) -> web.Response:
+        return web.Response(body=self.registry.render_prometheus().encode(), headers={"Content-Type": CONTENT_TYPE})
+
+    async def start(self, host: str = METRICS_HOST, port: int = METRICS_PORT) -> None:
+        if not port or self._runner is not None:
+            return
+        app = web.Application()
+        app.router.add_get("/metrics", self.handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        try:
+            await web.TCPSite(self._runner, host, port).start()
+        except OSError as e:
+            # Метрики не должны мешать запуску бота
+            logger.error(f"Не удалось открыть эндпоинт метрик на {host}:{port}: {e}")
+            await self._runner.cleanup()
+            self._runner = None
+            return
+        logger.info(f"Метрики доступны на http://{host}:{port}/metrics")
+
+    async def stop(self) -> None:
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+
+# Общий эндпоинт метрик процесса
+metrics_server = MetricsServer()
@@ -0,0 +1,303 @@
+"""
+Реестр функциональных модулей (modules/<имя>/).
+
+Каждый модуль описан лёгким манифестом modules/<имя>/manifest.json: откуда
+взять роутер, какие команды, префиксы callback-данных и группы состояний FSM
+он обрабатывает, нужны ли ему инлайн-запросы, где лежат его фоновые задачи.
+Манифесты читаются при старте, а сам модуль со всеми зависимостями
+импортируется при первом апдейте, который ему адресован (или при запуске его
+фоновых задач — они стартуют уже после того, как бот начал принимать апдейты).
+
+Пример манифеста:
+    {
+        "name": "weather",
+        "title": "Погода",
+        "router": "modules.weather.main:weather_router",
+        "commands": ["weather", "city"],
+        "callback_prefixes": ["weather:"],
+        "states": ["CityInput"],
+        "inline_queries": true,
+        "jobs": "modules.weather.jobs",
+        "order": 100
+    }
+
+Время импорта каждого модуля записывается и выводится в лог при старте
+(report()), а также отдаётся метрикой bot_module_import_seconds.
+"""
+
+import asyncio
+import importlib
+import json
+import os
+import sys
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+from aiogram import Bot, Router
+from aiogram.types import CallbackQuery, InlineQuery, Message
+
+from utils.logger import logger
+from utils.metrics import metrics
+
+
+MODULES_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "modules")
+MANIFEST_FILE = "manifest.json"
+# "0" — импортировать все модули сразу при создании Dispatcher (как раньше)
+MODULES_LAZY = os.getenv("MODULES_LAZY", "1") == "1"
+# Через сколько секунд после старта запускать фоновые задачи модулей: к этому времени
+# бот уже получает апдейты, и импорт модулей ради задач не задерживает первый ответ
+MODULE_JOBS_DELAY = float(os.getenv("MODULE_JOBS_DELAY", "1"))
+
+
+@dataclass(frozen=True, slots=True)
+class ModuleManifest:
+    """
+    Описание модуля из manifest.json.
+    """
+    name: str
+    title: str
+    router: str  # "пакет.модуль:атрибут"
+    commands: Tuple[str, ...] = ()
+    callback_prefixes: Tuple[str, ...] = ()
+    states: Tuple[str, ...] = ()  # группы состояний FSM (имена классов StatesGroup)
+    inline_queries: bool = False  # модуль обрабатывает инлайн-запросы (@bot текст)
+    jobs: Optional[str] = None  # модуль с async start(bot) и async stop()
+    order: int = 100
+
+    @classmethod
+    def from_file(cls, path: str) -> "ModuleManifest":
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        return cls(
+            name=data["name"],
+            title=data.get("title", data["name"]),
+            router=data["router"],
+            commands=tuple(data.get("commands", ())),
+            callback_prefixes=tuple(data.get("callback_prefixes", ())),
+            states=tuple(data.get("states", ())),
+            inline_queries=bool(data.get("inline_queries", False)),
+            jobs=data.get("jobs"),
+            order=int(data.get("order", 100)),
+        )
+
+    def matches_state(self, raw_state: Optional[str]) -> bool:
+        # Состояние FSM хранится как "ИмяГруппы:имя_состояния"
+        return bool(raw_state) and raw_state.split(":", 1)[0] in self.states
+
+    def matches_message(self, message: Message, raw_state: Optional[str]) -> bool:
+        text = message.text
+        if text and text.startswith("/"):
+            command = text[1:].split(maxsplit=1)[0].split("@", 1)[0] if len(text) > 1 else ""
+            if command in self.commands:
+                return True
+        return self.matches_state(raw_state)
+
+    def matches_callback(self, callback: CallbackQuery, raw_state: Optional[str]) -> bool:
+        data = callback.data
+        if data and self.callback_prefixes and data.startswith(self.callback_prefixes):
+            return True
+        return self.matches_state(raw_state)
+
+    def matches_inline_query(self, _: InlineQuery) -> bool:
+        return self.inline_queries
+
+
+def _never(*_: Any) -> bool:
+    return False
+
+
+async def _placeholder(*_: Any) -> None:
+    """
+    Никогда не вызывается (фильтр _never): нужен, чтобы Dispatcher знал, какие
+    типы апдейтов запрашивать у Telegram, ещё до загрузки модуля.
+    """
+
+
+class LazyModuleRouter(Router):
+    """
+    Роутер-заглушка модуля. Пропускает к модулю только адресованные ему апдейты
+    (команды, префиксы callback-данных и состояния из манифеста) и при первом
+    таком апдейте импортирует модуль и подключает его роутер к себе.
+    """
+
+    def __init__(self, manifest: ModuleManifest, registry: "ModuleRegistry"):
+        super().__init__(name=f"module:{manifest.name}")
+        self.manifest = manifest
+        self.registry = registry
+        self.loaded = False
+
+        # Корневые фильтры проверяются до обработчиков и вложенных роутеров:
+        # чужие апдейты отсекаются одной проверкой, модуль для них даже не импортируется.
+        # Фильтры асинхронные: синхронные aiogram выполняет в пуле потоков, а они на каждом апдейте
+        self.message.filter(self._accept_message)
+        self.callback_query.filter(self._accept_callback)
+        self.inline_query.filter(self._accept_inline_query)
+        if manifest.commands or manifest.states:
+            self.message.register(_placeholder, _never)
+        if manifest.callback_prefixes or manifest.states:
+            self.callback_query.register(_placeholder, _never)
+        if manifest.inline_queries:
+            self.inline_query.register(_placeholder, _never)
+
+    def load(self, trigger: str) -> None:
+        if not self.loaded:
+            self.include_router(self.registry.load(self.manifest.name, trigger))
+            self.loaded = True
+
+    async def _accept_message(self, message: Message, raw_state: Optional[str] = None) -> bool:
+        if not self.manifest.matches_message(message, raw_state):
+            return False
+        self.load("первый апдейт")
+        return True
+
+    async def _accept_callback(self, callback: CallbackQuery, raw_state: Optional[str] = None) -> bool:
+        if not self.manifest.matches_callback(callback, raw_state):
+            return False
+        self.load("первый апдейт")
+        return True
+
+    async def _accept_inline_query(self, inline_query: InlineQuery) -> bool:
+        if not self.manifest.matches_inline_query(inline_query):
+            return False
+        self.load("первый апдейт")
+        return True
+
+
+class ModuleRegistry:
+    """
+    Манифесты модулей, их роутеры и фоновые задачи, время импорта.
+    """
+
+    def __init__(self, root: str = MODULES_DIR, lazy: bool = MODULES_LAZY):
+        self.root = root
+        self.lazy = lazy
+        self._manifests: Optional[Dict[str, ModuleManifest]] = None
+        self._loaded: Dict[str, Router] = {}
+        self._started_jobs: List[Any] = []
+        self._jobs_task: Optional[asyncio.Task] = None
+        # {модуль: (секунды импорта, сколько модулей Python подтянул, что вызвало импорт)}
+        self.import_times: Dict[str, Tuple[float, int, str]] = {}
+        # Время чтения манифестов
+        self.discover_time = 0.0
+
+    @property
+    def manifests(self) -> Dict[str, ModuleManifest]:
+        if self._manifests is None:
+            self._manifests = self.discover()
+        return self._manifests
+
+    def discover(self) -> Dict[str, ModuleManifest]:
+        """
+        Читает манифесты modules/*/manifest.json (без импорта модулей).
+        """
+        started = time.perf_counter()
+        found = []
+        for entry in sorted(os.listdir(self.root)):
+            path = os.path.join(self.root, entry, MANIFEST_FILE)
+            if not os.path.isfile(path):
+                continue
+            try:
+                found.append(ModuleManifest.from_file(path))
+            except (OSError, ValueError, KeyError) as e:
+                logger.error(f"Манифест модуля {path} не прочитан: {e}")
+        self.discover_time = time.perf_counter() - started
+        return {manifest.name: manifest for manifest in sorted(found, key=lambda m: (m.order, m.name))}
+
+    def _import(self, target: str, trigger: str, name: str) -> Any:
+        """
+        Импортирует "пакет.модуль[:атрибут]" и записывает время импорта модулю name.
+        """
+        module_path, _, attr = target.partition(":")
+        before = len(sys.modules)
+        started = time.perf_counter()
+        obj = importlib.import_module(module_path)
+        elapsed = time.perf_counter() - started
+        imported = len(sys.modules) - before
+        logger.info(f"Модуль {name}: импорт {module_path} ({trigger}) — {elapsed * 1000:.0f} мс, "
+                    f"модулей Python: {imported}")
+        # Роутер и фоновые задачи одного модуля складываются; причиной считается первый импорт
+        total, total_imported, first_trigger = self.import_times.get(name, (0.0, 0, trigger))
+        self.import_times[name] = (total + elapsed, total_imported + imported, first_trigger)
+        return getattr(obj, attr) if attr else obj
+
+    def load(self, name: str, trigger: str = "явно") -> Router:
+        """
+        Импортирует модуль и возвращает его роутер.
+        """
+        router = self._loaded.get(name)
+        if router is None:
+            manifest = self.manifests[name]
+            router = self._loaded[name] = self._import(manifest.router, trigger, name)
+        return router
+
+    def routers(self) -> List[Router]:
+        """
+        Роутеры всех модулей в порядке order: заглушки или (MODULES_LAZY=0) сразу настоящие.
+        """
+        routers = []
+        for manifest in self.manifests.values():
+            router = LazyModuleRouter(manifest, self)
+            if not self.lazy:
+                router.load("старт")
+            routers.append(router)
+        return routers
+
+    async def start_jobs(self, bot: Bot) -> None:
+        """
+        Запускает фоновые задачи модулей (для этого модуль импортируется).
+        """
+        for manifest in self.manifests.values():
+            if manifest.jobs is None:
+                continue
+            jobs = self._import(manifest.jobs, "фоновые задачи", manifest.name)
+            # Запоминаем до start: если запуск прервут на полпути, stop_jobs всё равно остановит запущенное
+            self._started_jobs.append(jobs)
+            await jobs.start(bot)
+
+    def schedule_jobs(self, bot: Bot, delay: float = MODULE_JOBS_DELAY) -> None:
+        """
+        Запускает фоновые задачи модулей в отдельной задаче через delay секунд:
+        startup-хук не ждёт импорта модулей, и бот начинает принимать апдейты сразу.
+        """
+        if self._jobs_task is None or self._jobs_task.done():
+            self._jobs_task = asyncio.create_task(self._start_jobs_later(bot, delay))
+
+    async def _start_jobs_later(self, bot: Bot, delay: float) -> None:
+        await asyncio.sleep(delay)
+        try:
+            await self.start_jobs(bot)
+        except Exception as e:
+            logger.error(f"Не удалось запустить фоновые задачи модулей: {e}")
+
+    async def stop_jobs(self) -> None:
+        # Остановка раньше, чем задачи успели запуститься: отменяем запуск
+        if self._jobs_task is not None:
+            self._jobs_task.cancel()
+            try:
+                await self._jobs_task
+            except asyncio.CancelledError:
+                pass
+            self._jobs_task = None
+        while self._started_jobs:
+            await self._started_jobs.pop().stop()
+
+    def report(self) -> str:
+        """
+        Время импорта по модулям: загруженные и ещё не загруженные.
+        """
+        lines = [f"манифесты: {len(self.manifests)} шт. за {self.discover_time * 1000:.1f} мс"]
+        for name, manifest in self.manifests.items():
+            if name in self.import_times:
+                elapsed, imported, trigger = self.import_times[name]
+                lines.append(f"{name}: {elapsed * 1000:.0f} мс, модулей Python {imported} ({trigger})")
+            else:
+                lines.append(f"{name}: не загружен — загрузится при первом обращении")
+        return "; ".join(lines)
+
+
+module_registry = ModuleRegistry()
+
+metrics.gauge("bot_module_import_seconds", "Время импорта функционального модуля",
+              lambda: {(name,): elapsed for name, (elapsed, _, _) in module_registry.import_times.items()},
+              ("module",))
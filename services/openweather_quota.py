@@ -0,0 +1,46 @@
+"""
+Общий лимит запросов к OpenWeather и общий выключатель.
+
+Лимит тарифа считается на API-ключ, поэтому погода и геокодирование
+делят один ограничитель. Недоступность API тоже общая — выключатель один.
+"""
+
+import os
+
+from utils.rate_limiter import PriorityRateLimiter
+from utils.resilience import CircuitBreaker
+
+
+# Лимит тарифа (запросов в минуту). Бесплатный тариф — 60.
+OPENWEATHER_CALLS_PER_MINUTE = float(os.getenv("OPENWEATHER_CALLS_PER_MINUTE", "60"))
+# Сколько запросов можно отправить подряд, если до этого было тихо
+OPENWEATHER_BURST = float(os.getenv("OPENWEATHER_BURST", "10"))
+
+openweather_limiter = PriorityRateLimiter(
+    rate=OPENWEATHER_CALLS_PER_MINUTE / 60,
+    capacity=OPENWEATHER_BURST
+)
+
+
+def share_openweather_budget(workers: int) -> None:
+    """
+    Делит лимит тарифа поровну между процессами-воркерами.
+
+    Ограничитель у каждого процесса свой, а лимит на API-ключ общий: без деления
+    BOT_WORKERS воркеров вместе отправили бы в BOT_WORKERS раз больше запросов.
+    """
+    openweather_limiter.configure(
+        rate=OPENWEATHER_CALLS_PER_MINUTE / 60 / workers,
+        capacity=max(1.0, OPENWEATHER_BURST / workers)
+    )
+
+
+# Выключатель: после OPENWEATHER_BREAKER_FAILURES временных сбоев подряд запросы к API
+# на OPENWEATHER_BREAKER_RESET секунд не отправляются, бот сразу отвечает из кэша
+OPENWEATHER_BREAKER_FAILURES = int(os.getenv("OPENWEATHER_BREAKER_FAILURES", "5"))
+OPENWEATHER_BREAKER_RESET = float(os.getenv("OPENWEATHER_BREAKER_RESET", "30"))
+
+openweather_breaker = CircuitBreaker(
+    failure_threshold=OPENWEATHER_BREAKER_FAILURES,
+    reset_timeout=OPENWEATHER_BREAKER_RESET
+)
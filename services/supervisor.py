@@ -0,0 +1,372 @@
+"""
+Обработка апдейтов в нескольких процессах.
+
+Супервизор сам получает апдейты (long polling или вебхук) и раздаёт их
+BOT_WORKERS процессам-воркерам. Воркер выбирается по id пользователя (или чата),
+поэтому все апдейты одного пользователя попадают в один процесс: порядок
+сохраняется, а FSM-состояние и горячие кэши пользователя живут в одном месте.
+В каждом воркере свой Dispatcher и event loop; апдейты разных пользователей
+обрабатываются параллельно, одного пользователя — строго по очереди.
+
+Фоновые задачи (предзагрузка погоды, утренняя рассылка) запускаются только
+в воркере 0 — startup-хуки получают аргумент background_jobs.
+
+Упавший воркер (процесс завершился — есть exitcode) супервизор перезапускает;
+апдейты, ещё лежавшие в его очереди, переходят новому процессу. Лимит
+запросов к OpenWeather делится между воркерами поровну.
+"""
+
+import asyncio
+import multiprocessing
+import os
+import queue
+import signal
+import time
+from typing import Optional, Dict, List, Any, Callable
+
+from aiogram import Bot, Dispatcher
+from aiogram.exceptions import TelegramNetworkError, TelegramServerError
+
+from services.metrics_server import metrics_server, METRICS_PORT
+from services.webhook import WebhookServer
+from utils.logger import logger
+from utils.metrics import metrics
+
+
+BOT_WORKERS = int(os.getenv("BOT_WORKERS", "1"))
+# Сколько апдейтов может ждать в очереди одного воркера
+WORKER_QUEUE_SIZE = int(os.getenv("BOT_WORKER_QUEUE_SIZE", "10000"))
+# Сколько апдейтов воркер обрабатывает одновременно
+WORKER_CONCURRENCY = int(os.getenv("BOT_WORKER_CONCURRENCY", "100"))
+WORKER_START_TIMEOUT = float(os.getenv("BOT_WORKER_START_TIMEOUT", "60"))
+WORKER_STOP_TIMEOUT = float(os.getenv("BOT_WORKER_STOP_TIMEOUT", "15"))
+# Как часто проверять, живы ли воркеры (секунды)
+WORKER_CHECK_INTERVAL = float(os.getenv("BOT_WORKER_CHECK_INTERVAL", "1"))
+# Сколько ждать места в очереди воркера, прежде чем проверить, жив ли он (секунды)
+WORKER_PUT_TIMEOUT = float(os.getenv("BOT_WORKER_PUT_TIMEOUT", "1"))
+# Как часто писать в лог глубину очередей воркеров (секунды)
+SUPERVISOR_STATS_INTERVAL = float(os.getenv("SUPERVISOR_STATS_INTERVAL", "60"))
+POLLING_TIMEOUT = 30
+
+
+def shard_key(update: Dict[str, Any]) -> int:
+    """
+    Ключ распределения апдейта: id пользователя, иначе id чата, иначе update_id.
+    """
+    for name, event in update.items():
+        if name == "update_id" or not isinstance(event, dict):
+            continue
+        for field in ("from", "user", "chat"):
+            value = event.get(field)
+            if isinstance(value, dict) and "id" in value:
+                return int(value["id"])
+        message = event.get("message")
+        if isinstance(message, dict) and isinstance(message.get("chat"), dict):
+            return int(message["chat"]["id"])
+    return int(update.get("update_id", 0))
+
+
+async def _feed_ordered(dispatcher: Dispatcher, bot: Bot, update: Dict[str, Any],
+                        previous: Optional[asyncio.Task], semaphore: asyncio.Semaphore,
+                        processed, index: int) -> None:
+    try:
+        # Апдейт пользователя обрабатывается только после его предыдущего апдейта
+        if previous is not None:
+            await asyncio.wait([previous])
+        await dispatcher.feed_raw_update(bot, update)
+    except Exception as e:
+        logger.error(f"Воркер {index}: ошибка обработки апдейта {update.get('update_id')}: {e}")
+    finally:
+        semaphore.release()
+        with processed.get_lock():
+            processed[index] += 1
+
+
+async def _worker_loop(index: int, create_dispatcher: Callable[[], Dispatcher], token: str,
+                       updates, processed, ready, concurrency: int) -> None:
+    bot = Bot(token=token)
+    dispatcher = create_dispatcher()
+    await dispatcher.emit_startup(bot=bot, dispatcher=dispatcher, background_jobs=index == 0, worker_index=index)
+    ready.set()
+
+    loop = asyncio.get_running_loop()
+    semaphore = asyncio.Semaphore(concurrency)
+    # Последний апдейт каждого пользователя: {ключ: задача}
+    chains: Dict[int, asyncio.Task] = {}
+
+    def forget(key: int, task: asyncio.Task) -> None:
+        if chains.get(key) is task:
+            del chains[key]
+
+    try:
+        while True:
+            item = await loop.run_in_executor(None, updates.get)
+            if item is None:
+                break
+            key, update = item
+            await semaphore.acquire()
+            task = asyncio.create_task(_feed_ordered(dispatcher, bot, update, chains.get(key), semaphore,
+                                                     processed, index))
+            chains[key] = task
+            task.add_done_callback(lambda t, k=key: forget(k, t))
+        await asyncio.gather(*chains.values(), return_exceptions=True)
+    finally:
+        await dispatcher.emit_shutdown(bot=bot, dispatcher=dispatcher, background_jobs=index == 0, worker_index=index)
+        await bot.session.close()
+
+
+def worker_main(index: int, create_dispatcher: Callable[[], Dispatcher], token: str,
+                updates, processed, ready, workers: int = 1, concurrency: int = WORKER_CONCURRENCY) -> None:
+    """
+    Точка входа процесса-воркера.
+    """
+    from services.openweather_quota import share_openweather_budget
+
+    # Ctrl+C получает вся группа процессов — воркер останавливает супервизор, а не сигнал
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    share_openweather_budget(workers)
+    asyncio.run(_worker_loop(index, create_dispatcher, token, updates, processed, ready, concurrency))
+
+
+class Supervisor:
+    """
+    Запускает воркеры, раздаёт им апдейты и следит за глубиной их очередей.
+    """
+
+    def __init__(self,
+                 create_dispatcher: Callable[[], Dispatcher],
+                 token: str,
+                 workers: int = BOT_WORKERS,
+                 queue_size: int = WORKER_QUEUE_SIZE):
+        """
+        :param create_dispatcher: Функция уровня модуля, собирающая Dispatcher (вызывается в каждом воркере).
+        :param token: Токен бота.
+        :param workers: Количество процессов-воркеров.
+        """
+        self.create_dispatcher = create_dispatcher
+        self.token = token
+        self.workers = workers
+        self.queue_size = queue_size
+        self._context = multiprocessing.get_context("spawn")
+        self._processes: List[multiprocessing.Process] = []
+        self._queues: list = []
+        # События готовности воркеров: держим ссылки, пока процесс не подхватит событие
+        self._ready: list = []
+        # Воркеры, в чью полную очередь сейчас кладётся апдейт: их перезапускает dispatch, а не проверка
+        self._putting: set = set()
+        # Сколько апдейтов отдано воркеру и сколько он уже обработал
+        self._sent = [0] * workers
+        self._processed = self._context.Array("q", workers)
+        self._stats_task: Optional[asyncio.Task] = None
+        self._watch_task: Optional[asyncio.Task] = None
+
+        # Счётчики для мониторинга
+        self.restarts = 0
+        self.lost = 0
+
+    def _spawn(self, index: int, updates) -> Any:
+        """
+        Запускает процесс-воркер index на очереди updates.
+
+        :return: Событие готовности воркера.
+        """
+        ready = self._context.Event()
+        process = self._context.Process(
+            target=worker_main,
+            args=(index, self.create_dispatcher, self.token, updates, self._processed, ready, self.workers),
+            name=f"bot-worker-{index}",
+            daemon=True
+        )
+        process.start()
+        if index < len(self._processes):
+            self._queues[index], self._processes[index], self._ready[index] = updates, process, ready
+        else:
+            self._queues.append(updates)
+            self._processes.append(process)
+            self._ready.append(ready)
+        return ready
+
+    async def start(self) -> None:
+        ready_events = [self._spawn(index, self._context.Queue(maxsize=self.queue_size))
+                        for index in range(self.workers)]
+
+        deadline = time.monotonic() + WORKER_START_TIMEOUT
+        for index, ready in enumerate(ready_events):
+            # Ждём готовности, но не дольше, чем живёт сам процесс (упавший воркер не ждём до таймаута)
+            while not await asyncio.to_thread(ready.wait, 0.5):
+                if not self._processes[index].is_alive():
+                    raise RuntimeError(f"Воркер {index} завершился при запуске (код {self._processes[index].exitcode})")
+                if time.monotonic() > deadline:
+                    raise RuntimeError(f"Воркер {index} не запустился за {WORKER_START_TIMEOUT:.0f} с")
+        logger.info(f"Запущено воркеров: {self.workers}")
+        metrics.gauge(
+            "bot_worker_queue_depth", "Апдейтов, отданных воркеру и ещё не обработанных",
+            lambda: {(str(worker["worker"]),): worker["queue_depth"] for worker in self.stats()["workers"]},
+            ("worker",)
+        )
+        metrics.gauge("bot_worker_restarts", "Перезапусков упавших воркеров", lambda: self.restarts)
+        metrics.gauge("bot_worker_lost_updates", "Апдейтов, потерянных вместе с упавшими воркерами",
+                      lambda: self.lost)
+        self._stats_task = asyncio.create_task(self._stats_loop())
+        self._watch_task = asyncio.create_task(self._watch_loop())
+
+    def _restart(self, index: int) -> None:
+        """
+        Перезапускает завершившийся воркер; ещё не взятые им апдейты переходят новому процессу.
+        """
+        process = self._processes[index]
+        old = self._queues[index]
+        updates = self._context.Queue(maxsize=self.queue_size)
+        moved = 0
+        # get_nowait не ждёт блокировку чтения: если воркер упал, держа её, остаток очереди теряется
+        while True:
+            try:
+                item = old.get_nowait()
+            except (queue.Empty, OSError, EOFError):
+                break
+            updates.put_nowait(item)
+            moved += 1
+        old.close()
+        old.cancel_join_thread()
+
+        # Апдейты, которые воркер взял из очереди, но не обработал, пропали вместе с ним
+        lost = max(0, self._sent[index] - self._processed[index] - moved)
+        self._sent[index] = self._processed[index] + moved
+        self.lost += lost
+        self.restarts += 1
+        logger.error(f"Воркер {index} завершился (код {process.exitcode}), перезапускаем; "
+                     f"апдейтов в очереди: {moved}, потеряно: {lost}")
+        self._spawn(index, updates)
+
+    async def _watch_loop(self) -> None:
+        while True:
+            await asyncio.sleep(WORKER_CHECK_INTERVAL)
+            for index, process in enumerate(self._processes):
+                if process.exitcode is not None and index not in self._putting:
+                    self._restart(index)
+
+    async def dispatch(self, update: Dict[str, Any]) -> None:
+        """
+        Передаёт апдейт воркеру, отвечающему за его пользователя.
+        Если очередь воркера заполнена — ждём (обратное давление на приём апдейтов).
+        """
+        key = shard_key(update)
+        index = key % self.workers
+        item = (key, update)
+        try:
+            self._queues[index].put_nowait(item)
+        except queue.Full:
+            # Ждём с таймаутом: упавший воркер очередь не разберёт, его нужно перезапустить.
+            # Очередь берём заново на каждой попытке — после перезапуска она новая
+            self._putting.add(index)
+            try:
+                while True:
+                    try:
+                        await asyncio.to_thread(self._queues[index].put, item, True, WORKER_PUT_TIMEOUT)
+                        break
+                    except queue.Full:
+                        if self._processes[index].exitcode is not None:
+                            self._restart(index)
+            finally:
+                self._putting.discard(index)
+        self._sent[index] += 1
+
+    async def poll(self, bot: Bot, allowed_updates: Optional[List[str]] = None) -> None:
+        """
+        Long polling в супервизоре: апдейты не обрабатываются здесь, а раздаются воркерам.
+        """
+        offset = None
+        backoff = 1.0
+        while True:
+            try:
+                updates = await bot.get_updates(offset=offset, timeout=POLLING_TIMEOUT, allowed_updates=allowed_updates)
+                backoff = 1.0
+            except (TelegramNetworkError, TelegramServerError) as e:
+                logger.error(f"Ошибка получения апдейтов, повтор через {backoff:.0f} с: {e}")
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, 30.0)
+                continue
+            for update in updates:
+                await self.dispatch(update.model_dump(mode="json", by_alias=True, exclude_none=True))
+                offset = update.update_id + 1
+
+    async def stop(self) -> None:
+        for task in (self._stats_task, self._watch_task):
+            if task is not None:
+                task.cancel()
+        self._stats_task = self._watch_task = None
+        deadline = time.monotonic() + WORKER_STOP_TIMEOUT
+        # Сигнал остановки встаёт в очередь после уже принятых апдейтов — воркер их дообработает
+        for index, updates in enumerate(self._queues):
+            if self._processes[index].exitcode is not None:
+                continue
+            try:
+                await asyncio.to_thread(updates.put, None, True, max(0.0, deadline - time.monotonic()))
+            except queue.Full:
+                logger.error(f"Воркер {index} не разбирает очередь, сигнал остановки не отправлен")
+        for index, process in enumerate(self._processes):
+            await asyncio.to_thread(process.join, max(0.0, deadline - time.monotonic()))
+            if process.is_alive():
+                logger.error(f"Воркер {index} не остановился за {WORKER_STOP_TIMEOUT:.0f} с, завершаем принудительно")
+                process.terminate()
+                await asyncio.to_thread(process.join)
+        self._processes = []
+        self._queues = []
+        self._ready = []
+        logger.info(f"Воркеры остановлены: {self.stats()}")
+
+    async def _stats_loop(self) -> None:
+        while True:
+            await asyncio.sleep(SUPERVISOR_STATS_INTERVAL)
+            depths = [worker["queue_depth"] for worker in self.stats()["workers"]]
+            logger.info(f"Глубина очередей воркеров: {depths}")
+
+    def stats(self) -> dict:
+        workers = []
+        for index in range(self.workers):
+            processed = self._processed[index]
+            workers.append({
+                "worker": index,
+                "alive": index < len(self._processes) and self._processes[index].is_alive(),
+                "sent": self._sent[index],
+                "processed": processed,
+                "queue_depth": self._sent[index] - processed,
+            })
+        return {
+            "workers": workers,
+            "queue_depth": sum(worker["queue_depth"] for worker in workers),
+            "restarts": self.restarts,
+            "lost": self.lost,
+        }
+
+
+async def run_supervisor(create_dispatcher: Callable[[], Dispatcher], token: str, mode: str = "polling",
+                         workers: int = BOT_WORKERS) -> None:
+    """
+    Запуск бота в несколько процессов. mode — источник апдейтов: "polling" или "webhook".
+    """
+    # Dispatcher супервизора нужен только для списка используемых типов апдейтов
+    dispatcher = create_dispatcher()
+    bot = Bot(token=token)
+    supervisor = Supervisor(create_dispatcher, token, workers)
+    server = None
+    if mode == "webhook":
+        # Создаём до запуска воркеров: без WEBHOOK_SECRET сервер не создаётся и бот не стартует.
+        # Один обработчик сохраняет порядок прихода апдейтов; dispatch только кладёт апдейт в очередь
+        server = WebhookServer(dispatcher, bot, handler=supervisor.dispatch, concurrency=1)
+    await supervisor.start()
+    # Метрики супервизора (глубина очередей воркеров) — на METRICS_PORT, воркеров — на следующих портах
+    await metrics_server.start(port=METRICS_PORT)
+    try:
+        if server is not None:
+            await server.start()
+            await asyncio.Event().wait()
+        else:
+            await bot.delete_webhook()
+            await supervisor.poll(bot, dispatcher.resolve_used_update_types())
+    finally:
+        if server is not None:
+            await server.stop()
+        await supervisor.stop()
+        await metrics_server.stop()
+        await bot.session.close()
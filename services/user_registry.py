@@ -0,0 +1,403 @@
+"""
+Резидентный реестр пользователей.
+
+Горячим хендлерам (например, cmd_start) нужно знать только, есть ли пользователь,
+и несколько полей: город, координаты и настройки. Реестр загружается из UserStore
+один раз при старте и хранит эти поля по колонкам (массивы, индекс по Telegram id),
+чтобы миллион пользователей занимал порядка 150 МБ.
+
+Записи копятся в памяти и сбрасываются в хранилище пачками:
+по таймеру, при достижении порога и при остановке бота.
+"""
+
+import asyncio
+import math
+import os
+import sys
+from array import array
+from bisect import bisect_left, bisect_right
+from functools import lru_cache
+from typing import Optional, Dict, Any, Iterator, Tuple, Set
+
+from services.geo_index import reverse_geocoder
+from services.user_store import UserStore, user_store
+from utils.geo_grid import cell_center, cell_key
+from utils.logger import logger
+
+
+# Как часто сбрасывать изменения в хранилище (секунды) и при каком числе изменений сбрасывать сразу
+FLUSH_INTERVAL = float(os.getenv("USER_REGISTRY_FLUSH_INTERVAL", "5"))
+FLUSH_SIZE = int(os.getenv("USER_REGISTRY_FLUSH_SIZE", "500"))
+# Как часто перечитывать хранилище, если пользователей меняют и другие процессы (секунды)
+RELOAD_INTERVAL = float(os.getenv("USER_REGISTRY_RELOAD_INTERVAL", "60"))
+
+# Утренняя рассылка: время по умолчанию и часовой пояс, если нет ни настройки, ни координат
+DIGEST_DEFAULT_TIME = os.getenv("DIGEST_DEFAULT_TIME", "07:00")
+DIGEST_DEFAULT_TZ = os.getenv("DIGEST_DEFAULT_TZ", "Europe/Moscow")
+# В каком радиусе искать город справочника, чей часовой пояс взять для координат пользователя (км)
+DIGEST_TZ_RADIUS_KM = float(os.getenv("DIGEST_TZ_RADIUS_KM", "300"))
+
+_NO_COORD = math.nan
+
+# (ячейка сетки, язык, часовой пояс, минута рассылки или None)
+ScheduleKey = Tuple[Tuple[int, int], Optional[str], str, Optional[int]]
+
+
+def _parse_minute(value: Optional[str]) -> int:
+    """
+    "07:30" -> 450 (минута суток).
+    """
+    try:
+        hours, minutes = (value or DIGEST_DEFAULT_TIME).split(":")
+        return (int(hours) * 60 + int(minutes)) % 1440
+    except ValueError:
+        return _parse_minute(DIGEST_DEFAULT_TIME)
+
+
+@lru_cache(maxsize=65536)
+def _cell_timezone(cell: Tuple[int, int]) -> Optional[str]:
+    # Часовой пояс ближайшего города справочника GeoNames — один поиск на ячейку сетки
+    lat, lon = cell_center(cell)
+    place = reverse_geocoder.nearest(lat, lon) or reverse_geocoder.nearest(lat, lon, DIGEST_TZ_RADIUS_KM)
+    return place.timezone if place else None
+
+
+def digest_timezone(timezone: Optional[str], lat: Optional[float], lon: Optional[float]) -> str:
+    """
+    Часовой пояс для рассылки: из настроек, иначе ближайшего города справочника, иначе по умолчанию.
+
+    Часовые пояса не совпадают с полосами по 15° долготы (Санкт-Петербург на 30° в.д. живёт
+    по UTC+3), поэтому по координатам берём пояс из GeoNames. Справочник должен быть
+    загружен до реестра пользователей.
+    """
+    if timezone:
+        return timezone
+    if lat is not None and lon is not None and not (math.isnan(lat) or math.isnan(lon)):
+        return _cell_timezone(cell_key(lat, lon)) or DIGEST_DEFAULT_TZ
+    return DIGEST_DEFAULT_TZ
+
+
+def _intern(value: Optional[str]) -> Optional[str]:
+    # Города, языки и часовые пояса сильно повторяются — храним одну копию строки
+    return sys.intern(value) if value else None
+
+
+class UserRecord:
+    """
+    Компактное представление пользователя для хендлеров.
+    """
+    __slots__ = ("id", "city", "lat", "lon", "notifications", "language", "timezone")
+
+    def __init__(self, id: int, city: Optional[str], lat: Optional[float], lon: Optional[float],
+                 notifications: bool, language: Optional[str], timezone: Optional[str]):
+        self.id = id
+        self.city = city
+        self.lat = lat
+        self.lon = lon
+        self.notifications = notifications
+        self.language = language
+        self.timezone = timezone
+
+    @property
+    def has_location(self) -> bool:
+        return self.lat is not None and self.lon is not None
+
+
+class UserRegistry:
+    """
+    Реестр пользователей с колоночным хранением и отложенной записью (write-behind).
+    """
+
+    def __init__(self, store: UserStore):
+        self.store = store
+
+        # Telegram id -> номер строки в колонках
+        self._index: Dict[int, int] = {}
+        self._city: list = []
+        self._lat = array("d")
+        self._lon = array("d")
+        self._notifications = bytearray()
+        self._language: list = []
+        self._timezone: list = []
+        self._digest_minute = array("H")
+        # Часовой пояс пользователя для рассылки и предзагрузки (None — нет координат):
+        # определяется один раз при записи
+        self._local_tz: list = []
+
+        # Сводка для предзагрузки погоды: {(ячейка сетки, язык, часовой пояс, минута рассылки
+        # или None — не подписан): сколько пользователей}. Ключей на порядки меньше, чем пользователей
+        self._schedule: Dict[ScheduleKey, int] = {}
+
+        # Получатели рассылки по корзинам: {(часовой пояс, минута суток): id по возрастанию}.
+        # Массив int64 вместо множества: 8 байт на получателя и обход курсором по id
+        self._digest_buckets: Dict[Tuple[str, int], array] = {}
+
+        # Изменённые, но ещё не сохранённые записи: {user_id: полные данные пользователя}
+        self._dirty: Dict[int, Dict[str, Any]] = {}
+        self._flush_lock = asyncio.Lock()
+        self._flush_task: Optional[asyncio.Task] = None
+        self._reload_task: Optional[asyncio.Task] = None
+        self._size_flush: Optional[asyncio.Task] = None
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def __contains__(self, user_id: int) -> bool:
+        return user_id in self._index
+
+    def exists(self, user_id: int) -> bool:
+        """
+        Проверка регистрации пользователя — один поиск в словаре.
+        """
+        return user_id in self._index
+
+    def get(self, user_id: int) -> Optional[UserRecord]:
+        row = self._index.get(user_id)
+        if row is None:
+            return None
+        lat, lon = self._lat[row], self._lon[row]
+        return UserRecord(
+            id=user_id,
+            city=self._city[row],
+            lat=None if math.isnan(lat) else lat,
+            lon=None if math.isnan(lon) else lon,
+            notifications=bool(self._notifications[row]),
+            language=self._language[row],
+            timezone=self._timezone[row],
+        )
+
+    def schedule(self) -> Dict[ScheduleKey, int]:
+        """
+        Пользователи с указанным местоположением, сгруппированные по
+        (ячейка сетки, язык, часовой пояс, минута рассылки или None — не подписан):
+        {ключ: сколько пользователей}. Обновляется при каждой записи в реестр.
+        """
+        return self._schedule
+
+    def _schedule_key(self, row: int) -> Optional[ScheduleKey]:
+        tz = self._local_tz[row]
+        if tz is None:
+            return None
+        minute = self._digest_minute[row] if self._notifications[row] else None
+        return cell_key(self._lat[row], self._lon[row]), self._language[row], tz, minute
+
+    def _schedule_move(self, old_key: Optional[ScheduleKey], new_key: Optional[ScheduleKey]) -> None:
+        if old_key == new_key:
+            return
+        if old_key is not None:
+            count = self._schedule[old_key] - 1
+            if count:
+                self._schedule[old_key] = count
+            else:
+                del self._schedule[old_key]
+        if new_key is not None:
+            self._schedule[new_key] = self._schedule.get(new_key, 0) + 1
+
+    def _digest_key(self, row: int) -> Optional[Tuple[str, int]]:
+        # В рассылку попадают только пользователи с уведомлениями и координатами (для прогноза)
+        tz = self._local_tz[row]
+        return None if tz is None or not self._notifications[row] else (tz, self._digest_minute[row])
+
+    def _resolve_local_tz(self, row: int) -> Optional[str]:
+        if math.isnan(self._lat[row]) or math.isnan(self._lon[row]):
+            return None
+        return _intern(digest_timezone(self._timezone[row], self._lat[row], self._lon[row]))
+
+    def _bucket_add(self, key: Tuple[str, int], user_id: int) -> None:
+        bucket = self._digest_buckets.get(key)
+        if bucket is None:
+            bucket = self._digest_buckets[key] = array("q")
+        # Хранилище отдаёт пользователей по возрастанию id, новые id тоже растут — обычно это просто append
+        if not bucket or bucket[-1] < user_id:
+            bucket.append(user_id)
+            return
+        pos = bisect_left(bucket, user_id)
+        if pos == len(bucket) or bucket[pos] != user_id:
+            bucket.insert(pos, user_id)
+
+    def _bucket_discard(self, key: Tuple[str, int], user_id: int) -> None:
+        bucket = self._digest_buckets.get(key)
+        if bucket is None:
+            return
+        pos = bisect_left(bucket, user_id)
+        if pos < len(bucket) and bucket[pos] == user_id:
+            del bucket[pos]
+            if not bucket:
+                del self._digest_buckets[key]
+
+    def digest_timezones(self) -> Set[str]:
+        """
+        Часовые пояса, в которых есть получатели рассылки.
+        """
+        return {tz for tz, _ in self._digest_buckets}
+
+    def digest_count(self, timezone: str, minute: int) -> int:
+        """
+        Сколько получателей у рассылки для часового пояса и минуты суток.
+        """
+        return len(self._digest_buckets.get((timezone, minute), ()))
+
+    def digest_recipients(self, timezone: str, minute: int, after: Optional[int] = None) -> Iterator[int]:
+        """
+        Получатели рассылки для часового пояса и минуты суток (по местному времени)
+        по возрастанию id, начиная со следующего после after.
+
+        Курсор — последний выданный id, а не позиция: пока идёт рассылка, пользователи
+        могут добавляться в корзину и уходить из неё.
+        """
+        key = (timezone, minute)
+        bucket = self._digest_buckets.get(key)
+        pos = 0 if after is None or bucket is None else bisect_right(bucket, after)
+        while bucket is not None and pos < len(bucket):
+            user_id = bucket[pos]
+            yield user_id
+            bucket = self._digest_buckets.get(key)
+            pos = 0 if bucket is None else bisect_right(bucket, user_id)
+
+    def _put(self, user_id: int, data: Dict[str, Any]) -> None:
+        """
+        Записывает компактные поля пользователя в колонки (без сохранения на диск).
+        """
+        location = data.get("location") or {}
+        preferences = data.get("preferences") or {}
+        lat = location.get("lat")
+        lon = location.get("lon")
+
+        row = self._index.get(user_id)
+        if row is None:
+            row = len(self._city)
+            self._index[user_id] = row
+            self._city.append(None)
+            self._lat.append(_NO_COORD)
+            self._lon.append(_NO_COORD)
+            self._notifications.append(0)
+            self._language.append(None)
+            self._timezone.append(None)
+            self._digest_minute.append(0)
+            self._local_tz.append(None)
+            old_key = old_schedule = None
+        else:
+            old_key = self._digest_key(row)
+            old_schedule = self._schedule_key(row)
+
+        self._city[row] = _intern(data.get("city"))
+        self._lat[row] = _NO_COORD if lat is None else float(lat)
+        self._lon[row] = _NO_COORD if lon is None else float(lon)
+        self._notifications[row] = 1 if preferences.get("notifications") else 0
+        self._language[row] = _intern(preferences.get("language"))
+        self._timezone[row] = _intern(preferences.get("timezone"))
+        self._digest_minute[row] = _parse_minute(preferences.get("digest_time"))
+
+        self._local_tz[row] = self._resolve_local_tz(row)
+        self._schedule_move(old_schedule, self._schedule_key(row))
+
+        # Переносим пользователя в нужную корзину рассылки
+        new_key = self._digest_key(row)
+        if new_key != old_key:
+            if old_key is not None:
+                self._bucket_discard(old_key, user_id)
+            if new_key is not None:
+                self._bucket_add(new_key, user_id)
+
+    def upsert(self, user_id: int, data: Dict[str, Any]) -> None:
+        """
+        Обновляет пользователя в памяти и ставит запись в очередь на сохранение.
+
+        :param user_id: Telegram id пользователя.
+        :param data: Полные данные пользователя (как в хранилище).
+        """
+        self._put(user_id, data)
+        self._dirty[user_id] = data
+        if len(self._dirty) >= FLUSH_SIZE and (self._size_flush is None or self._size_flush.done()):
+            self._size_flush = asyncio.create_task(self.flush())
+
+    async def update_location(self, user_id: int, city: str, lat: float, lon: float) -> bool:
+        """
+        Меняет город и координаты зарегистрированного пользователя, остальные поля не трогает.
+
+        :return: False, если пользователь не зарегистрирован.
+        """
+        data = self._dirty.get(user_id)
+        if data is None:
+            if user_id not in self._index:
+                return False
+            data = await self.store.get_user(user_id)
+            # Пока читали хранилище, запись могли изменить в памяти — берём более свежую
+            data = self._dirty.get(user_id, data)
+            if data is None:
+                return False
+
+        data = dict(data)
+        data["city"] = city
+        data["location"] = {**(data.get("location") or {}), "lat": lat, "lon": lon}
+        self.upsert(user_id, data)
+        return True
+
+    # ================= Загрузка и сохранение ================= #
+
+    async def load(self) -> None:
+        """
+        Загружает всех пользователей из хранилища. Повторный вызов подтягивает записи,
+        изменённые другими процессами; ещё не сохранённые локальные изменения не затираются.
+        """
+        async with self._flush_lock:
+            for user_id, data in await self.store.iter_users():
+                if user_id not in self._dirty:
+                    self._put(user_id, data)
+        logger.info(f"Реестр пользователей загружен: {len(self)} пользователей")
+
+    async def flush(self) -> None:
+        """
+        Сохраняет накопленные изменения одной пачкой.
+        """
+        async with self._flush_lock:
+            if not self._dirty:
+                return
+            batch, self._dirty = self._dirty, {}
+            try:
+                await self.store.upsert_many(batch)
+            except Exception as e:
+                logger.error(f"Не удалось сохранить пользователей ({len(batch)} шт.): {e}")
+                # Возвращаем записи в очередь, не затирая более свежие изменения
+                for user_id, data in batch.items():
+                    self._dirty.setdefault(user_id, data)
+
+    async def _flush_loop(self) -> None:
+        while True:
+            await asyncio.sleep(FLUSH_INTERVAL)
+            await self.flush()
+
+    async def _reload_loop(self, interval: float) -> None:
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.load()
+            except Exception as e:
+                logger.error(f"Не удалось перечитать реестр пользователей: {e}")
+
+    async def start(self, reload_interval: Optional[float] = None) -> None:
+        """
+        :param reload_interval: Если задан — периодически перечитывать хранилище
+            (нужно, когда пользователей регистрируют другие процессы).
+        """
+        await self.load()
+        self._flush_task = asyncio.create_task(self._flush_loop())
+        if reload_interval:
+            self._reload_task = asyncio.create_task(self._reload_loop(reload_interval))
+
+    async def stop(self) -> None:
+        if self._reload_task is not None:
+            self._reload_task.cancel()
+            self._reload_task = None
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            try:
+                await self._flush_task
+            except asyncio.CancelledError:
+                pass
+            self._flush_task = None
+        await self.flush()
+
+
+# Общий реестр для всего бота
+user_registry = UserRegistry(user_store)
@@ -0,0 +1,306 @@
+"""
+Хранилище зарегистрированных пользователей.
+
+Раньше handlers/start.py на каждый /start читал весь data/users.json, а на каждую
+регистрацию перезаписывал его целиком. Здесь собраны бэкенды с точечным чтением
+по id пользователя и записью одной записи. Вся работа с диском выполняется
+в отдельном потоке, чтобы не блокировать event loop.
+"""
+
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+from typing import Optional, Dict, Any, Iterable, Iterator, Tuple
+
+from utils.logger import logger
+
+
+JSON_FILE_PATH = "data/users.json"
+SQLITE_FILE_PATH = "data/users.sqlite3"
+
+# Какой бэкенд использовать: "sqlite" (по умолчанию) или "json" (старый формат)
+USER_STORE_BACKEND = os.getenv("USER_STORE_BACKEND", "sqlite")
+
+# Отметка в таблице meta: пользователи из data/users.json перенесены в SQLite
+JSON_MIGRATION_MARKER = "migrated_from_json"
+
+
+# ================= Старый формат: один JSON-файл ================= #
+
+def load_users(path: str = JSON_FILE_PATH) -> Dict[str, Dict[str, Any]]:
+    """
+    Загружает всех пользователей из JSON-файла.
+
+    :param path: Путь к файлу.
+    :return: Словарь {user_id (str): данные пользователя}.
+    """
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_users(users: Dict[str, Dict[str, Any]], path: str = JSON_FILE_PATH) -> None:
+    """
+    Сохраняет всех пользователей в JSON-файл.
+    Пишем во временный файл и атомарно подменяем, чтобы не оставить битый файл при падении.
+
+    :param users: Словарь {user_id (str): данные пользователя}.
+    :param path: Путь к файлу.
+    """
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(users, f, ensure_ascii=False, indent=4)
+    os.replace(tmp_path, path)
+
+
+class UserStore:
+    """
+    Базовый интерфейс хранилища пользователей.
+    Все методы асинхронные; реализации сами решают, как не блокировать event loop.
+    """
+
+    async def open(self) -> None:
+        pass
+
+    async def close(self) -> None:
+        pass
+
+    async def get_user(self, user_id: int) -> Optional[Dict[str, Any]]:
+        raise NotImplementedError
+
+    async def user_exists(self, user_id: int) -> bool:
+        return await self.get_user(user_id) is not None
+
+    async def upsert_user(self, user_id: int, data: Dict[str, Any]) -> None:
+        raise NotImplementedError
+
+    async def upsert_many(self, users: Dict[int, Dict[str, Any]]) -> None:
+        for user_id, data in users.items():
+            await self.upsert_user(user_id, data)
+
+    async def iter_users(self) -> Iterator[Tuple[int, Dict[str, Any]]]:
+        """
+        Возвращает итератор по всем пользователям (используется при старте бота).
+        """
+        raise NotImplementedError
+
+
+class JsonUserStore(UserStore):
+    """
+    Бэкенд поверх старого data/users.json.
+    Оставлен для совместимости: запись по-прежнему O(всех пользователей),
+    но теперь идёт вне event loop и под замком, так что параллельные
+    регистрации не затирают друг друга.
+    """
+
+    def __init__(self, path: str = JSON_FILE_PATH):
+        self.path = path
+        self._lock = asyncio.Lock()
+
+    async def get_user(self, user_id: int) -> Optional[Dict[str, Any]]:
+        users = await asyncio.to_thread(load_users, self.path)
+        return users.get(str(user_id))
+
+    async def upsert_many(self, users: Dict[int, Dict[str, Any]]) -> None:
+        async with self._lock:
+            current = await asyncio.to_thread(load_users, self.path)
+            for user_id, data in users.items():
+                current[str(user_id)] = data
+            await asyncio.to_thread(save_users, current, self.path)
+
+    async def upsert_user(self, user_id: int, data: Dict[str, Any]) -> None:
+        await self.upsert_many({user_id: data})
+
+    async def iter_users(self) -> Iterator[Tuple[int, Dict[str, Any]]]:
+        users = await asyncio.to_thread(load_users, self.path)
+        return ((int(user_id), data) for user_id, data in users.items())
+
+
+class SQLiteUserStore(UserStore):
+    """
+    Бэкенд на SQLite в режиме WAL.
+    Одна строка на пользователя: первичный ключ — Telegram id, данные — JSON.
+    Запросы выполняются в отдельном потоке через asyncio.to_thread.
+    """
+
+    def __init__(self, path: str = SQLITE_FILE_PATH):
+        self.path = path
+        self._conn: Optional[sqlite3.Connection] = None
+        # sqlite3.Connection нельзя использовать из нескольких потоков одновременно
+        self._conn_lock = threading.Lock()
+        # Первые запросы приходят одновременно — соединение открывает только один из них
+        self._open_lock = asyncio.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA busy_timeout=5000")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS users ("
+            "id INTEGER PRIMARY KEY, "
+            "data TEXT NOT NULL)"
+        )
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS meta ("
+            "key TEXT PRIMARY KEY, "
+            "value TEXT NOT NULL)"
+        )
+        return conn
+
+    async def open(self) -> None:
+        if self._conn is not None:
+            return
+        async with self._open_lock:
+            if self._conn is None:
+                self._conn = await asyncio.to_thread(self._connect)
+
+    async def close(self) -> None:
+        if self._conn is not None:
+            conn, self._conn = self._conn, None
+            await asyncio.to_thread(conn.close)
+
+    def _execute(self, sql: str, params: Iterable = ()) -> list:
+        with self._conn_lock:
+            return self._conn.execute(sql, tuple(params)).fetchall()
+
+    def _upsert_rows(self, rows: list) -> None:
+        with self._conn_lock:
+            # Одна транзакция на пачку — записи либо сохраняются все, либо ни одна
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.executemany(
+                    "INSERT INTO users (id, data) VALUES (?, ?) "
+                    "ON CONFLICT(id) DO UPDATE SET data = excluded.data",
+                    rows
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def _import_rows(self, rows: list, marker: str, source: str) -> bool:
+        with self._conn_lock:
+            # Записи и отметка о переносе — одна транзакция: прерванный перенос не оставит ни того, ни другого
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                # Другой процесс мог перенести пользователей, пока мы ждали блокировку
+                if self._conn.execute("SELECT 1 FROM meta WHERE key = ?", (marker,)).fetchone():
+                    self._conn.execute("ROLLBACK")
+                    return False
+                # Уже сохранённые в SQLite записи новее старого файла — их не трогаем
+                self._conn.executemany("INSERT INTO users (id, data) VALUES (?, ?) ON CONFLICT(id) DO NOTHING", rows)
+                self._conn.execute("INSERT INTO meta (key, value) VALUES (?, ?)", (marker, source))
+                self._conn.execute("COMMIT")
+                return True
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    async def get_meta(self, key: str) -> Optional[str]:
+        await self.open()
+        rows = await asyncio.to_thread(self._execute, "SELECT value FROM meta WHERE key = ?", (key,))
+        return rows[0][0] if rows else None
+
+    async def import_users(self, users: Dict[int, Dict[str, Any]], marker: str, source: str) -> bool:
+        """
+        Однократный перенос пользователей из другого источника с отметкой marker в таблице meta.
+
+        :return: False, если перенос с такой отметкой уже был.
+        """
+        await self.open()
+        rows = [(int(user_id), json.dumps(data, ensure_ascii=False)) for user_id, data in users.items()]
+        return await asyncio.to_thread(self._import_rows, rows, marker, source)
+
+    async def get_user(self, user_id: int) -> Optional[Dict[str, Any]]:
+        await self.open()
+        rows = await asyncio.to_thread(self._execute, "SELECT data FROM users WHERE id = ?", (user_id,))
+        return json.loads(rows[0][0]) if rows else None
+
+    async def user_exists(self, user_id: int) -> bool:
+        await self.open()
+        rows = await asyncio.to_thread(self._execute, "SELECT 1 FROM users WHERE id = ?", (user_id,))
+        return bool(rows)
+
+    async def upsert_user(self, user_id: int, data: Dict[str, Any]) -> None:
+        await self.upsert_many({user_id: data})
+
+    async def upsert_many(self, users: Dict[int, Dict[str, Any]]) -> None:
+        if not users:
+            return
+        await self.open()
+        rows = [(int(user_id), json.dumps(data, ensure_ascii=False)) for user_id, data in users.items()]
+        await asyncio.to_thread(self._upsert_rows, rows)
+
+    async def iter_users(self) -> Iterator[Tuple[int, Dict[str, Any]]]:
+        await self.open()
+        rows = await asyncio.to_thread(self._execute, "SELECT id, data FROM users ORDER BY id")
+        return ((user_id, json.loads(data)) for user_id, data in rows)
+
+
+def create_user_store(backend: str = USER_STORE_BACKEND) -> UserStore:
+    """
+    Создаёт хранилище пользователей по названию бэкенда.
+
+    :param backend: "sqlite" или "json".
+    :return: Экземпляр UserStore.
+    """
+    if backend == "sqlite":
+        return SQLiteUserStore()
+    if backend == "json":
+        return JsonUserStore()
+    raise ValueError(f"Неизвестный бэкенд хранилища пользователей: {backend}")
+
+
+async def migrate_from_json(store: UserStore, json_path: str = JSON_FILE_PATH) -> int:
+    """
+    Одноразовый перенос пользователей из старого data/users.json в новое хранилище.
+
+    В SQLite перенос идёт одной транзакцией вместе с отметкой JSON_MIGRATION_MARKER
+    в таблице meta: прерванный перенос при следующем запуске начнётся заново,
+    а завершённый не повторится. Пользователи, уже сохранённые в SQLite, не перезаписываются.
+
+    :param store: Хранилище, в которое переносим пользователей.
+    :param json_path: Путь к старому JSON-файлу.
+    :return: Количество перенесённых пользователей (0, если перенос уже был).
+    """
+    users = await asyncio.to_thread(load_users, json_path)
+    data = {int(user_id): user for user_id, user in users.items()}
+    if isinstance(store, SQLiteUserStore):
+        if not await store.import_users(data, JSON_MIGRATION_MARKER, json_path):
+            logger.info(f"Пользователи из {json_path} уже перенесены")
+            return 0
+    else:
+        await store.upsert_many(data)
+    logger.info(f"Перенесено пользователей из {json_path}: {len(users)}")
+    return len(users)
+
+
+async def needs_migration(store: UserStore, json_path: str = JSON_FILE_PATH) -> bool:
+    """
+    Нужно ли переносить пользователей из data/users.json: есть файл, а отметки о переносе нет.
+    """
+    if not isinstance(store, SQLiteUserStore) or not os.path.exists(json_path):
+        return False
+    return await store.get_meta(JSON_MIGRATION_MARKER) is None
+
+
+# Общий экземпляр хранилища для всего бота
+user_store = create_user_store()
+
+
+if __name__ == "__main__":
+    # python -m services.user_store — перенос data/users.json в SQLite
+    async def _main():
+        store = SQLiteUserStore()
+        try:
+            await migrate_from_json(store)
+        finally:
+            await store.close()
+
+    asyncio.run(_main())
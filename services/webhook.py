@@ -0,0 +1,186 @@
+"""
+Приём апдейтов Telegram через вебхук (альтернатива long polling).
+
+aiohttp-сервер принимает POST от Telegram, проверяет секретный токен
+(заголовок X-Telegram-Bot-Api-Secret-Token), кладёт апдейт в ограниченную
+очередь и сразу отвечает 200 — Telegram не ждёт, пока апдейт обработается.
+Очередь разбирают WEBHOOK_CONCURRENCY воркеров, каждый передаёт апдейт
+в Dispatcher. Если очередь переполнена, отвечаем 503 и Telegram повторит запрос позже.
+"""
+
+import asyncio
+import hmac
+import os
+import time
+from typing import Optional, List, Dict, Any, Callable, Awaitable
+
+from aiohttp import web
+from aiogram import Bot, Dispatcher
+
+from utils.fast_json import loads
+from utils.logger import logger
+from utils.metrics import metrics
+
+
+WEBHOOK_HOST = os.getenv("WEBHOOK_HOST", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8080"))
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webhook")
+# Публичный адрес, который регистрируется в Telegram (https://example.com/webhook). Пусто — не регистрировать
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", "")
+# Секретный токен вебхука, обязателен: без него апдейт может прислать кто угодно
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "")
+# Сколько апдейтов обрабатывается одновременно и сколько может ждать в очереди
+WEBHOOK_CONCURRENCY = int(os.getenv("WEBHOOK_CONCURRENCY", "100"))
+WEBHOOK_QUEUE_SIZE = int(os.getenv("WEBHOOK_QUEUE_SIZE", "10000"))
+# Сколько секунд при остановке дообрабатывать то, что уже в очереди
+WEBHOOK_DRAIN_TIMEOUT = float(os.getenv("WEBHOOK_DRAIN_TIMEOUT", "10"))
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+
+class WebhookServer:
+    """
+    HTTP-приёмник апдейтов с очередью и пулом воркеров.
+    """
+
+    def __init__(self,
+                 dispatcher: Dispatcher,
+                 bot: Bot,
+                 secret: str = WEBHOOK_SECRET,
+                 path: str = WEBHOOK_PATH,
+                 concurrency: int = WEBHOOK_CONCURRENCY,
+                 queue_size: int = WEBHOOK_QUEUE_SIZE,
+                 handler: Optional[Callable[[Dict[str, Any]], Awaitable[None]]] = None):
+        """
+        :param handler: Что делать с апдейтом. По умолчанию — передать в dispatcher
+            (супервизор подставляет сюда раздачу апдейтов воркерам).
+        """
+        if not secret:
+            raise ValueError("Режим вебхука требует WEBHOOK_SECRET: без секрета апдейты может прислать кто угодно")
+        self.dispatcher = dispatcher
+        self.handler = handler
+        self.bot = bot
+        self.secret = secret
+        self.path = path
+        self.concurrency = concurrency
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self._workers: List[asyncio.Task] = []
+        self._runner: Optional[web.AppRunner] = None
+
+        # Метрики
+        self.received = 0
+        self.rejected = 0
+        self.dropped = 0
+        self.processed = 0
+        self.failed = 0
+
+    def create_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post(self.path, self.handle)
+        return app
+
+    async def handle(self, request: web.Request) -> web.Response:
+        """
+        Приём одного апдейта: проверка токена, разбор, постановка в очередь.
+        """
+        # Сравниваем байты: compare_digest на строках с не-ASCII символами бросает TypeError.
+        # aiohttp декодирует заголовки с surrogateescape — кодируем обратно так же
+        header = request.headers.get(SECRET_HEADER, "").encode("utf-8", "surrogateescape")
+        if not hmac.compare_digest(header, self.secret.encode("utf-8")):
+            self.rejected += 1
+            return web.Response(status=401)
+
+        try:
+            update = loads(await request.read())
+        except ValueError:
+            self.rejected += 1
+            return web.Response(status=400)
+        # Апдейт Telegram — всегда JSON-объект; числа, строки и массивы в очередь не пускаем
+        if not isinstance(update, dict):
+            self.rejected += 1
+            return web.Response(status=400)
+
+        try:
+            self.queue.put_nowait(update)
+        except asyncio.QueueFull:
+            # Telegram повторит доставку — лучше так, чем копить апдейты без ограничений
+            self.dropped += 1
+            return web.Response(status=503)
+
+        self.received += 1
+        return web.Response()
+
+    async def _worker(self) -> None:
+        while True:
+            update = await self.queue.get()
+            update_id = update.get("update_id")
+            try:
+                if self.handler is not None:
+                    await self.handler(update)
+                else:
+                    await self.dispatcher.feed_raw_update(self.bot, update)
+                self.processed += 1
+            except Exception as e:
+                self.failed += 1
+                logger.error(f"Ошибка обработки апдейта {update_id}: {e}")
+            finally:
+                self.queue.task_done()
+
+    async def start(self, host: str = WEBHOOK_HOST, port: int = WEBHOOK_PORT, url: str = WEBHOOK_URL) -> None:
+        self._workers = [asyncio.create_task(self._worker()) for _ in range(self.concurrency)]
+        metrics.gauge("bot_webhook_queue_depth", "Апдейтов в очереди вебхука", self.queue.qsize)
+        self._runner = web.AppRunner(self.create_app(), access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, host, port).start()
+        logger.info(f"Вебхук слушает {host}:{port}{self.path}")
+
+        if url:
+            await self.bot.set_webhook(
+                url,
+                secret_token=self.secret,
+                allowed_updates=self.dispatcher.resolve_used_update_types(),
+                max_connections=min(100, max(1, self.concurrency))
+            )
+
+    async def stop(self, drain_timeout: float = WEBHOOK_DRAIN_TIMEOUT) -> None:
+        # Сначала перестаём принимать, потом дообрабатываем очередь
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+        try:
+            await asyncio.wait_for(self.queue.join(), drain_timeout)
+        except asyncio.TimeoutError:
+            logger.error(f"Вебхук: при остановке не обработано апдейтов: {self.queue.qsize()}")
+        for task in self._workers:
+            task.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    def stats(self) -> dict:
+        return {
+            "queue_depth": self.queue.qsize(),
+            "received": self.received,
+            "rejected": self.rejected,
+            "dropped": self.dropped,
+            "processed": self.processed,
+            "failed": self.failed,
+        }
+
+
+async def run_webhook(dispatcher: Dispatcher, bot: Bot, **workflow_data: Any) -> None:
+    """
+    Запуск бота в режиме вебхука — аналог dispatcher.start_polling(bot).
+    Хуки startup/shutdown Dispatcher вызываются так же, как при polling.
+    """
+    server = WebhookServer(dispatcher, bot)
+    await dispatcher.emit_startup(bot=bot, dispatcher=dispatcher, **workflow_data)
+    started = time.monotonic()
+    try:
+        await server.start()
+        # Работаем до отмены (Ctrl+C или сигнал остановки)
+        await asyncio.Event().wait()
+    finally:
+        await server.stop()
+        logger.info(f"Вебхук остановлен через {time.monotonic() - started:.0f} с, {server.stats()}")
+        await dispatcher.emit_shutdown(bot=bot, dispatcher=dispatcher, **workflow_data)
+        await bot.session.close()
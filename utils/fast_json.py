@@ -0,0 +1,27 @@
+"""
+Быстрый разбор JSON: orjson или ujson, если установлены, иначе стандартный json.
+"""
+
+import json
+from typing import Any, Union
+
+try:
+    import orjson
+
+    def loads(data: Union[bytes, str]) -> Any:
+        return orjson.loads(data)
+
+    BACKEND = "orjson"
+except ImportError:
+    try:
+        import ujson
+
+        def loads(data: Union[bytes, str]) -> Any:
+            return ujson.loads(data)
+
+        BACKEND = "ujson"
+    except ImportError:
+        def loads(data: Union[bytes, str]) -> Any:
+            return json.loads(data)
+
+        BACKEND = "json"
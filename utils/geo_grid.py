@@ -0,0 +1,32 @@
+"""
+Квантование координат в ячейки сетки.
+
+Пользователи в одном городе присылают чуть разные координаты. Чтобы они делили
+один кэш и один запрос к API, координаты округляются до ячейки сетки.
+"""
+
+import math
+import os
+from typing import Tuple
+
+
+# Размер ячейки в градусах (0.1° ≈ 11 км по широте)
+GRID_CELL_DEG = float(os.getenv("WEATHER_GRID_DEG", "0.1"))
+
+
+def cell_key(lat: float, lon: float, cell_deg: float = GRID_CELL_DEG) -> Tuple[int, int]:
+    """
+    Номер ячейки сетки для координат.
+
+    :return: Кортеж (номер по широте, номер по долготе).
+    """
+    return math.floor(lat / cell_deg), math.floor(lon / cell_deg)
+
+
+def cell_center(cell: Tuple[int, int], cell_deg: float = GRID_CELL_DEG) -> Tuple[float, float]:
+    """
+    Координаты центра ячейки (округлены, чтобы не тащить хвосты float в запросы).
+    """
+    lat = (cell[0] + 0.5) * cell_deg
+    lon = (cell[1] + 0.5) * cell_deg
+    return round(lat, 4), round(lon, 4)
@@ -1,18 +1,142 @@
+"""
+Логирование бота.
+
+Обработчики в коде только кладут запись в очередь (QueueHandler), а запись
+в файл и консоль делает отдельный поток (QueueListener), поэтому event loop
+не ждёт диска. Файл ротируется по размеру или по времени.
+
+К каждой записи добавляются id апдейта, id пользователя и имя обработчика
+из контекста (их выставляет middlewares.log_context). В формате JSON
+(LOG_FORMAT=json) они попадают в отдельные поля. DEBUG-записи можно
+прореживать (LOG_DEBUG_SAMPLE=0.01 — оставлять 1%).
+"""
+
+import atexit
+import json
 import logging
+import logging.handlers
+import multiprocessing
 import os
+import queue
+import random
+from contextvars import ContextVar
+from typing import Optional
+
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+LOG_FILE = os.getenv("LOG_FILE", "logs/bot.log")
+# "text" (по умолчанию) или "json" — по записи JSON на строку
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text")
+# Ротация: "size" — по размеру файла, "time" — по времени (LOG_ROTATE_WHEN, например "midnight")
+LOG_ROTATE = os.getenv("LOG_ROTATE", "size")
+LOG_MAX_BYTES = int(os.getenv("LOG_MAX_BYTES", str(10 * 1024 * 1024)))
+LOG_ROTATE_WHEN = os.getenv("LOG_ROTATE_WHEN", "midnight")
+LOG_BACKUP_COUNT = int(os.getenv("LOG_BACKUP_COUNT", "7"))
+# Доля DEBUG-записей, которые попадают в лог (1 — все)
+LOG_DEBUG_SAMPLE = float(os.getenv("LOG_DEBUG_SAMPLE", "1"))
+
+TEXT_FORMAT = "%(asctime)s | %(levelname)s | %(name)s | %(message)s"
+
+# Контекст текущего апдейта
+update_id_var: ContextVar[Optional[int]] = ContextVar("update_id", default=None)
+user_id_var: ContextVar[Optional[int]] = ContextVar("user_id", default=None)
+handler_var: ContextVar[Optional[str]] = ContextVar("handler", default=None)
+
+
+class ContextFilter(logging.Filter):
+    """
+    Добавляет к записи update_id, user_id и handler из контекста.
+    Стоит на QueueHandler, то есть выполняется в том же потоке и задаче, что и вызов логгера.
+    """
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.update_id = update_id_var.get()
+        record.user_id = user_id_var.get()
+        record.handler = handler_var.get()
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Пропускает только долю rate DEBUG-записей; записи уровня INFO и выше — всегда.
+    """
+
+    def __init__(self, rate: float):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        return record.levelno > logging.DEBUG or self.rate >= 1 or random.random() < self.rate
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    Одна запись — один JSON-объект в строке.
+    """
+
+    def format(self, record: logging.LogRecord) -> str:
+        payload = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for field in ("update_id", "user_id", "handler"):
+            value = getattr(record, field, None)
+            if value is not None:
+                payload[field] = value
+        if record.exc_info:
+            payload["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(payload, ensure_ascii=False)
+
+
+def _file_handler() -> logging.Handler:
+    path = LOG_FILE
+    process_name = multiprocessing.current_process().name
+    if process_name != "MainProcess":
+        # У каждого воркера (services.supervisor) свой файл: ротация одного файла из нескольких процессов ломается
+        root, ext = os.path.splitext(path)
+        path = f"{root}.{process_name}{ext}"
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    if LOG_ROTATE == "time":
+        return logging.handlers.TimedRotatingFileHandler(path, when=LOG_ROTATE_WHEN,
+                                                         backupCount=LOG_BACKUP_COUNT, encoding="utf-8")
+    return logging.handlers.RotatingFileHandler(path, maxBytes=LOG_MAX_BYTES,
+                                                backupCount=LOG_BACKUP_COUNT, encoding="utf-8")
+
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+def setup_logging() -> None:
+    """
+    Настраивает корневой логгер: очередь + фоновый поток записи. Повторный вызов ничего не делает.
+    """
+    global _listener
+    if _listener is not None:
+        return
+
+    formatter = JsonFormatter() if LOG_FORMAT == "json" else logging.Formatter(TEXT_FORMAT)
+    handlers = [_file_handler(), logging.StreamHandler()]  # в файл и в консоль
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    queue_handler = logging.handlers.QueueHandler(log_queue)
+    queue_handler.addFilter(SamplingFilter(LOG_DEBUG_SAMPLE))
+    queue_handler.addFilter(ContextFilter())
+
+    root = logging.getLogger()
+    root.handlers = [queue_handler]
+    root.setLevel(LOG_LEVEL)
+
+    _listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    # Дописываем очередь до конца при выходе из процесса
+    atexit.register(_listener.stop)
+
 
-# Убедимся, что папка logs существует
-os.makedirs("logs", exist_ok=True)
-
-# Настройка логирования
-logging.basicConfig(
-    level=logging.INFO,  # Минимальный уровень сообщений (INFO и выше)
-    format="%(asctime)s | %(levelname)s | %(name)s | %(message)s",
-    handlers=[
-        logging.FileHandler("logs/bot.log", encoding="utf-8"),  # в файл
-        logging.StreamHandler()  # в консоль
-    ]
-)
+setup_logging()
 
 # Экспорт логгера
 logger = logging.getLogger("bot")
@@ -0,0 +1,172 @@
+"""
+Метрики в памяти процесса: гистограммы задержек и датчики (gauges).
+
+Запись в гистограмму — поиск корзины (bisect) и три сложения, без блокировок
+и аллокаций, поэтому её можно вызывать на каждом апдейте и каждом запросе.
+Отдаются метрики в текстовом формате Prometheus (render_prometheus) и в виде
+словаря для команды /stats (snapshot).
+"""
+
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable, List, Sequence, Tuple, Union
+
+
+# Границы корзин (секунды): от 5 мс до 10 с
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+GaugeValue = Union[float, Dict[Tuple[str, ...], float]]
+
+
+class Histogram:
+    """
+    Одна гистограмма: количество наблюдений по корзинам, сумма и общее количество.
+    """
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # последняя — больше всех границ (+Inf)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q: float) -> float:
+        """
+        Оценка квантиля сверху: граница корзины, в которую он попадает.
+        """
+        if not self.count:
+            return 0.0
+        target = q * self.count
+        cumulative = 0
+        for i, count in enumerate(self.counts):
+            cumulative += count
+            if cumulative >= target:
+                return self.buckets[i] if i < len(self.buckets) else float("inf")
+        return float("inf")
+
+
+class HistogramFamily:
+    """
+    Гистограммы одной метрики с разными значениями меток.
+    """
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str], buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self.children: Dict[Tuple[str, ...], Histogram] = {}
+
+    def labels(self, *values: str) -> Histogram:
+        child = self.children.get(values)
+        if child is None:
+            child = self.children[values] = Histogram(self.buckets)
+        return child
+
+    def observe(self, value: float, *labels: str) -> None:
+        self.labels(*labels).observe(value)
+
+
+class Metrics:
+    """
+    Реестр метрик процесса.
+    """
+
+    def __init__(self):
+        self.histograms: Dict[str, HistogramFamily] = {}
+        # Датчики считываются в момент выгрузки: {имя: (описание, метки, функция)}
+        self.gauges: Dict[str, Tuple[str, Tuple[str, ...], Callable[[], GaugeValue]]] = {}
+
+    def histogram(self, name: str, help: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> HistogramFamily:
+        family = self.histograms.get(name)
+        if family is None:
+            family = self.histograms[name] = HistogramFamily(name, help, labelnames, buckets)
+        return family
+
+    def gauge(self, name: str, help: str, func: Callable[[], GaugeValue], labelnames: Sequence[str] = ()) -> None:
+        """
+        Датчик: func возвращает число или {значения меток: число}.
+        """
+        self.gauges[name] = (help, tuple(labelnames), func)
+
+    def render_prometheus(self) -> str:
+        lines: List[str] = []
+        for family in self.histograms.values():
+            lines.append(f"# HELP {family.name} {family.help}")
+            lines.append(f"# TYPE {family.name} histogram")
+            for values, child in family.children.items():
+                labels = _labels(family.labelnames, values)
+                cumulative = 0
+                for bound, count in zip(family.buckets, child.counts):
+                    cumulative += count
+                    lines.append(f"{family.name}_bucket{_labels(family.labelnames, values, le=_number(bound))} {cumulative}")
+                lines.append(f"{family.name}_bucket{_labels(family.labelnames, values, le='+Inf')} {child.count}")
+                lines.append(f"{family.name}_sum{labels} {child.sum}")
+                lines.append(f"{family.name}_count{labels} {child.count}")
+
+        for name, (help, labelnames, func) in self.gauges.items():
+            try:
+                value = func()
+            except Exception:
+                continue
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} gauge")
+            for values, number in (value.items() if isinstance(value, dict) else [((), value)]):
+                lines.append(f"{name}{_labels(labelnames, values)} {_number(number)}")
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self, name: str) -> List[dict]:
+        """
+        Сводка по гистограмме для людей: количество, среднее, p50/p95/p99 по каждому набору меток.
+        """
+        family = self.histograms.get(name)
+        if family is None:
+            return []
+        rows = []
+        for values, child in family.children.items():
+            rows.append({
+                **dict(zip(family.labelnames, values)),
+                "count": child.count,
+                "avg": child.sum / child.count if child.count else 0.0,
+                "p50": child.quantile(0.50),
+                "p95": child.quantile(0.95),
+                "p99": child.quantile(0.99),
+            })
+        return sorted(rows, key=lambda row: row["count"], reverse=True)
+
+
+def _number(value: float) -> str:
+    value = float(value)
+    if value != value:
+        return "NaN"
+    if value in (float("inf"), float("-inf")):
+        return "+Inf" if value > 0 else "-Inf"
+    return str(int(value)) if value.is_integer() else repr(value)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Iterable[str], values: Iterable[str], **extra: str) -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    pairs += [f'{name}="{value}"' for name, value in extra.items()]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+# Метрики процесса
+metrics = Metrics()
+
+# Время обработки апдейта обработчиком (middlewares.metrics)
+handler_latency = metrics.histogram(
+    "bot_handler_duration_seconds", "Время обработки события обработчиком", ("handler", "outcome")
+)
+# Время запросов к внешним API: OpenWeather (погода, геокодер) и Telegram Bot API
+upstream_latency = metrics.histogram(
+    "bot_upstream_request_duration_seconds", "Время запроса к внешнему API", ("service", "endpoint", "outcome")
+)
@@ -0,0 +1,156 @@
+"""
+Ограничитель частоты запросов (token bucket) с очередью по приоритетам.
+
+Токены пополняются с постоянной скоростью, один запрос — один токен.
+Если токенов нет, запрос встаёт в очередь: сначала обслуживаются запросы
+с меньшим значением приоритета (интерактивные раньше фоновых), внутри
+одного приоритета — в порядке прихода.
+"""
+
+import asyncio
+import heapq
+import itertools
+import time
+from enum import IntEnum
+from typing import Optional, List, Tuple
+
+
+class Priority(IntEnum):
+    INTERACTIVE = 0  # пользователь ждёт ответ
+    BACKGROUND = 10  # предзагрузка, рассылки
+
+
+class RateLimitTimeout(Exception):
+    """
+    Токен не удалось получить до дедлайна.
+    """
+
+
+class PriorityRateLimiter:
+    """
+    Token bucket с приоритетной очередью ожидающих.
+    """
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        """
+        :param rate: Скорость пополнения (запросов в секунду).
+        :param capacity: Максимальный запас токенов (размер всплеска). По умолчанию — запросов за 1 секунду, но не меньше 1.
+        """
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+
+        self._queue: List[Tuple[int, int, asyncio.Future]] = []
+        self._seq = itertools.count()
+        self._dispatcher: Optional[asyncio.Task] = None
+
+        # Метрики
+        self.granted = 0
+        self.timeouts = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def _record_wait(self, started: float) -> None:
+        waited = time.monotonic() - started
+        self.granted += 1
+        self.wait_total += waited
+        if waited > self.wait_max:
+            self.wait_max = waited
+
+    def _queue_ahead(self, priority: int) -> int:
+        return sum(1 for p, _, fut in self._queue if p <= priority and not fut.done())
+
+    async def acquire(self, priority: int = Priority.INTERACTIVE, deadline: Optional[float] = None) -> None:
+        """
+        Получить токен на один запрос.
+
+        :param priority: Приоритет (меньше — раньше).
+        :param deadline: Момент по time.monotonic(), после которого запрос уже не нужен.
+        :raises RateLimitTimeout: Если токен не получен до дедлайна.
+        """
+        started = time.monotonic()
+        self._refill()
+
+        if not self._queue and self._tokens >= 1:
+            self._tokens -= 1
+            self._record_wait(started)
+            return
+
+        if deadline is not None:
+            # Оцениваем ожидание заранее: если до дедлайна точно не успеть — отказываем сразу
+            expected_wait = (self._queue_ahead(priority) + 1 - self._tokens) / self.rate
+            if started + expected_wait > deadline:
+                self.timeouts += 1
+                raise RateLimitTimeout("Лимит запросов исчерпан, дедлайн не успеть")
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._queue, (priority, next(self._seq), future))
+        if self._dispatcher is None or self._dispatcher.done():
+            self._dispatcher = asyncio.create_task(self._dispatch())
+
+        timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+        try:
+            await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            raise RateLimitTimeout("Не дождались очереди к API до дедлайна") from None
+        self._record_wait(started)
+
+    async def _dispatch(self) -> None:
+        """
+        Раздаёт токены ожидающим по мере пополнения.
+        """
+        while self._queue:
+            # Ожидающие, которые уже отменились или вышли по дедлайну, пропускаем
+            while self._queue and self._queue[0][2].done():
+                heapq.heappop(self._queue)
+            if not self._queue:
+                break
+
+            self._refill()
+            if self._tokens >= 1:
+                _, _, future = heapq.heappop(self._queue)
+                self._tokens -= 1
+                future.set_result(None)
+            else:
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+    def configure(self, rate: float, capacity: Optional[float] = None) -> None:
+        """
+        Сменить скорость пополнения и размер всплеска (параметры — как в конструкторе).
+        """
+        self._refill()
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self._tokens = min(self._tokens, self.capacity)
+
+    def pause(self, seconds: float) -> None:
+        """
+        Остановить выдачу токенов на seconds секунд (например, после ответа 429).
+        """
+        self._refill()
+        self._tokens = min(self._tokens, -seconds * self.rate)
+
+    def stats(self) -> dict:
+        self._refill()
+        by_priority = {}
+        for priority, _, future in self._queue:
+            if not future.done():
+                by_priority[int(priority)] = by_priority.get(int(priority), 0) + 1
+        return {
+            "budget": round(self._tokens, 2),
+            "capacity": self.capacity,
+            "rate_per_sec": self.rate,
+            "queue_depth": sum(by_priority.values()),
+            "queue_by_priority": by_priority,
+            "granted": self.granted,
+            "timeouts": self.timeouts,
+            "wait_avg": self.wait_total / self.granted if self.granted else 0.0,
+            "wait_max": self.wait_max,
+        }
@@ -0,0 +1,253 @@
+"""
+Устойчивость к сбоям внешнего API: повторы с джиттером, подстраховочные
+(hedged) запросы и автоматический выключатель (circuit breaker).
+
+Попытка запроса — корутина attempt(timeout): возвращает результат или
+бросает RetryableError, если сбой временный (5xx, таймаут, сеть) и запрос
+стоит повторить. Ошибки, которые повтор не исправит (4xx, лимит тарифа),
+попытка обрабатывает сама и возвращает None.
+"""
+
+import asyncio
+import math
+import random
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Any, Awaitable, Callable, Optional
+
+
+class RetryableError(Exception):
+    """
+    Временный сбой внешнего API: запрос можно повторить.
+    """
+
+
+class CircuitOpenError(Exception):
+    """
+    Выключатель разомкнут: API считается недоступным, запрос не отправляется.
+    """
+
+
+class CircuitBreaker:
+    """
+    Автоматический выключатель.
+
+    После failure_threshold сбоев подряд размыкается: запросы сразу получают
+    отказ, не дожидаясь таймаутов. Через reset_timeout пропускает один пробный
+    запрос; успех замыкает выключатель, сбой — размыкает ещё на reset_timeout.
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+
+        # Счётчики для мониторинга
+        self.opened = 0
+        self.rejected = 0
+
+    @property
+    def state(self) -> str:
+        """
+        "closed" — запросы идут, "open" — отказ, "half_open" — можно отправить пробный запрос.
+        """
+        if self._opened_at is None:
+            return "closed"
+        if time.monotonic() - self._opened_at < self.reset_timeout:
+            return "open"
+        return "half_open"
+
+    @property
+    def is_open(self) -> bool:
+        return self.state == "open"
+
+    def allow(self) -> bool:
+        """
+        Можно ли отправить запрос. В полуоткрытом состоянии пропускает один запрос
+        и снова отсчитывает reset_timeout до следующего пробного.
+        """
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half_open":
+            self._opened_at = time.monotonic()
+            return True
+        self.rejected += 1
+        return False
+
+    def record_success(self) -> None:
+        self._failures = 0
+        self._opened_at = None
+
+    def record_failure(self) -> None:
+        self._failures += 1
+        if self._opened_at is not None or self._failures >= self.failure_threshold:
+            if self._opened_at is None:
+                self.opened += 1
+            self._opened_at = time.monotonic()
+
+    def stats(self) -> dict:
+        return {
+            "state": self.state,
+            "failures": self._failures,
+            "opened": self.opened,
+            "rejected": self.rejected,
+        }
+
+
+def backoff_delay(attempt: int, base: float, cap: float) -> float:
+    """
+    Пауза перед повтором номер attempt (с нуля): экспоненциальная с полным джиттером,
+    чтобы повторы многих клиентов не били в API одновременно.
+    """
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+def parse_retry_after(value: Optional[str], default: float) -> float:
+    """
+    Пауза из заголовка Retry-After в секундах: число секунд или дата HTTP
+    ("Wed, 21 Oct 2026 07:28:00 GMT"). Если заголовка нет или он не разбирается — default.
+    """
+    if not value:
+        return default
+    try:
+        seconds = float(value)
+        return max(0.0, seconds) if math.isfinite(seconds) else default
+    except ValueError:
+        pass
+    try:
+        moment = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return default
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return max(0.0, (moment - datetime.now(timezone.utc)).total_seconds())
+
+
+class RetryPolicy:
+    """
+    Выполняет попытки запроса с повторами, подстраховкой и выключателем.
+
+    :param retries: Сколько раз повторить после первой неудачной попытки.
+    :param attempt_timeout: Таймаут одной попытки в секундах (передаётся в attempt).
+    :param backoff_base: Базовая пауза перед повтором.
+    :param backoff_cap: Максимальная пауза перед повтором.
+    :param hedge_after: Если попытка не ответила за столько секунд, параллельно
+        отправляется вторая, и берётся первый ответ. None или 0 — без подстраховки.
+    :param breaker: Выключатель; может быть общим для нескольких политик одного API.
+    """
+
+    def __init__(self,
+                 retries: int = 2,
+                 attempt_timeout: Optional[float] = None,
+                 backoff_base: float = 0.2,
+                 backoff_cap: float = 2.0,
+                 hedge_after: Optional[float] = None,
+                 breaker: Optional[CircuitBreaker] = None):
+        self.retries = retries
+        self.attempt_timeout = attempt_timeout
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.hedge_after = hedge_after
+        self.breaker = breaker
+
+        # Счётчики для мониторинга
+        self.calls = 0
+        self.retried = 0
+        self.hedged = 0
+        self.hedge_wins = 0
+        self.failures = 0
+
+    def _timeout(self, deadline: Optional[float]) -> Optional[float]:
+        if deadline is None:
+            return self.attempt_timeout
+        remaining = deadline - time.monotonic()
+        return remaining if self.attempt_timeout is None else min(self.attempt_timeout, remaining)
+
+    async def _hedged(self, attempt: Callable[[Optional[float]], Awaitable[Any]], deadline: Optional[float]) -> Any:
+        """
+        Первая попытка; если она не ответила за hedge_after — вторая параллельно.
+        Возвращает первый успешный ответ, проигравшую попытку отменяет.
+        """
+        first = asyncio.ensure_future(attempt(self._timeout(deadline)))
+        tasks = [first]
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=self.hedge_after)
+            if not done:
+                self.hedged += 1
+                tasks.append(asyncio.ensure_future(attempt(self._timeout(deadline))))
+
+            pending = set(tasks)
+            error: Optional[BaseException] = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is not first:
+                            self.hedge_wins += 1
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+    async def call(self,
+                   attempt: Callable[[Optional[float]], Awaitable[Any]],
+                   deadline: Optional[float] = None,
+                   hedge: bool = False) -> Any:
+        """
+        Выполняет attempt(timeout) до успеха, пока есть повторы и не наступил дедлайн.
+
+        :param attempt: Одна попытка запроса; timeout — сколько секунд она может длиться.
+        :param deadline: Момент по time.monotonic(), после которого ответ уже не нужен.
+        :param hedge: Разрешить подстраховочный запрос (стоит ещё одного запроса к API).
+        :return: Результат первой успешной попытки.
+        :raises CircuitOpenError: Выключатель разомкнут, запрос не отправлялся.
+        :raises RetryableError: Все попытки неудачны или до дедлайна не успеть.
+        """
+        self.calls += 1
+        error: Optional[RetryableError] = None
+        for attempt_number in range(self.retries + 1):
+            if self.breaker is not None and not self.breaker.allow():
+                if error is not None:
+                    break
+                raise CircuitOpenError("API временно недоступен (выключатель разомкнут)")
+            if deadline is not None and deadline <= time.monotonic():
+                break
+
+            try:
+                if hedge and self.hedge_after:
+                    result = await self._hedged(attempt, deadline)
+                else:
+                    result = await attempt(self._timeout(deadline))
+            except RetryableError as e:
+                error = e
+                self.failures += 1
+                if self.breaker is not None:
+                    self.breaker.record_failure()
+            else:
+                if self.breaker is not None:
+                    self.breaker.record_success()
+                return result
+
+            if attempt_number < self.retries:
+                delay = backoff_delay(attempt_number, self.backoff_base, self.backoff_cap)
+                if deadline is not None and time.monotonic() + delay >= deadline:
+                    break
+                self.retried += 1
+                await asyncio.sleep(delay)
+
+        raise error or RetryableError("Дедлайн запроса истёк")
+
+    def stats(self) -> dict:
+        return {
+            "calls": self.calls,
+            "retried": self.retried,
+            "hedged": self.hedged,
+            "hedge_wins": self.hedge_wins,
+            "failures": self.failures,
+        }
@@ -0,0 +1,62 @@
+"""
+Объединение одинаковых одновременных запросов (single-flight).
+
+Если несколько корутин одновременно просят одно и то же (один ключ), реально
+выполняется только первый запрос, остальные ждут его результат.
+"""
+
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+
+class SingleFlight:
+    """
+    Группа одновременных вызовов с общим результатом.
+
+    Общий запрос выполняется в отдельной задаче и защищён asyncio.shield:
+    отмена одного из ожидающих не отменяет запрос для остальных.
+    Ошибку запроса получают все, кто его ждал; следующий вызов запустит новый запрос.
+    """
+
+    def __init__(self):
+        self._inflight: Dict[Hashable, asyncio.Task] = {}
+
+        # Счётчики для мониторинга: сколько запросов реально выполнено и сколько присоединилось к уже идущим
+        self.executed = 0
+        self.coalesced = 0
+
+    def __len__(self) -> int:
+        return len(self._inflight)
+
+    def _on_done(self, key: Hashable, task: asyncio.Task) -> None:
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        # Помечаем исключение как полученное, даже если все ожидающие уже отменились
+        if not task.cancelled():
+            task.exception()
+
+    async def do(self, key: Hashable, func: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Выполняет func() один раз на ключ среди одновременных вызовов.
+
+        :param key: Ключ нормализованного запроса.
+        :param func: Функция без аргументов, возвращающая корутину.
+        :return: Результат общего запроса.
+        """
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(func())
+            self._inflight[key] = task
+            task.add_done_callback(lambda t: self._on_done(key, t))
+            self.executed += 1
+        else:
+            self.coalesced += 1
+
+        return await asyncio.shield(task)
+
+    def stats(self) -> dict:
+        return {
+            "in_flight": len(self._inflight),
+            "executed": self.executed,
+            "coalesced": self.coalesced,
+        }
@@ -0,0 +1,72 @@
+"""
+Ограничитель частоты по скользящему окну (sliding window counter).
+
+На каждый ключ хранятся только номер текущего окна и два счётчика — за
+текущее и предыдущее окно, а не отметки времени каждого события. Число
+событий за последние window секунд оценивается как
+    предыдущее * (доля предыдущего окна, ещё попадающая в скользящее) + текущее.
+Записи ключей, молчавших дольше двух окон, удаляются раз в окно.
+"""
+
+import time
+from typing import Dict, Hashable, Tuple
+
+
+class SlidingWindowLimiter:
+    """
+    Не больше limit событий на ключ за скользящее окно window секунд.
+    """
+
+    def __init__(self, limit: int, window: float):
+        self.limit = limit
+        self.window = window
+        # {ключ: (номер окна, событий в предыдущем окне, событий в текущем)}
+        self._counters: Dict[Hashable, Tuple[int, int, int]] = {}
+        self._swept = 0
+
+        # Счётчики для мониторинга
+        self.allowed = 0
+        self.rejected = 0
+
+    def __len__(self) -> int:
+        return len(self._counters)
+
+    def _sweep(self, current: int) -> None:
+        # Раз в окно: ключи без событий в текущем и предыдущем окне больше ничего не весят
+        if current > self._swept:
+            self._counters = {key: counter for key, counter in self._counters.items() if counter[0] >= current - 1}
+            self._swept = current
+
+    def hit(self, key: Hashable) -> bool:
+        """
+        Учитывает событие по ключу.
+
+        :return: True — событие укладывается в лимит, False — лимит превышен
+            (такое событие не засчитывается).
+        """
+        position = time.monotonic() / self.window
+        current = int(position)
+        self._sweep(current)
+
+        counter = self._counters.get(key)
+        if counter is None or counter[0] < current - 1:
+            previous, count = 0, 0
+        elif counter[0] == current - 1:
+            previous, count = counter[2], 0
+        else:
+            _, previous, count = counter
+
+        if previous * (1 - (position - current)) + count >= self.limit:
+            self.rejected += 1
+            return False
+
+        self._counters[key] = (current, previous, count + 1)
+        self.allowed += 1
+        return True
+
+    def stats(self) -> dict:
+        return {
+            "keys": len(self._counters),
+            "allowed": self.allowed,
+            "rejected": self.rejected,
+        }